@@ -0,0 +1,499 @@
+"""
+Micro-benchmarks of the battle engine: scenario generation throughput, run_negotiation
+throughput, battle unit throughput, run_battles scaling across process counts and the
+batched engine with the NumPy ports of the anchor solutions against the same solutions
+played lane by lane.
+
+Scenarios are generated from a fixed seed and agents are the bundled test solutions
+plus a few real ones, so two runs on the same machine play exactly the same games.
+Results are written as JSON; with --baseline the run fails when a throughput dropped
+by more than --tolerance compared to a previous result file.
+
+Usage:
+    python benchmarks/engine.py
+    python benchmarks/engine.py --scenarios 50 --processes 1 2 --output bench.json
+    python benchmarks/engine.py --baseline benchmarks/results/previous.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from operator import sub
+from pathlib import Path
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from misc.batch_engine import run_batch_negotiations, scalar_batch_agent_class
+from misc.battlefield import (
+    BattleScheduler,
+    _build_battle_units,
+    _checked_complement,
+    _model_pairs,
+    _run_battle_unit,
+    generate_negotiation_data,
+    get_offer_bounds,
+    run_negotiation,
+)
+from misc.io import get_solution_path
+from misc.reference_agents import REFERENCE_BATCH_AGENTS
+from misc.scenario_generator import (
+    QUICK_MAX_ATTEMPTS,
+    generate_scenario_arrays,
+    generate_seeded_scenario_arrays,
+)
+from misc.scenario_table import ScenarioTable
+from misc.solution_cache import get_file_hash, load_solution_class
+
+DEFAULT_SEED = 20240601
+# Allowed offer validation time, in percent of turn time. The check costs about 4% of
+# a turn with the cheap default agents, and it is measured as the difference of two
+# timings that move by a point or two between runs: 5% would fail on noise alone.
+MAX_VALIDATION_OVERHEAD = 8.0
+# Scenarios generated per run of the generation benchmark, enough to hide per-call overhead
+GENERATED_SCENARIOS = 100_000
+# Cheap agents, so that the engine's own overhead shows. Heavy ones (split
+# enumerators) can be added with --solution.
+DEFAULT_SOLUTIONS = {
+    "example": ROOT_DIR / "tests" / "solutions" / "example.py",
+    "example2": ROOT_DIR / "tests" / "solutions" / "example2.py",
+    "human": ROOT_DIR / "solutions" / "Top_Human___Robert_Speed.py",
+    "gemini_3_pro_preview": ROOT_DIR / "solutions" / "Gemini_3_Pro_Preview.py",
+    "kimi_k2_5": ROOT_DIR / "solutions" / "Kimi_K2_5.py",
+}
+DEFAULT_RESULTS_DIR = ROOT_DIR / "benchmarks" / "results"
+# The anchors with a NumPy port, by display name
+ANCHORS = ("Top Human - Robert Speed", "example")
+# Engine settings the benchmarks pin, restored afterwards
+ENGINE_ENV = ("MAX_SCENARIO_DATA", "PAIR_CACHE", "SANDBOX_AGENTS", "PROFILE_AGENTS", "NUM_PROCESSES")
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Silence the engine's per-scenario prints, they would dominate the timings."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+@contextlib.contextmanager
+def _engine_settings():
+    """Restore the engine env vars the benchmarks change."""
+    saved_env = {name: os.environ.get(name) for name in ENGINE_ENV}
+    try:
+        yield
+    finally:
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _check_played(label: str, played: int, expected: int):
+    """Fail when negotiations were skipped (e.g. an agent didn't load): the timing would be bogus."""
+    if played != expected:
+        raise RuntimeError(f"{label}: played {played} of {expected} negotiations")
+
+
+def _best_time(fn, repeat: int) -> float:
+    """Best wall time of repeat calls of fn, in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with _quiet():
+            fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def load_solutions(solutions: dict) -> dict:
+    """Agent classes by name, solutions missing from the tree are skipped."""
+    agent_classes = {}
+    for name, path in solutions.items():
+        if not Path(path).exists():
+            print(f"Skipping {name}: {path} not found")
+            continue
+        agent_classes[name] = load_solution_class(Path(path))
+    return agent_classes
+
+
+def bench_scenario_generation(seed: int, num_scenarios: int, repeat: int) -> dict:
+    """
+    Scenarios per second of the bulk generator (fresh RNG), of the seeded stream
+    tournaments are generated from and of the same stream with QUICK_MAX_ATTEMPTS.
+    """
+    results = {}
+    for label, generate in (
+        ("bulk", lambda: generate_scenario_arrays(num_scenarios, np.random.default_rng(seed))),
+        ("seeded", lambda: generate_seeded_scenario_arrays(seed, 0, num_scenarios)),
+        (
+            "quick",
+            lambda: generate_seeded_scenario_arrays(
+                seed, 0, num_scenarios, max_attempts=QUICK_MAX_ATTEMPTS
+            ),
+        ),
+    ):
+        seconds = _best_time(generate, repeat)
+        results[label] = {"seconds": seconds, "scenarios_per_second": num_scenarios / seconds}
+    results["scenarios"] = num_scenarios
+    results["scenarios_per_second"] = results["seeded"]["scenarios_per_second"]
+    return results
+
+
+def bench_run_negotiation(agent_classes: dict, scenarios: list[dict], repeat: int) -> dict:
+    """Negotiations per second of run_negotiation, agents' construction included, per ordered pair."""
+    pairs = {}
+    total_negotiations = 0
+    total_seconds = 0.0
+    for name_0, AgentClass0 in agent_classes.items():
+        for name_1, AgentClass1 in agent_classes.items():
+            if name_0 == name_1:
+                continue
+
+            def play():
+                for scenario in scenarios:
+                    agent_0 = AgentClass0(0, scenario["counts"], scenario["player_0"], scenario["rounds"])
+                    agent_1 = AgentClass1(1, scenario["counts"], scenario["player_1"], scenario["rounds"])
+                    run_negotiation(
+                        agent_0, agent_1, scenario["counts"], scenario["rounds"], name_0, name_1
+                    )
+
+            seconds = _best_time(play, repeat)
+            pairs[f"{name_0} vs {name_1}"] = {
+                "seconds": seconds,
+                "negotiations_per_second": len(scenarios) / seconds,
+            }
+            total_negotiations += len(scenarios)
+            total_seconds += seconds
+
+    return {
+        "negotiations": total_negotiations,
+        "seconds": total_seconds,
+        "negotiations_per_second": total_negotiations / total_seconds if total_seconds else 0.0,
+        "pairs": pairs,
+    }
+
+
+def bench_offer_validation(
+    agent_classes: dict, scenarios: list[dict], run_negotiation_results: dict, repeat: int
+) -> dict:
+    """
+    Cost of checking the counter-offers, on the offers the agents actually make, as a
+    share of the turn time measured by bench_run_negotiation. The engine needs the
+    complement of each offer anyway: only the time above a plain subtraction counts.
+    """
+    checks = []
+    with _quiet():
+        for name_0, AgentClass0 in agent_classes.items():
+            for name_1, AgentClass1 in agent_classes.items():
+                if name_0 == name_1:
+                    continue
+                for scenario in scenarios:
+                    counts = scenario["counts"]
+                    bounds = get_offer_bounds(counts)
+                    _, _, _, turn_history = run_negotiation(
+                        AgentClass0(0, counts, scenario["player_0"], scenario["rounds"]),
+                        AgentClass1(1, counts, scenario["player_1"], scenario["rounds"]),
+                        counts,
+                        scenario["rounds"],
+                        name_0,
+                        name_1,
+                    )
+                    for record in turn_history:
+                        for key in (f"{name_0} offer", f"{name_1} offer"):
+                            if record[key] is not None:
+                                checks.append((record[key], counts, bounds))
+
+    def validate():
+        for offer, _, bounds in checks:
+            _checked_complement(offer, bounds)
+
+    def complement():
+        for offer, counts, _ in checks:
+            list(map(sub, counts, offer))
+
+    validation_seconds = max(0.0, _best_time(validate, repeat) - _best_time(complement, repeat))
+    seconds_per_offer = validation_seconds / len(checks) if checks else 0.0
+    turn_seconds = run_negotiation_results["seconds"] / len(checks) if checks else 0.0
+    return {
+        "offers": len(checks),
+        "seconds_per_offer": seconds_per_offer,
+        "turn_seconds": turn_seconds,
+        "overhead_percent": 100 * seconds_per_offer / turn_seconds if turn_seconds else 0.0,
+    }
+
+
+def bench_battle_units(models: list[dict], scenarios: list[dict], repeat: int) -> dict:
+    """
+    Throughput of _run_battle_unit, what the scheduler's workers run: every pair, both
+    orders, the scenarios read from a shared table, samples included.
+    """
+    pairs = _model_pairs(models)
+    table = ScenarioTable.create(scenarios)
+    try:
+        units = _build_battle_units(pairs, scenarios, 5, len(scenarios), table.name)
+
+        def play():
+            for unit in units:
+                _, _, name_0, _, start, _, outcomes = _run_battle_unit(unit)
+                _check_played(f"_run_battle_unit({name_0} first)", len(outcomes), unit[4] - start)
+
+        seconds = _best_time(play, repeat)
+    finally:
+        table.close()
+        table.unlink()
+    negotiations = len(pairs) * 2 * len(scenarios)
+    return {
+        "pairs": len(pairs),
+        "seconds": seconds,
+        "pairs_per_second": len(pairs) / seconds,
+        "negotiations_per_second": negotiations / seconds,
+    }
+
+
+def bench_run_battles(
+    models: list[dict], scenarios: list[dict], process_counts: list[int], repeat: int
+) -> list[dict]:
+    """
+    End-to-end tournament wall time per process count (what run_battles does), with
+    the speedup over the first one.
+    """
+    results = []
+    negotiations = len(models) * (len(models) - 1) * len(scenarios)
+
+    def play():
+        with BattleScheduler(scenarios, num_models=len(models)) as scheduler:
+            for model in models:
+                scheduler.add_model(model)
+            scheduler.results()
+            played = len(scheduler.negotiation_results())
+        _check_played(f"run_battles with {processes} processes", played, negotiations)
+
+    for processes in process_counts:
+        os.environ["NUM_PROCESSES"] = str(processes)
+        seconds = _best_time(play, repeat)
+        results.append(
+            {
+                "processes": processes,
+                "seconds": seconds,
+                "negotiations_per_second": negotiations / seconds,
+            }
+        )
+    for result in results:
+        result["speedup"] = results[0]["seconds"] / result["seconds"]
+        result["efficiency"] = result["speedup"] * results[0]["processes"] / result["processes"]
+    return results
+
+
+def bench_reference_agents(seed: int, num_scenarios: int, repeat: int) -> dict:
+    """
+    Negotiations per second of the anchor pair in the batched engine, both orders,
+    with the NumPy ports and with the solutions wrapped by scalar_batch_agent_class.
+    """
+    arrays = generate_seeded_scenario_arrays(seed, 0, num_scenarios)
+    ported = [REFERENCE_BATCH_AGENTS[name][1] for name in ANCHORS]
+    scalar = [scalar_batch_agent_class(load_solution_class(get_solution_path(name))) for name in ANCHORS]
+    results = {}
+    for label, (BatchAgent0, BatchAgent1) in (("ported", ported), ("scalar", scalar)):
+
+        def play():
+            run_batch_negotiations(BatchAgent0, BatchAgent1, arrays)
+            run_batch_negotiations(BatchAgent1, BatchAgent0, arrays)
+
+        seconds = _best_time(play, repeat)
+        results[label] = {"seconds": seconds, "negotiations_per_second": 2 * num_scenarios / seconds}
+    results["negotiations_per_second"] = results["ported"]["negotiations_per_second"]
+    results["speedup"] = results["scalar"]["seconds"] / results["ported"]["seconds"]
+    return results
+
+
+def run_benchmarks(
+    solutions: dict = DEFAULT_SOLUTIONS,
+    num_scenarios: int = 200,
+    seed: int = DEFAULT_SEED,
+    process_counts: list[int] | None = None,
+    repeat: int = 3,
+    generated_scenarios: int = GENERATED_SCENARIOS,
+) -> dict:
+    """Run every benchmark and return the machine-readable results."""
+    # The scheduler never uses more processes than CPUs
+    cpu_count = multiprocessing.cpu_count()
+    if process_counts is None:
+        process_counts = [2**k for k in range(cpu_count.bit_length()) if 2**k <= cpu_count]
+        process_counts.append(cpu_count)
+    process_counts = sorted({max(1, min(processes, cpu_count)) for processes in process_counts})
+
+    with _engine_settings():
+        # Deterministic and comparable: fixed scenarios, no cache, agents in process
+        os.environ["MAX_SCENARIO_DATA"] = str(num_scenarios)
+        os.environ["PAIR_CACHE"] = "false"
+        os.environ["SANDBOX_AGENTS"] = "false"
+        os.environ["PROFILE_AGENTS"] = "false"
+        scenarios, _ = generate_negotiation_data(seed)
+
+        agent_classes = load_solutions(solutions)
+        # Workers load the agents from the paths in the units, whatever the start method
+        models = [
+            {"display_name": name, "solution_path": str(solutions[name])} for name in agent_classes
+        ]
+
+        generation_results = bench_scenario_generation(seed, generated_scenarios, repeat)
+        print(
+            f"scenario generation: {generation_results['bulk']['scenarios_per_second']:.0f} scenarios/s in bulk, {generation_results['seeded']['scenarios_per_second']:.0f} seeded"
+        )
+        print(f"Benchmarking {len(agent_classes)} solutions on {len(scenarios)} scenarios...")
+        run_negotiation_results = bench_run_negotiation(agent_classes, scenarios, repeat)
+        print(f"run_negotiation: {run_negotiation_results['negotiations_per_second']:.0f} negotiations/s")
+        validation_results = bench_offer_validation(
+            agent_classes, scenarios, run_negotiation_results, repeat
+        )
+        print(
+            f"offer validation: {validation_results['seconds_per_offer'] * 1e9:.0f} ns/offer, {validation_results['overhead_percent']:.2f}% of turn time"
+        )
+        battle_unit_results = bench_battle_units(models, scenarios, repeat)
+        print(f"_run_battle_unit: {battle_unit_results['negotiations_per_second']:.0f} negotiations/s")
+        run_battles_results = bench_run_battles(models, scenarios, process_counts, repeat)
+        for result in run_battles_results:
+            print(
+                f"run_battles with {result['processes']} processes: {result['seconds']:.2f}s, speedup {result['speedup']:.2f}x"
+            )
+        reference_results = bench_reference_agents(seed, num_scenarios, repeat)
+        print(
+            f"reference agents: {reference_results['negotiations_per_second']:.0f} negotiations/s, speedup {reference_results['speedup']:.2f}x over the scalar agents"
+        )
+
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "machine": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": multiprocessing.cpu_count(),
+            },
+            "config": {
+                "seed": seed,
+                "scenarios": len(scenarios),
+                "repeat": repeat,
+                # Solutions get regenerated: only compare runs with the same hashes
+                "solutions": {name: get_file_hash(Path(solutions[name])) for name in agent_classes},
+            },
+            "scenario_generation": generation_results,
+            "run_negotiation": run_negotiation_results,
+            "offer_validation": validation_results,
+            "battle_units": battle_unit_results,
+            "run_battles": run_battles_results,
+            "reference_agents": reference_results,
+        }
+
+
+def find_regressions(
+    results: dict, baseline: dict, tolerance: float, max_validation_overhead: float = MAX_VALIDATION_OVERHEAD
+) -> list[str]:
+    """
+    Throughputs that dropped by more than tolerance (a fraction) against baseline, and
+    offer validation if it takes more than max_validation_overhead percent of a turn.
+    """
+    compared = [
+        ("scenario_generation", "scenarios", results.get("scenario_generation"), baseline.get("scenario_generation")),
+        ("run_negotiation", "negotiations", results["run_negotiation"], baseline.get("run_negotiation")),
+        ("battle_units", "negotiations", results["battle_units"], baseline.get("battle_units")),
+        ("reference_agents", "negotiations", results.get("reference_agents"), baseline.get("reference_agents")),
+    ]
+    baseline_battles = {b["processes"]: b for b in baseline.get("run_battles", [])}
+    compared += [
+        (f"run_battles[{r['processes']}]", "negotiations", r, baseline_battles.get(r["processes"]))
+        for r in results["run_battles"]
+    ]
+
+    regressions = []
+    overhead = results.get("offer_validation", {}).get("overhead_percent", 0.0)
+    if overhead > max_validation_overhead:
+        regressions.append(f"offer_validation: {overhead:.2f}% of turn time")
+    for name, unit, current, previous in compared:
+        if not current or not previous:
+            continue
+        before = previous[f"{unit}_per_second"]
+        after = current[f"{unit}_per_second"]
+        if after < before * (1 - tolerance):
+            regressions.append(f"{name}: {before:.0f} -> {after:.0f} {unit}/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the battle engine.")
+    parser.add_argument("--scenarios", type=int, default=200, help="Number of scenarios (default 200)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Scenario seed")
+    parser.add_argument(
+        "--generated-scenarios",
+        type=int,
+        default=GENERATED_SCENARIOS,
+        help=f"Scenarios per run of the generation benchmark (default {GENERATED_SCENARIOS})",
+    )
+    parser.add_argument(
+        "--processes", type=int, nargs="+", help="Process counts for run_battles (default powers of 2 and all CPUs)"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark, the best one is kept")
+    parser.add_argument(
+        "--solution", type=Path, action="append", default=[], help="Extra solution file to include (repeatable)"
+    )
+    parser.add_argument("--output", type=Path, help="Result file (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", type=Path, help="Previous result file to compare against")
+    parser.add_argument(
+        "--max-validation-overhead",
+        type=float,
+        default=MAX_VALIDATION_OVERHEAD,
+        help=f"Allowed offer validation time, in percent of turn time (default {MAX_VALIDATION_OVERHEAD:g})",
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="Allowed throughput drop against the baseline (default 0.2)"
+    )
+    args = parser.parse_args()
+
+    solutions = dict(DEFAULT_SOLUTIONS)
+    for path in args.solution:
+        solutions[path.stem] = path
+
+    results = run_benchmarks(
+        solutions=solutions,
+        num_scenarios=args.scenarios,
+        seed=args.seed,
+        process_counts=args.processes,
+        repeat=args.repeat,
+        generated_scenarios=args.generated_scenarios,
+    )
+
+    output = args.output
+    if output is None:
+        output = DEFAULT_RESULTS_DIR / f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["config"] != results["config"]:
+            print("Warning: the baseline was run with another configuration or other solutions")
+        regressions = find_regressions(
+            results, baseline, args.tolerance, args.max_validation_overhead
+        )
+        if regressions:
+            print("Regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regression against the baseline")
+
+
+if __name__ == "__main__":
+    main()
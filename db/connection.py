@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2 import pool
+
+load_dotenv()
+
+DATABASE_URL = os.environ.get("DATABASE_URL")
+
+# Process-wide pool, recreated after a fork: connections can't be shared with a child
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# Last time each pooled connection was used, by id(connection)
+_last_used = {}
+
+
+def get_pool_size() -> tuple[int, int]:
+    """
+    Minimum and maximum number of pooled connections, can be set via
+    DB_POOL_MIN_SIZE (default 1) and DB_POOL_MAX_SIZE (default 5) env vars.
+    """
+    try:
+        min_size = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+    except ValueError:
+        min_size = 1
+    try:
+        max_size = int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+    except ValueError:
+        max_size = 5
+    min_size = max(0, min_size)
+    return min_size, max(1, min_size, max_size)
+
+
+def get_health_check_seconds() -> float:
+    """
+    Connections idle for longer than this are checked with a round trip before
+    being handed out, can be set via DB_HEALTH_CHECK_SECONDS env var (default 30).
+    """
+    try:
+        return float(os.getenv("DB_HEALTH_CHECK_SECONDS", "30"))
+    except ValueError:
+        return 30.0
+
+
+def get_pool() -> pool.ThreadedConnectionPool:
+    """The process-wide connection pool, created on first use."""
+    global _pool, _pool_pid
+
+    if not DATABASE_URL:
+        raise ValueError("DATABASE_URL environment variable must be set")
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            min_size, max_size = get_pool_size()
+            _pool = pool.ThreadedConnectionPool(min_size, max_size, DATABASE_URL)
+            _pool_pid = os.getpid()
+            _last_used.clear()
+        return _pool
+
+
+def _is_healthy(conn) -> bool:
+    """Whether a pooled connection can still be used."""
+    if conn.closed:
+        return False
+    last_used = _last_used.get(id(conn))
+    if last_used is not None and time.monotonic() - last_used < get_health_check_seconds():
+        return True
+    # Idle for a while (the pooler may have dropped it), check with a round trip
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _get_connection(connection_pool: pool.ThreadedConnectionPool):
+    """Take a healthy connection from the pool, replacing broken ones."""
+    # Every pooled connection may be broken (e.g. after a database restart),
+    # after max size of them the pool hands out new connections
+    for _ in range(get_pool_size()[1] + 1):
+        conn = connection_pool.getconn()
+        if _is_healthy(conn):
+            return conn
+        _last_used.pop(id(conn), None)
+        connection_pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError("No healthy database connection available")
+
+
+def get_connection():
+    """
+    Take a healthy connection from the pool. Give it back with put_connection(),
+    prefer db_session() unless the connection itself is needed.
+    """
+    return _get_connection(get_pool())
+
+
+def put_connection(conn):
+    """Give a connection back to the pool (closed if it broke)."""
+    if conn.closed:
+        _last_used.pop(id(conn), None)
+    else:
+        _last_used[id(conn)] = time.monotonic()
+    get_pool().putconn(conn, close=bool(conn.closed))
+
+
+@contextmanager
+def db_session():
+    """
+    A cursor on a pooled connection, as a single transaction: committed when the
+    block succeeds, rolled back when it raises. The connection goes back to the
+    pool either way.
+
+    Usage:
+        with db_session() as cursor:
+            cursor.execute(...)
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            yield cursor
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        put_connection(conn)
+
+
+def close_pool():
+    """Close every pooled connection of this process."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+        _last_used.clear()
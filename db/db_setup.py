@@ -1,12 +1,5 @@
-import os
-import psycopg2
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Environment variables (should be set in caps)
-DATABASE_URL = os.environ.get("DATABASE_URL")
+from db.connection import get_connection, put_connection
+from misc.git import get_branch_name
 
 
 def setup_database():
@@ -14,10 +7,7 @@ def setup_database():
     Set up the Supabase database with the required table, view, and policies.
     Only creates them if they don't already exist.
     """
-    if not DATABASE_URL:
-        raise ValueError("DATABASE_URL environment variable must be set")
-
-    conn = psycopg2.connect(DATABASE_URL)
+    conn = get_connection()
     conn.autocommit = True
     cursor = conn.cursor()
 
@@ -44,6 +34,94 @@ def setup_database():
         )
         print("Index on timestamp created or already exists.")
 
+        # Seed and number of scenarios of the session, enough to replay its tournament
+        cursor.execute(
+            """
+            ALTER TABLE negotiations
+                ADD COLUMN IF NOT EXISTS seed BIGINT,
+                ADD COLUMN IF NOT EXISTS scenario_count INTEGER;
+            """
+        )
+        print("Columns 'seed' and 'scenario_count' created or already exist.")
+
+        # Tournament sessions: what negotiations and samples rows belong to
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                id BIGSERIAL PRIMARY KEY,
+                seed BIGINT,
+                commit_hash TEXT,
+                started_at TIMESTAMPTZ NOT NULL,
+                finished_at TIMESTAMPTZ,
+                scenario_count INTEGER,
+                config JSONB
+            );
+            """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sessions_commit_hash ON sessions(commit_hash);"
+        )
+        print("Table 'sessions' created or already exists.")
+
+        cursor.execute(
+            """
+            ALTER TABLE negotiations
+                ADD COLUMN IF NOT EXISTS session_id BIGINT REFERENCES sessions(id);
+            """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_negotiations_session_id ON negotiations(session_id);"
+        )
+        print("Column 'session_id' on negotiations created or already exists.")
+
+        # Sessions used to be identified by timestamp only: give every past session a
+        # row, with the commit hash taken back from the code links
+        cursor.execute(
+            """
+            WITH new_sessions AS (
+                INSERT INTO sessions (seed, commit_hash, started_at, finished_at, scenario_count)
+                SELECT
+                    MAX(seed),
+                    substring(MAX(code_link) from '/blob/([0-9a-f]+)/'),
+                    timestamp,
+                    timestamp,
+                    MAX(scenario_count)
+                FROM negotiations
+                WHERE session_id IS NULL AND timestamp IS NOT NULL
+                GROUP BY timestamp
+                RETURNING id, started_at
+            )
+            UPDATE negotiations
+            SET session_id = new_sessions.id
+            FROM new_sessions
+            WHERE negotiations.session_id IS NULL
+                AND negotiations.timestamp = new_sessions.started_at;
+            """
+        )
+        print("Past sessions backfilled.")
+
+        # Enable RLS on sessions
+        cursor.execute("ALTER TABLE sessions ENABLE ROW LEVEL SECURITY;")
+        cursor.execute(
+            """
+            DO $$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT 1 FROM pg_policies
+                    WHERE tablename = 'sessions'
+                    AND policyname = 'public_read_only'
+                ) THEN
+                    CREATE POLICY public_read_only ON sessions
+                        FOR SELECT
+                        TO anon, authenticated
+                        USING (true);
+                END IF;
+            END $$;
+            """
+        )
+        cursor.execute("GRANT SELECT ON sessions TO anon, authenticated;")
+        print("Public read access granted to sessions table.")
+
         # Enable RLS
         cursor.execute("ALTER TABLE negotiations ENABLE ROW LEVEL SECURITY;")
         print("RLS enabled.")
@@ -72,19 +150,135 @@ def setup_database():
         cursor.execute("GRANT SELECT ON negotiations TO anon, authenticated;")
         print("Public read access granted to table.")
 
+        # Leaderboard tables, maintained by save_battle_results in the same transaction
+        # as the negotiations rows: running sums per model and a snapshot of the
+        # latest session, so the leaderboards never re-aggregate the history
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS negotiations_totals (
+                model_name TEXT PRIMARY KEY,
+                max_possible_profit NUMERIC NOT NULL,
+                total_profit NUMERIC NOT NULL,
+                code_link TEXT,
+                last_timestamp TIMESTAMPTZ
+            );
+            """
+        )
+        print("Table 'negotiations_totals' created or already exists.")
+
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS negotiations_latest (
+                model_name TEXT PRIMARY KEY,
+                max_possible_profit NUMERIC NOT NULL,
+                total_profit NUMERIC NOT NULL,
+                code_link TEXT,
+                timestamp TIMESTAMPTZ
+            );
+            """
+        )
+
+        cursor.execute(
+            """
+            ALTER TABLE negotiations_latest
+                ADD COLUMN IF NOT EXISTS session_id BIGINT REFERENCES sessions(id);
+            """
+        )
+        print("Table 'negotiations_latest' created or already exists.")
+
+        # Backfill them from the history the first time
+        cursor.execute(
+            """
+            INSERT INTO negotiations_totals (model_name, max_possible_profit, total_profit, code_link, last_timestamp)
+            SELECT
+                model_name,
+                SUM(max_possible_profit),
+                SUM(profit),
+                (array_agg(code_link ORDER BY timestamp DESC))[1],
+                MAX(timestamp)
+            FROM negotiations
+            WHERE NOT EXISTS (SELECT 1 FROM negotiations_totals)
+            GROUP BY model_name;
+            """
+        )
+        cursor.execute(
+            """
+            INSERT INTO negotiations_latest (model_name, max_possible_profit, total_profit, code_link, timestamp, session_id)
+            SELECT
+                model_name,
+                SUM(max_possible_profit),
+                SUM(profit),
+                (array_agg(code_link ORDER BY timestamp DESC))[1],
+                MAX(timestamp),
+                MAX(session_id)
+            FROM negotiations
+            WHERE timestamp = (SELECT MAX(timestamp) FROM negotiations)
+                AND NOT EXISTS (SELECT 1 FROM negotiations_latest)
+            GROUP BY model_name;
+            """
+        )
+        cursor.execute(
+            """
+            UPDATE negotiations_latest
+            SET session_id = negotiations.session_id
+            FROM negotiations
+            WHERE negotiations_latest.session_id IS NULL
+                AND negotiations.model_name = negotiations_latest.model_name
+                AND negotiations.timestamp = negotiations_latest.timestamp;
+            """
+        )
+        print("Leaderboard tables backfilled if they were empty.")
+
+        # Link to each solution on the branch, built when results are saved so that
+        # serving the all-time leaderboard never needs git
+        cursor.execute(
+            "ALTER TABLE negotiations_totals ADD COLUMN IF NOT EXISTS solution_link TEXT;"
+        )
+        cursor.execute(
+            """
+            UPDATE negotiations_totals
+            SET solution_link = regexp_replace(code_link, '/blob/[^/]+/', '/blob/' || %s || '/')
+            WHERE solution_link IS NULL AND code_link IS NOT NULL;
+            """,
+            (get_branch_name(),),
+        )
+        print("Column 'solution_link' on negotiations_totals created or already exists.")
+
+        for table in ("negotiations_totals", "negotiations_latest"):
+            cursor.execute(f"ALTER TABLE {table} ENABLE ROW LEVEL SECURITY;")
+            cursor.execute(
+                f"""
+                DO $$
+                BEGIN
+                    IF NOT EXISTS (
+                        SELECT 1 FROM pg_policies
+                        WHERE tablename = '{table}'
+                        AND policyname = 'public_read_only'
+                    ) THEN
+                        CREATE POLICY public_read_only ON {table}
+                            FOR SELECT
+                            TO anon, authenticated
+                            USING (true);
+                    END IF;
+                END $$;
+                """
+            )
+            cursor.execute(f"GRANT SELECT ON {table} TO anon, authenticated;")
+        print("Public read access granted to leaderboard tables.")
+
         # Create or replace view
         cursor.execute(
             """
             CREATE OR REPLACE VIEW negotiations_leaderboard AS
             SELECT
-                ROW_NUMBER() OVER (ORDER BY (SUM(profit) * 100.0 / SUM(max_possible_profit)) DESC) AS rank,
+                ROW_NUMBER() OVER (ORDER BY (total_profit * 100.0 / max_possible_profit) DESC) AS rank,
                 model_name,
-                (SUM(profit) * 100.0 / SUM(max_possible_profit))::NUMERIC(5,2) AS profit_percentage,
-                SUM(max_possible_profit)::NUMERIC AS max_possible_profit,
-                SUM(profit)::NUMERIC AS total_profit,
-                (array_agg(code_link ORDER BY timestamp DESC))[1] AS code_link
-            FROM negotiations
-            GROUP BY model_name
+                (total_profit * 100.0 / max_possible_profit)::NUMERIC(5,2) AS profit_percentage,
+                max_possible_profit,
+                total_profit,
+                code_link,
+                solution_link
+            FROM negotiations_totals
             ORDER BY profit_percentage DESC;
             """
         )
@@ -95,15 +289,13 @@ def setup_database():
             """
             CREATE OR REPLACE VIEW negotiations_leaderboard_latest AS
             SELECT
-                ROW_NUMBER() OVER (ORDER BY (SUM(profit) * 100.0 / SUM(max_possible_profit)) DESC) AS rank,
+                ROW_NUMBER() OVER (ORDER BY (total_profit * 100.0 / max_possible_profit) DESC) AS rank,
                 model_name,
-                (SUM(profit) * 100.0 / SUM(max_possible_profit))::NUMERIC(5,2) AS profit_percentage,
-                SUM(max_possible_profit)::NUMERIC AS max_possible_profit,
-                SUM(profit)::NUMERIC AS total_profit,
-                (array_agg(code_link ORDER BY timestamp DESC))[1] AS code_link
-            FROM negotiations
-            WHERE timestamp = (SELECT MAX(timestamp) FROM negotiations)
-            GROUP BY model_name
+                (total_profit * 100.0 / max_possible_profit)::NUMERIC(5,2) AS profit_percentage,
+                max_possible_profit,
+                total_profit,
+                code_link
+            FROM negotiations_latest
             ORDER BY profit_percentage DESC;
             """
         )
@@ -129,7 +321,7 @@ def setup_database():
                 id BIGSERIAL PRIMARY KEY,
                 model_name TEXT NOT NULL,
                 opponent_model_name TEXT NOT NULL,
-                data TEXT,
+                data JSONB,
                 commit_hash TEXT NOT NULL
             );
             """
@@ -142,6 +334,70 @@ def setup_database():
         )
         print("Index on commit_hash created or already exists.")
 
+        cursor.execute(
+            """
+            ALTER TABLE session_samples
+                ADD COLUMN IF NOT EXISTS session_id BIGINT REFERENCES sessions(id);
+            """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_session_samples_session_id ON session_samples(session_id);"
+        )
+        # Link past samples to the latest session of their commit
+        cursor.execute(
+            """
+            UPDATE session_samples
+            SET session_id = latest.id
+            FROM (
+                SELECT DISTINCT ON (commit_hash) id, commit_hash
+                FROM sessions
+                WHERE commit_hash IS NOT NULL
+                ORDER BY commit_hash, id DESC
+            ) AS latest
+            WHERE session_samples.session_id IS NULL
+                AND session_samples.commit_hash = latest.commit_hash;
+            """
+        )
+        print("Column 'session_id' on session_samples created or already exists.")
+
+        # data used to be TEXT holding json.dumps output
+        cursor.execute(
+            """
+            DO $$
+            BEGIN
+                IF (
+                    SELECT data_type FROM information_schema.columns
+                    WHERE table_name = 'session_samples' AND column_name = 'data'
+                ) = 'text' THEN
+                    ALTER TABLE session_samples ALTER COLUMN data TYPE JSONB USING data::jsonb;
+                END IF;
+            END $$;
+            """
+        )
+        # Extracted from data so samples can be filtered and sorted in the database.
+        # model_name is agent_0 (moves first) and opponent_model_name agent_1.
+        cursor.execute(
+            """
+            ALTER TABLE session_samples
+                ADD COLUMN IF NOT EXISTS outcome TEXT
+                    GENERATED ALWAYS AS (data ->> 'outcome') STORED,
+                ADD COLUMN IF NOT EXISTS model_profit NUMERIC
+                    GENERATED ALWAYS AS ((data ->> (model_name || ' profit'))::NUMERIC) STORED,
+                ADD COLUMN IF NOT EXISTS opponent_profit NUMERIC
+                    GENERATED ALWAYS AS ((data ->> (opponent_model_name || ' profit'))::NUMERIC) STORED;
+            """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_session_samples_data ON session_samples USING GIN (data jsonb_path_ops);"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_session_samples_session_model ON session_samples(session_id, model_name, outcome);"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_session_samples_session_opponent ON session_samples(session_id, opponent_model_name, outcome);"
+        )
+        print("Column 'data' is JSONB, extracted columns and indexes created or already exist.")
+
         # Enable RLS on session_samples
         cursor.execute("ALTER TABLE session_samples ENABLE ROW LEVEL SECURITY;")
         print("RLS enabled on session_samples.")
@@ -170,6 +426,74 @@ def setup_database():
         cursor.execute("GRANT SELECT ON session_samples TO anon, authenticated;")
         print("Public read access granted to session_samples table.")
 
+        # Every negotiation of every session, model_0 moving first. One partition per
+        # session, created and bulk loaded by save_negotiation_results. The agents' usage
+        # columns are only measured with PROFILE_AGENTS=true, NULL otherwise.
+        print("Creating table 'negotiation_results'...")
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS negotiation_results (
+                session_id BIGINT NOT NULL REFERENCES sessions(id),
+                scenario_id INTEGER NOT NULL,
+                model_0 TEXT NOT NULL,
+                model_1 TEXT NOT NULL,
+                outcome TEXT NOT NULL,
+                profit_0 INTEGER NOT NULL,
+                profit_1 INTEGER NOT NULL,
+                turns SMALLINT NOT NULL,
+                cpu_time_0 REAL,
+                cpu_time_1 REAL,
+                wall_time_0 REAL,
+                wall_time_1 REAL,
+                peak_memory_0 BIGINT,
+                peak_memory_1 BIGINT
+            ) PARTITION BY LIST (session_id);
+            """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_negotiation_results_models ON negotiation_results(model_0, model_1);"
+        )
+        print("Table 'negotiation_results' created or already exists.")
+
+        # Resources used by each model's agent over a session, see summarize_agent_usage
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS session_agent_usage (
+                session_id BIGINT NOT NULL REFERENCES sessions(id),
+                model_name TEXT NOT NULL,
+                negotiations INTEGER NOT NULL,
+                cpu_time DOUBLE PRECISION NOT NULL,
+                wall_time DOUBLE PRECISION NOT NULL,
+                max_wall_time DOUBLE PRECISION NOT NULL,
+                peak_memory BIGINT,
+                PRIMARY KEY (session_id, model_name)
+            );
+            """
+        )
+        print("Table 'session_agent_usage' created or already exists.")
+
+        for table in ("negotiation_results", "session_agent_usage"):
+            cursor.execute(f"ALTER TABLE {table} ENABLE ROW LEVEL SECURITY;")
+            cursor.execute(
+                f"""
+                DO $$
+                BEGIN
+                    IF NOT EXISTS (
+                        SELECT 1 FROM pg_policies
+                        WHERE tablename = '{table}'
+                        AND policyname = 'public_read_only'
+                    ) THEN
+                        CREATE POLICY public_read_only ON {table}
+                            FOR SELECT
+                            TO anon, authenticated
+                            USING (true);
+                    END IF;
+                END $$;
+                """
+            )
+            cursor.execute(f"GRANT SELECT ON {table} TO anon, authenticated;")
+        print("Public read access granted to negotiation_results and session_agent_usage tables.")
+
         print("Database setup completed successfully!")
 
     except Exception as e:
@@ -177,7 +501,9 @@ def setup_database():
         raise
     finally:
         cursor.close()
-        conn.close()
+        if not conn.closed:
+            conn.autocommit = False
+        put_connection(conn)
 
 
 if __name__ == "__main__":
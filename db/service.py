@@ -1,31 +1,35 @@
-import os
-import time
+import csv
+import io
+import json
 from datetime import datetime, timezone
 
-import psycopg2
-from dotenv import load_dotenv
-
+from db.connection import db_session
 from misc.git import get_code_link_at_commit, get_solution_code_link
 
-load_dotenv()
-
-DATABASE_URL = os.environ.get("DATABASE_URL")
-CACHE_TTL_SECONDS = 120
+# Leaderboard data only changes when a session is saved: cached by latest session id
 _cache = {}
 
 
-def _get_or_set_cache(key, loader):
-    now = time.monotonic()
+def _get_or_set_cache(key, session_id, loader):
     entry = _cache.get(key)
-    if entry:
-        ts, data = entry
-        if now - ts < CACHE_TTL_SECONDS:
-            return data
+    if entry and entry[0] == session_id:
+        return entry[1]
     data = loader()
-    _cache[key] = (now, data)
+    _cache[key] = (session_id, data)
     return data
 
 
+def get_latest_session_id() -> int | None:
+    """
+    Id of the session the latest leaderboard comes from, None before the first one.
+    Cheap enough to be called on every request to tell whether cached data is stale.
+    """
+    with db_session() as cursor:
+        cursor.execute("SELECT MAX(session_id) FROM negotiations_latest;")
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+
 def get_top_model_latest_session():
     """
     Get the leaderboard for the latest session.
@@ -33,13 +37,7 @@ def get_top_model_latest_session():
     """
     top_model = None
 
-    if not DATABASE_URL:
-        raise ValueError("DATABASE_URL environment variable must be set")
-
-    conn = psycopg2.connect(DATABASE_URL)
-    cursor = conn.cursor()
-
-    try:
+    with db_session() as cursor:
         cursor.execute(
             """
             SELECT model_name
@@ -51,9 +49,6 @@ def get_top_model_latest_session():
         row = cursor.fetchone()
         if row:
             top_model = row[0]
-    finally:
-        cursor.close()
-        conn.close()
 
     return top_model
 
@@ -63,13 +58,7 @@ def get_leaderboard_rank_and_model_latest_session():
     Get rank and model_name from negotiations_leaderboard_latest.
     Returns a list of dictionaries with rank and model_name.
     """
-    if not DATABASE_URL:
-        raise ValueError("DATABASE_URL environment variable must be set")
-
-    conn = psycopg2.connect(DATABASE_URL)
-    cursor = conn.cursor()
-
-    try:
+    with db_session() as cursor:
         cursor.execute(
             """
             SELECT rank, model_name
@@ -85,21 +74,20 @@ def get_leaderboard_rank_and_model_latest_session():
             }
             for row in rows
         ]
-    finally:
-        cursor.close()
-        conn.close()
 
     return results
 
 
-def get_negotiations_leaderboard_latest():
-    if not DATABASE_URL:
-        raise ValueError("DATABASE_URL environment variable must be set")
+def get_negotiations_leaderboard_latest(session_id: int | None = None):
+    """
+    Leaderboard of the latest session, with its timestamp. Cached until a new
+    session is saved; pass session_id if get_latest_session_id() was just called.
+    """
+    if session_id is None:
+        session_id = get_latest_session_id()
 
     def loader():
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor()
-        try:
+        with db_session() as cursor:
             cursor.execute(
                 """
                 SELECT rank, model_name, profit_percentage, max_possible_profit, total_profit, code_link
@@ -108,7 +96,7 @@ def get_negotiations_leaderboard_latest():
                 """
             )
             rows = cursor.fetchall()
-            cursor.execute("SELECT MAX(timestamp) FROM negotiations;")
+            cursor.execute("SELECT MAX(timestamp) FROM negotiations_latest;")
             latest_timestamp_row = cursor.fetchone()
             latest_timestamp = latest_timestamp_row[0] if latest_timestamp_row else None
             return {
@@ -125,24 +113,23 @@ def get_negotiations_leaderboard_latest():
                 ],
                 "latest_timestamp": latest_timestamp,
             }
-        finally:
-            cursor.close()
-            conn.close()
 
-    return _get_or_set_cache("negotiations_leaderboard_latest", loader)
+    return _get_or_set_cache("negotiations_leaderboard_latest", session_id, loader)
 
 
-def get_negotiations_leaderboard_all():
-    if not DATABASE_URL:
-        raise ValueError("DATABASE_URL environment variable must be set")
+def get_negotiations_leaderboard_all(session_id: int | None = None):
+    """
+    All-time leaderboard. Cached until a new session is saved; pass session_id if
+    get_latest_session_id() was just called.
+    """
+    if session_id is None:
+        session_id = get_latest_session_id()
 
     def loader():
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor()
-        try:
+        with db_session() as cursor:
             cursor.execute(
                 """
-                SELECT rank, model_name, profit_percentage, max_possible_profit, total_profit
+                SELECT rank, model_name, profit_percentage, max_possible_profit, total_profit, solution_link
                 FROM negotiations_leaderboard
                 ORDER BY rank;
                 """
@@ -155,123 +142,335 @@ def get_negotiations_leaderboard_all():
                     "profit_percentage": float(row[2]),
                     "max_possible_profit": float(row[3]),
                     "total_profit": float(row[4]),
-                    "code_link": get_solution_code_link(row[1]),
+                    "code_link": row[5] or get_solution_code_link(row[1]),
                 }
                 for row in rows
             ]
-        finally:
-            cursor.close()
-            conn.close()
 
-    return _get_or_set_cache("negotiations_leaderboard_all", loader)
+    return _get_or_set_cache("negotiations_leaderboard_all", session_id, loader)
 
 
-def get_samples(commit_hash):
-    """
-    Get all session_samples records filtered by commit_hash.
-    Returns a list of dictionaries with id, model_name, opponent_model_name, data, and commit_hash.
-    """
-    if not DATABASE_URL:
-        raise ValueError("DATABASE_URL environment variable must be set")
+def _insert_session(cursor, seed: int | None, scenario_count: int | None, config: dict | None, started_at) -> int:
+    """Insert a tournament's sessions row and return its id, finished by save_battle_results."""
+    cursor.execute(
+        """
+        INSERT INTO sessions (seed, scenario_count, config, started_at)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id;
+        """,
+        (seed, scenario_count, json.dumps(config) if config is not None else None, started_at),
+    )
+    return cursor.fetchone()[0]
 
-    conn = psycopg2.connect(DATABASE_URL)
-    cursor = conn.cursor()
 
-    try:
+def get_worst_losses(
+    commit_hash: str,
+    model_name: str,
+    opponent_model_name: str | None = None,
+    limit: int = 5,
+) -> list[dict]:
+    """
+    The samples of the latest session that pushed commit_hash where model_name lost
+    to its opponent (optionally a given one), i.e. made less profit: by increasing
+    profit margin, so the biggest losses first. Filtered, sorted and limited in the
+    database on the extracted profit columns.
+
+    Returns the data dicts of up to limit samples, none if the model never lost.
+    """
+    with db_session() as cursor:
         cursor.execute(
             """
-            SELECT id, model_name, opponent_model_name, data, commit_hash
-            FROM session_samples
-            WHERE commit_hash = %s;
+            WITH session AS (
+                SELECT id FROM sessions
+                WHERE commit_hash = %(commit_hash)s
+                ORDER BY id DESC
+                LIMIT 1
+            )
+            SELECT data FROM (
+                SELECT data, model_profit - opponent_profit AS margin
+                FROM session_samples
+                WHERE session_id = (SELECT id FROM session)
+                    AND model_name = %(model_name)s
+                    AND (%(opponent)s::TEXT IS NULL OR opponent_model_name = %(opponent)s)
+                UNION ALL
+                SELECT data, opponent_profit - model_profit AS margin
+                FROM session_samples
+                WHERE session_id = (SELECT id FROM session)
+                    AND opponent_model_name = %(model_name)s
+                    AND (%(opponent)s::TEXT IS NULL OR model_name = %(opponent)s)
+            ) AS samples
+            WHERE margin < 0
+            ORDER BY margin
+            LIMIT %(limit)s;
             """,
-            (commit_hash,),
-        )
-        rows = cursor.fetchall()
-        results = [
             {
-                "id": row[0],
-                "model_name": row[1],
-                "opponent_model_name": row[2],
-                "data": row[3],
-                "commit_hash": row[4],
-            }
-            for row in rows
-        ]
-    finally:
-        cursor.close()
-        conn.close()
-
-    return results
-
-
-def save_battle_results(results: dict, max_possible_profit: int, commit_hash: str):
+                "commit_hash": commit_hash,
+                "model_name": model_name,
+                "opponent": opponent_model_name,
+                "limit": limit,
+            },
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def save_battle_results(
+    results: dict,
+    max_possible_profit: int,
+    commit_hash: str,
+    seed: int | None = None,
+    scenario_count: int | None = None,
+    session_id: int | None = None,
+    samples: list | None = None,
+    config: dict | None = None,
+    started_at: datetime | None = None,
+) -> int:
     """
-    Save battle results to the negotiations table.
+    Save battle results to the negotiations table, and update the leaderboard
+    tables (running totals per model and the latest session snapshot) in the
+    same transaction. The session is created (unless session_id is given), gets
+    its samples and is marked finished at commit_hash in that transaction too, so
+    a failure never leaves a session without results.
 
     Args:
         results: Dictionary with model names as keys and dicts containing:
             - 'total_profit': accumulated profit across all sessions
         max_possible_profit: Maximum possible profit (same for all models)
         commit_hash: The git commit hash for generating code links
+        seed: The seed the session's scenarios were generated from
+        scenario_count: Number of scenarios of the session (with the seed, enough to replay it)
+        session_id: An existing session, a new one is created if not given
+        samples: The session's battle samples, see save_battle_samples
+        config: The tournament settings stored with a new session
+        started_at: When the tournament started, defaults to now
+
+    Returns the session id.
     """
-    if not DATABASE_URL:
-        raise ValueError("DATABASE_URL environment variable must be set")
-
-    conn = psycopg2.connect(DATABASE_URL)
-    cursor = conn.cursor()
-
     # Use the same timestamp for all records in this transaction
     timestamp = datetime.now(timezone.utc)
 
+    saved_rows = []
     try:
-        for model_name, stats in results.items():
-            total_profit = stats["total_profit"]
-
-            if max_possible_profit > 0:
-                code_link = get_code_link_at_commit(commit_hash, model_name)
-                cursor.execute(
-                    """
-                    INSERT INTO negotiations (model_name, max_possible_profit, profit, code_link, timestamp)
-                    VALUES (%s, %s, %s, %s, %s);
-                    """,
-                    (
-                        model_name,
-                        max_possible_profit,
-                        total_profit,
-                        code_link,
-                        timestamp,
-                    ),
-                )
+        with db_session() as cursor:
+            if session_id is None:
+                session_id = _insert_session(cursor, seed, scenario_count, config, started_at or timestamp)
+            if samples:
+                _insert_battle_samples(cursor, samples, commit_hash, session_id)
+
+            for model_name, stats in results.items():
+                total_profit = stats["total_profit"]
+
+                if max_possible_profit > 0:
+                    code_link = get_code_link_at_commit(commit_hash, model_name)
+                    cursor.execute(
+                        """
+                        INSERT INTO negotiations (model_name, max_possible_profit, profit, code_link, timestamp, seed, scenario_count, session_id)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
+                        """,
+                        (
+                            model_name,
+                            max_possible_profit,
+                            total_profit,
+                            code_link,
+                            timestamp,
+                            seed,
+                            scenario_count,
+                            session_id,
+                        ),
+                    )
+                    saved_rows.append(
+                        (
+                            model_name,
+                            max_possible_profit,
+                            total_profit,
+                            code_link,
+                            get_solution_code_link(model_name),
+                            timestamp,
+                        )
+                    )
+
+            if saved_rows:
+                _update_leaderboard_tables(cursor, saved_rows, session_id)
+
+            cursor.execute(
+                """
+                UPDATE sessions
+                SET finished_at = %s, commit_hash = %s,
+                    seed = COALESCE(seed, %s), scenario_count = COALESCE(scenario_count, %s)
+                WHERE id = %s;
+                """,
+                (timestamp, commit_hash, seed, scenario_count, session_id),
+            )
 
-        conn.commit()
         print(f"Saved battle results for {len(results)} models to database")
     except Exception as e:
-        conn.rollback()
         print(f"Failed to save battle results: {e}")
         raise
-    finally:
-        cursor.close()
-        conn.close()
+    return session_id
 
 
-def save_battle_samples(battle_scenarios: list, commit_hash: str):
+def _update_leaderboard_tables(cursor, rows: list[tuple], session_id: int):
     """
-    Save all battle scenarios to the database.
+    Add a session's (model_name, max_possible_profit, profit, code_link,
+    solution_link, timestamp) rows to the running totals and make them the latest
+    session snapshot.
+    """
+    from psycopg2.extras import execute_values
+
+    execute_values(
+        cursor,
+        """
+        INSERT INTO negotiations_totals (model_name, max_possible_profit, total_profit, code_link, solution_link, last_timestamp)
+        VALUES %s
+        ON CONFLICT (model_name) DO UPDATE SET
+            max_possible_profit = negotiations_totals.max_possible_profit + EXCLUDED.max_possible_profit,
+            total_profit = negotiations_totals.total_profit + EXCLUDED.total_profit,
+            code_link = EXCLUDED.code_link,
+            solution_link = EXCLUDED.solution_link,
+            last_timestamp = EXCLUDED.last_timestamp;
+        """,
+        rows,
+    )
+    cursor.execute("DELETE FROM negotiations_latest;")
+    execute_values(
+        cursor,
+        """
+        INSERT INTO negotiations_latest (model_name, max_possible_profit, total_profit, code_link, timestamp, session_id)
+        VALUES %s;
+        """,
+        [row[:4] + row[5:] + (session_id,) for row in rows],
+    )
+
+
+def save_negotiation_results(session_id: int, rows: list[tuple]):
+    """
+    Save the outcome of every negotiation of a session to its own partition of
+    negotiation_results, streamed with COPY (much faster than INSERTs for the
+    millions of rows of a large tournament).
 
     Args:
-        battle_scenarios: List of scenario dictionaries. Each scenario contains:
-            - 'scenario': the original scenario data with '{model_name} values' keys
-            - 'outcome': 'deal', 'no_deal', or error type
-            - '{model_x} profit': profit achieved by model_x
-            - '{model_y} profit': profit achieved by model_y
-            - 'turn_history': list of offers per round with '{model_name} offer' keys
-        commit_hash: The git commit hash
+        session_id: The session the negotiations belong to
+        rows: (scenario_id, model_0, model_1, outcome, profit_0, profit_1, turns,
+            cpu_time_0, cpu_time_1, wall_time_0, wall_time_1, peak_memory_0,
+            peak_memory_1) tuples, see BattleScheduler.negotiation_results
+    """
+    if not rows:
+        print("No negotiation results to save")
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow((session_id,) + tuple(row))
+    buffer.seek(0)
+
+    partition = f"negotiation_results_{int(session_id)}"
+    try:
+        with db_session() as cursor:
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {partition}
+                PARTITION OF negotiation_results FOR VALUES IN ({int(session_id)});
+                """
+            )
+            # Partitions don't inherit the parent's RLS and grants: same read-only access
+            cursor.execute(f"ALTER TABLE {partition} ENABLE ROW LEVEL SECURITY;")
+            cursor.execute(
+                f"""
+                DO $$
+                BEGIN
+                    IF NOT EXISTS (
+                        SELECT 1 FROM pg_policies
+                        WHERE tablename = '{partition}'
+                        AND policyname = 'public_read_only'
+                    ) THEN
+                        CREATE POLICY public_read_only ON {partition}
+                            FOR SELECT
+                            TO anon, authenticated
+                            USING (true);
+                    END IF;
+                END $$;
+                """
+            )
+            cursor.execute(f"GRANT SELECT ON {partition} TO anon, authenticated;")
+            # Straight into the partition, rows don't need to be routed
+            cursor.copy_expert(
+                f"""
+                COPY {partition} (session_id, scenario_id, model_0, model_1, outcome,
+                    profit_0, profit_1, turns, cpu_time_0, cpu_time_1, wall_time_0,
+                    wall_time_1, peak_memory_0, peak_memory_1)
+                FROM STDIN WITH (FORMAT csv)
+                """,
+                buffer,
+            )
+
+        print(f"Saved {len(rows)} negotiation results to database")
+    except Exception as e:
+        print(f"Failed to save negotiation results: {e}")
+        raise
+
+
+def save_agent_usage(session_id: int, usage: dict):
+    """
+    Save the resources used by each model's agent over a session.
+
+    Args:
+        session_id: The session the usage was measured in
+        usage: Dictionary from summarize_agent_usage, model names as keys
+    """
+    if not usage:
+        return
+
+    from psycopg2.extras import execute_values
+
+    with db_session() as cursor:
+        execute_values(
+            cursor,
+            """
+            INSERT INTO session_agent_usage
+                (session_id, model_name, negotiations, cpu_time, wall_time, max_wall_time, peak_memory)
+            VALUES %s
+            ON CONFLICT (session_id, model_name) DO NOTHING;
+            """,
+            [
+                (
+                    session_id,
+                    model_name,
+                    stats["negotiations"],
+                    stats["cpu_time"],
+                    stats["wall_time"],
+                    stats["max_wall_time"],
+                    stats["peak_memory"],
+                )
+                for model_name, stats in usage.items()
+            ],
+        )
+
+
+def get_agent_costs() -> dict[str, float]:
+    """
+    CPU seconds per negotiation of each model's agent in the latest session that
+    measured them (PROFILE_AGENTS=true), see save_agent_usage.
+
+    Returns a dict mapping model names to seconds, empty if no session measured them.
     """
-    import json
+    try:
+        with db_session() as cursor:
+            cursor.execute(
+                """
+                SELECT model_name, cpu_time / negotiations
+                FROM session_agent_usage
+                WHERE session_id = (SELECT MAX(session_id) FROM session_agent_usage)
+                    AND negotiations > 0;
+                """
+            )
+            return {model_name: cost for model_name, cost in cursor.fetchall()}
+    except Exception as e:
+        print(f"Failed to load agent costs: {e}")
+        return {}
 
-    if not DATABASE_URL:
-        raise ValueError("DATABASE_URL environment variable must be set")
 
+def _insert_battle_samples(cursor, battle_scenarios: list, commit_hash: str, session_id: int | None):
+    """Bulk insert battle scenarios into session_samples, see save_battle_samples."""
     records = []
     for scenario_info in battle_scenarios:
         profit_keys = [k for k in scenario_info.keys() if k.endswith(" profit")]
@@ -282,42 +481,60 @@ def save_battle_samples(battle_scenarios: list, commit_hash: str):
         model_y = profit_keys[1].replace(" profit", "")
         
         data = {
+            "agent_0": model_x,
+            "agent_1": model_y,
             "scenario": scenario_info["scenario"],
             "outcome": scenario_info["outcome"],
             f"{model_x} profit": scenario_info[f"{model_x} profit"],
             f"{model_y} profit": scenario_info[f"{model_y} profit"],
             "turn_history": scenario_info["turn_history"],
         }
+        if scenario_info.get("efficiency") is not None:
+            data["efficiency"] = scenario_info["efficiency"]
         data_json = json.dumps(data)
 
-        records.append((model_x, model_y, data_json, commit_hash))
+        records.append((model_x, model_y, data_json, commit_hash, session_id))
 
     if not records:
         print("No battle scenarios to save")
         return
 
-    conn = psycopg2.connect(DATABASE_URL)
-    cursor = conn.cursor()
+    from psycopg2.extras import execute_values
 
-    try:
-        # Bulk insert all records in a single call
-        from psycopg2.extras import execute_values
+    execute_values(
+        cursor,
+        """
+        INSERT INTO session_samples (model_name, opponent_model_name, data, commit_hash, session_id)
+        VALUES %s
+        """,
+        records,
+    )
+    print(f"Saved {len(records)} battle samples to database")
 
-        execute_values(
-            cursor,
-            """
-            INSERT INTO session_samples (model_name, opponent_model_name, data, commit_hash)
-            VALUES %s
-            """,
-            records,
-        )
 
-        conn.commit()
-        print(f"Saved {len(records)} battle samples to database")
+def save_battle_samples(battle_scenarios: list, commit_hash: str, session_id: int | None = None):
+    """
+    Save all battle scenarios to the database.
+
+    Args:
+        battle_scenarios: List of scenario dictionaries. Each scenario contains:
+            - 'scenario': the original scenario data with '{model_name} values' keys
+            - 'outcome': 'deal', 'no_deal', or error type
+            - '{model_x} profit': profit achieved by model_x
+            - '{model_y} profit': profit achieved by model_y
+            - 'efficiency': optional deal efficiency metrics
+            - 'turn_history': list of offers per round with '{model_name} offer' keys
+        commit_hash: The git commit hash
+        session_id: The session the samples come from
+
+    model_x (agent_0, moving first) is stored as model_name and model_y (agent_1)
+    as opponent_model_name. data is JSONB, which doesn't keep key order, so the
+    roles are also written in it as 'agent_0' and 'agent_1'.
+    """
+
+    try:
+        with db_session() as cursor:
+            _insert_battle_samples(cursor, battle_scenarios, commit_hash, session_id)
     except Exception as e:
-        conn.rollback()
         print(f"Failed to save battle samples: {e}")
         raise
-    finally:
-        cursor.close()
-        conn.close()
@@ -1,11 +1,15 @@
 from db.service import get_top_model_latest_session
 from dotenv import load_dotenv
+import asyncio
+from datetime import datetime, timezone
 import json
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 import os
 import re
 import misc.git as git
-from misc.battlefield import validate_code, generate_negotiation_data, run_battles
+from misc.battlefield import BattleScheduler, validate_code, generate_negotiation_data
+from misc.profiling import summarize_agent_usage
+from misc.scenario_generator import get_tournament_id, get_tournament_seed, tournament_seed_is_fixed
 from misc.io import (
     load_models,
     load_prompts,
@@ -13,7 +17,7 @@ from misc.io import (
     get_code_example,
     save_solution,
 )
-from db.service import save_battle_results, save_battle_samples, get_samples, get_leaderboard_rank_and_model_latest_session
+from db.service import save_battle_results, save_negotiation_results, save_agent_usage, get_agent_costs, get_worst_losses, get_leaderboard_rank_and_model_latest_session
 
 # Load environment variables from .env file
 load_dotenv()
@@ -38,6 +42,33 @@ if aihubmix_api_key:
         api_key=aihubmix_api_key,
     )
 
+# Async clients used to generate the code of all the models concurrently
+async_openrouter_client = None
+async_aihubmix_client = None
+
+if openrouter_api_key:
+    async_openrouter_client = AsyncOpenAI(
+        base_url="https://openrouter.ai/api/v1",
+        api_key=openrouter_api_key,
+    )
+
+if aihubmix_api_key:
+    async_aihubmix_client = AsyncOpenAI(
+        base_url="https://aihubmix.com/v1",
+        api_key=aihubmix_api_key,
+    )
+
+
+def get_provider_concurrency(provider: str) -> int:
+    """
+    Maximum number of concurrent requests to a provider, can be set via
+    {PROVIDER}_CONCURRENCY env var (e.g. OPENROUTER_CONCURRENCY), defaults to 4.
+    """
+    try:
+        return max(1, int(os.getenv(f"{provider.upper()}_CONCURRENCY", "4")))
+    except ValueError:
+        return 4
+
 
 def build_user_prompt(
     prompts: dict,
@@ -125,6 +156,42 @@ def call_llm_api(model_name: str, system_prompt: str, user_prompt: str, provider
     raise last_error
 
 
+async def call_llm_api_async(
+    model_name: str, system_prompt: str, user_prompt: str, provider: str = "openrouter"
+) -> str:
+    """Async version of call_llm_api, using the async provider clients."""
+    max_retries = 3
+    last_error = None
+
+    # Select the appropriate client based on provider
+    if provider == "aihubmix":
+        client = async_aihubmix_client
+        if client is None:
+            raise ValueError("AIHUBMIX_API_KEY is not set in environment variables")
+    else:  # default to openrouter
+        client = async_openrouter_client
+        if client is None:
+            raise ValueError("OPENROUTER_API_KEY is not set in environment variables")
+
+    for attempt in range(max_retries):
+        try:
+            response = await client.chat.completions.create(
+                model=model_name,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+            )
+            return response.choices[0].message.content
+        except Exception as e:
+            last_error = e
+            print(
+                f"{provider.upper()} API call failed (attempt {attempt + 1}/{max_retries}): {e}"
+            )
+
+    raise last_error
+
+
 def extract_python_code(response_text: str) -> str | None:
     """Extract Python code from markdown code blocks."""
     pattern = r"```python\s*(.*?)\s*```"
@@ -140,25 +207,39 @@ def main():
     git.pull()
 
     commit_hash = git.get_newest_commit_in_solutions()
-    # Get samples from the database for this commit
-    samples = get_samples(commit_hash)
     loaderboard_data = get_leaderboard_rank_and_model_latest_session()
-    print(f"Retrieved {len(samples)} samples from database for commit {commit_hash}")
 
     # Load models from config
     models: list[dict] = load_models()
     print(f"Loaded models: {models}")
 
-    # Generate negotiation data
-    negotiation_data, total_target_worth = generate_negotiation_data()
+    # Generate negotiation data (set TOURNAMENT_SEED to replay a previous tournament)
+    seed = get_tournament_seed()
+    negotiation_data, total_target_worth = generate_negotiation_data(seed)
+    print(f"Tournament ID: {get_tournament_id(seed, len(negotiation_data))}")
     print(f"Generated {len(negotiation_data)} negotiation scenarios")
     print(f"Total target worth: {total_target_worth}")
     print(json.dumps(negotiation_data[:2], indent=2))  # Print first 2 for brevity
 
+    # The session is only created with its results, a failed run leaves no session
+    started_at = datetime.now(timezone.utc)
+    session_config = {
+        "models": [model["display_name"] for model in models],
+        "num_samples": os.getenv("NUM_SAMPLES", "5"),
+        "sandbox_agents": os.getenv("SANDBOX_AGENTS", "false"),
+        "turn_timeout_seconds": os.getenv("TURN_TIMEOUT_SECONDS", "5"),
+    }
+
     # Identify top model
     top_model_name = get_top_model_latest_session()
 
-    # Iterate through models and call LLM API
+    try:
+        num_prompt_samples = int(os.getenv("NUM_SAMPLES", "5"))
+    except ValueError:
+        num_prompt_samples = 5
+
+    # Collect the models to generate code for, then call the LLM APIs concurrently
+    generation_requests = []
     for model in models.copy():
         # do not ask to regenerate code for the top model from the latest session
         if model["display_name"] == top_model_name or model.get("is_human", False):
@@ -182,32 +263,77 @@ def main():
         # Get existing code if any
         current_code = get_current_code(display_name)
 
-        # Filter samples to only include those where this model participated
-        model_samples = [
-            s.get("data")
-            for s in samples
-            if s.get("model_name") == display_name
-            or s.get("opponent_model_name") == display_name
-        ]
-
-        new_code = get_algos(display_name, model_name, provider, current_code, model_samples, loaderboard_data)
-        if not new_code:
-            models.remove(model)
-            continue
+        # The worst losses of this model against the top model, selected in the database
+        model_samples = get_worst_losses(commit_hash, display_name, top_model_name, limit=num_prompt_samples)
+        print(f"Retrieved {len(model_samples)} samples from database for commit {commit_hash}")
+
+        generation_requests.append(
+            {
+                "model": model,
+                "display_name": display_name,
+                "model_name": model_name,
+                "provider": provider,
+                "current_code": current_code,
+                "samples": model_samples,
+            }
+        )
 
-    # Check if we have any models left to battle
-    if len(models) < 2:
-        print("Not enough models to run battles (need at least 2 models)")
+    # Battles run while the LLMs are still generating: the models that keep their code
+    # start right away, the others as soon as their new code is validated and saved
+    print("\n" + "=" * 50)
+    print("Starting negotiation battles...")
+    print("=" * 50)
+    # Pair results are only cached for a fixed seed, a random one never comes back
+    cache_seed = seed if tournament_seed_is_fixed() else None
+    # What each agent cost in the last profiled session, to start the slow pairs first
+    agent_costs = get_agent_costs()
+    try:
+        scheduler = BattleScheduler(
+            negotiation_data, seed=cache_seed, num_models=len(models), agent_costs=agent_costs
+        )
+    except Exception as e:
+        print(f"Failed to start battles: {e}")
         return
 
-    try:
-        # Run battles between all models
-        print("\n" + "=" * 50)
-        print("Starting negotiation battles...")
-        print("=" * 50)
+    with scheduler:
+        # Models the scheduler couldn't take are left out of the tournament
+        skipped_models = []
 
-        battle_results, battle_scenarios = run_battles(models, negotiation_data)
+        def add_model(model):
+            if not scheduler.add_model(model):
+                skipped_models.append(model)
+
+        regenerated_names = {request["display_name"] for request in generation_requests}
+        for model in models:
+            if model["display_name"] not in regenerated_names:
+                add_model(model)
+
+        new_codes = asyncio.run(
+            generate_algos(
+                generation_requests,
+                loaderboard_data,
+                on_generated=lambda request: add_model(request["model"]),
+            )
+        )
+        for request, new_code in zip(generation_requests, new_codes):
+            if not new_code:
+                models.remove(request["model"])
+        for model in skipped_models:
+            models.remove(model)
 
+        # Check if we have any models left to battle
+        if len(models) < 2:
+            print("Not enough models to run battles (need at least 2 models)")
+            return
+
+        try:
+            battle_results, battle_scenarios = scheduler.results()
+            negotiation_results = scheduler.negotiation_results()
+        except Exception as e:
+            print(f"Failed to run battles: {e}")
+            return
+
+    try:
         # Check if we got any battle results
         if not battle_results:
             print("No battle results generated - no valid agents found")
@@ -230,6 +356,20 @@ def main():
                 f"{model_name}: max_possible_profit={max_possible_profit}, total_profit={total_profit}, profit_percentage={profit_percentage:.2f}%"
             )
 
+        # Which agents the tournament time and memory went to
+        agent_usage = summarize_agent_usage(negotiation_results)
+        if agent_usage:
+            print("\nAgent Usage (most CPU time first):")
+        for model_name, stats in sorted(
+            agent_usage.items(), key=lambda item: item[1]["cpu_time"], reverse=True
+        ):
+            peak_memory = (
+                f"{stats['peak_memory'] / 2**20:.1f} MiB" if stats["peak_memory"] is not None else "n/a"
+            )
+            print(
+                f"{model_name}: negotiations={stats['negotiations']}, cpu_time={stats['cpu_time']:.2f}s, wall_time={stats['wall_time']:.2f}s, slowest_negotiation={stats['max_wall_time']:.3f}s, peak_memory={peak_memory}"
+            )
+
         new_commit_hash = git.push()
 
         # Determine the winner (model with max total profit)
@@ -247,19 +387,81 @@ def main():
                 player_keys = [k for k in scenario.keys() if k.endswith(" values")]
                 if any(winner_name in k for k in player_keys):
                     winner_scenarios.append(scenario_dict)
+    except Exception as e:
+        print(f"Failed to push changes: {e}")
+        return
 
-        # Save only the winner's scenarios
-        save_battle_samples(winner_scenarios, new_commit_hash)
+    # The session, its samples (only the winner's scenarios) and results, in one transaction
+    session_id = save_battle_results(
+        battle_results,
+        max_possible_profit,
+        new_commit_hash,
+        seed,
+        len(negotiation_data),
+        samples=winner_scenarios,
+        config=session_config,
+        started_at=started_at,
+    )
+    print(f"Session ID: {session_id}")
 
+    # Every negotiation, kept for later analysis; the leaderboard doesn't depend on it
+    try:
+        save_negotiation_results(session_id, negotiation_results)
+        save_agent_usage(session_id, agent_usage)
     except Exception as e:
-        print(f"Failed to run battles, push changes or save battle samples: {e}")
-        return
+        print(f"Failed to save negotiation results: {e}")
+
+
+async def generate_algos(
+    generation_requests: list[dict], loaderboard_data, on_generated=None
+) -> list[str | None]:
+    """
+    Generate the code of several models concurrently, with at most
+    get_provider_concurrency(provider) requests in flight per provider.
+    Each response is validated and saved as soon as it arrives, then
+    on_generated(request) is called if given.
+
+    Returns the new code of each request (None when it failed), in request order.
+    """
+    semaphores = {}
+    for request in generation_requests:
+        provider = request["provider"]
+        if provider not in semaphores:
+            semaphores[provider] = asyncio.Semaphore(get_provider_concurrency(provider))
+
+    async def generate(request):
+        new_code = await get_algos_async(
+            request["display_name"],
+            request["model_name"],
+            request["provider"],
+            request["current_code"],
+            request["samples"],
+            loaderboard_data,
+            semaphores[request["provider"]],
+        )
+        if new_code and on_generated is not None:
+            on_generated(request)
+        return new_code
 
-    # Save results to database (only if save_battle_samples succeeded)
-    save_battle_results(battle_results, max_possible_profit, new_commit_hash)
+    return await asyncio.gather(*(generate(request) for request in generation_requests))
 
 
 def get_algos(display_name, model_name, provider, current_code, samples, loaderboard_data):
+    """Generate, validate and save the code of a single model."""
+    return asyncio.run(
+        get_algos_async(display_name, model_name, provider, current_code, samples, loaderboard_data)
+    )
+
+
+async def get_algos_async(
+    display_name,
+    model_name,
+    provider,
+    current_code,
+    samples,
+    loaderboard_data,
+    semaphore: asyncio.Semaphore | None = None,
+):
 
     prompts = load_prompts()
     system_prompt_template = prompts.get("system_prompt", "")
@@ -269,11 +471,13 @@ def get_algos(display_name, model_name, provider, current_code, samples, loaderb
     system_prompt = system_prompt_template.format(
         model_name=display_name, problem_description=problem_description
     )
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(1)
 
     error = None
     max_attempts = 3
     for attempt in range(max_attempts):
-        print(f"Attempt {attempt + 1}/{max_attempts}")
+        print(f"{display_name}: attempt {attempt + 1}/{max_attempts}")
 
         # Build user prompt with current code, error, and samples (if any)
         user_prompt = build_user_prompt(prompts, current_code, error, samples, loaderboard_data, display_name)
@@ -286,7 +490,10 @@ def get_algos(display_name, model_name, provider, current_code, samples, loaderb
         
         # Call LLM API with error handling to skip unreachable models
         try:
-            response_text = call_llm_api(model_name, system_prompt, user_prompt, provider)
+            async with semaphore:
+                response_text = await call_llm_api_async(
+                    model_name, system_prompt, user_prompt, provider
+                )
         except Exception as e:
             print(f"Failed to call {provider} API for {display_name}: {e}")
             print(f"Skipping {display_name} due to API error")
@@ -300,8 +507,8 @@ def get_algos(display_name, model_name, provider, current_code, samples, loaderb
             print(f"Error: {error}")
             continue
 
-            # Validate the code
-        is_valid, validation_error = validate_code(extracted_code)
+        # Validate the code (it runs the agent, keep it off the event loop)
+        is_valid, validation_error = await asyncio.to_thread(validate_code, extracted_code)
         if is_valid:
             # Save the solution
             save_solution(display_name, extracted_code)
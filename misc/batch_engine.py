@@ -0,0 +1,241 @@
+import numpy as np
+
+from misc.battlefield import _checked_complement, get_offer_bounds
+from misc.io import get_solution_path
+from misc.reference_agents import get_reference_batch_agent
+from misc.solution_cache import load_solution_class
+
+# Outcomes of the batched engine, as codes into this tuple. They are the outcomes of
+# run_negotiation, plus "error" when an agent couldn't be set up for a scenario
+# (like an exception in _play_scenarios_in_process).
+OUTCOMES = ("deal", "no_deal", "error_agent_0", "error_agent_1", "error")
+DEAL, NO_DEAL, ERROR_AGENT_0, ERROR_AGENT_1, ERROR = range(len(OUTCOMES))
+
+# A solution can define a BatchAgent next to its Agent, playing K negotiations (lanes)
+# at once:
+#
+#   class BatchAgent:
+#       def __init__(self, me, counts, values, max_rounds, lengths): ...
+#       def offer(self, offers, active): ...
+#
+# counts and values are int arrays (K, items), zero padded after the lengths[k] item
+# types of each lane, max_rounds and lengths int arrays (K,). An optional `failed`
+# bool array (K,) set by the constructor marks the lanes it couldn't set up.
+#
+# All the lanes start together and move in lock step: offer() is called once per turn,
+# with offers the (K, items) array of what each lane offers the agent (None on agent
+# 0's first turn) and active the bool mask of the lanes still playing, the rows of the
+# other lanes are meaningless. It returns (accept, counter_offers) or (accept,
+# counter_offers, errors): bool arrays (K,) of the lanes accepting their offer and of
+# the lanes where the agent failed, and the (K, items) int array of what the agent
+# wants for itself on the other lanes.
+
+
+def _retire(outcomes, turns, lanes, outcome: int, turn: int):
+    """Set the outcome and number of turns of the given lanes."""
+    outcomes[lanes] = outcome
+    turns[lanes] = turn
+
+
+def _batch_turn(agent, offers, active, counts, label: str):
+    """
+    Play one turn of a batch agent on the active lanes.
+
+    Returns (accept, counter_offers, errors, invalid) restricted to the active lanes,
+    invalid being the counter-offers out of 0..counts (and every lane if the agent's
+    answer isn't well formed), or None if the agent raised.
+    """
+    try:
+        response = agent.offer(offers, active.copy())
+    except Exception as e:
+        print(f"{label} error: {e}")
+        return None
+
+    num_lanes = len(counts)
+    try:
+        accept, counter_offers, *rest = response
+        accept = np.asarray(accept, dtype=bool)
+        counter_offers = np.asarray(counter_offers)
+        errors = np.asarray(rest[0] if rest and rest[0] is not None else np.zeros(num_lanes), dtype=bool)
+        if (
+            len(rest) > 1
+            or accept.shape != (num_lanes,)
+            or errors.shape != (num_lanes,)
+            or counter_offers.shape != counts.shape
+            or counter_offers.dtype.kind not in "biu"
+        ):
+            raise ValueError("wrong shapes or types")
+    except (TypeError, ValueError) as e:
+        print(f"{label} invalid response: {e}")
+        no_lanes = np.zeros(num_lanes, dtype=bool)
+        return no_lanes, np.zeros_like(counts), no_lanes, active.copy()
+
+    errors &= active
+    accept &= active & ~errors
+    offering = active & ~accept & ~errors
+    invalid = offering & ((counter_offers < 0) | (counter_offers > counts)).any(axis=1)
+    return accept, counter_offers, errors, invalid
+
+
+def run_batch_negotiations(BatchAgentClass0, BatchAgentClass1, arrays: dict) -> dict:
+    """
+    Play every scenario of arrays (see misc.scenario_generator.generate_scenario_arrays)
+    between two BatchAgent classes, BatchAgentClass0 moving first, with the rules of
+    run_negotiation: the lanes are retired as soon as they end in a deal, an error or
+    an invalid offer, or after their max rounds.
+
+    Returns a dict of arrays, one row per scenario:
+    - 'outcome': codes into OUTCOMES
+    - 'turns': number of rounds played, as run_negotiation's turn history length
+    - 'items_0', 'items_1': (K, items) what each agent gets, zeros without a deal
+    - 'profit_0', 'profit_1': profit of each agent
+    """
+    counts = np.asarray(arrays["counts"], dtype=np.int64)
+    values_0 = np.asarray(arrays["player_0"], dtype=np.int64)
+    values_1 = np.asarray(arrays["player_1"], dtype=np.int64)
+    lengths = np.asarray(arrays["lengths"], dtype=np.int64)
+    rounds = np.asarray(arrays["rounds"], dtype=np.int64)
+    num_lanes = len(counts)
+
+    outcomes = np.full(num_lanes, NO_DEAL, dtype=np.int8)
+    turns = rounds.copy()
+    items_0 = np.zeros_like(counts)
+    deals = np.zeros(num_lanes, dtype=bool)
+    active = np.ones(num_lanes, dtype=bool)
+
+    agents = []
+    for me, AgentClass, values in ((0, BatchAgentClass0, values_0), (1, BatchAgentClass1, values_1)):
+        try:
+            # Copies: agents may modify their arrays in place
+            agent = AgentClass(me, counts.copy(), values.copy(), rounds.copy(), lengths.copy())
+            failed = getattr(agent, "failed", None)
+            if failed is not None:
+                active &= ~np.asarray(failed, dtype=bool)
+        except Exception as e:
+            print(f"Agent {me} setup error: {e}")
+            agent = None
+            active[:] = False
+        agents.append(agent)
+    _retire(outcomes, turns, ~active, ERROR, 0)
+    agent_0, agent_1 = agents
+
+    offers = None  # Agent 0 makes the first offer
+    for round_num in range(int(rounds.max(initial=0))):
+        active &= round_num < rounds
+        if not active.any():
+            break
+
+        # Agent 0's turn
+        turn = _batch_turn(agent_0, offers, active, counts, "Agent 0")
+        if turn is None:
+            _retire(outcomes, turns, active, ERROR_AGENT_0, round_num)
+            break
+        accept, response_0, errors, invalid = turn
+        _retire(outcomes, turns, errors, ERROR_AGENT_0, round_num)
+        if offers is None:
+            # Accepting before any offer is invalid
+            invalid |= accept
+        else:
+            # Agent 0 accepts agent 1's offer, which contains what agent_0 gets
+            items_0[accept] = offers[accept]
+            deals |= accept
+            _retire(outcomes, turns, accept, DEAL, round_num + 1)
+        _retire(outcomes, turns, invalid, ERROR_AGENT_0, round_num + 1)
+        active &= ~(accept | errors | invalid)
+
+        # Agent 1's turn, offered what agent_0 leaves
+        turn = _batch_turn(agent_1, counts - response_0, active, counts, "Agent 1")
+        if turn is None:
+            _retire(outcomes, turns, active, ERROR_AGENT_1, round_num + 1)
+            break
+        accept, response_1, errors, invalid = turn
+        items_0[accept] = response_0[accept]
+        deals |= accept
+        _retire(outcomes, turns, accept, DEAL, round_num + 1)
+        _retire(outcomes, turns, errors | invalid, ERROR_AGENT_1, round_num + 1)
+        active &= ~(accept | errors | invalid)
+
+        offers = counts - response_1
+
+    items_1 = np.where(deals[:, None], counts - items_0, 0)
+    return {
+        "outcome": outcomes,
+        "turns": turns,
+        "items_0": items_0,
+        "items_1": items_1,
+        "profit_0": (items_0 * values_0).sum(axis=1),
+        "profit_1": (items_1 * values_1).sum(axis=1),
+    }
+
+
+def scalar_batch_agent_class(AgentClass):
+    """
+    BatchAgent class playing each lane with its own AgentClass instance, for the
+    solutions without a BatchAgent. Lanes play the moves run_negotiation would,
+    except for agents using the random module, which isn't reseeded per scenario.
+    """
+
+    class ScalarBatchAgent:
+        def __init__(self, me, counts, values, max_rounds, lengths):
+            self.lengths = lengths.tolist()
+            self.counts = counts
+            self.agents = []
+            self.failed = np.zeros(len(counts), dtype=bool)
+            for lane, (lane_counts, lane_values, lane_rounds, length) in enumerate(
+                zip(counts.tolist(), values.tolist(), max_rounds.tolist(), self.lengths)
+            ):
+                try:
+                    agent = AgentClass(me, lane_counts[:length], lane_values[:length], lane_rounds)
+                except Exception as e:
+                    print(f"Agent setup error: {e}")
+                    agent = None
+                    self.failed[lane] = True
+                self.agents.append(agent)
+
+        def offer(self, offers, active):
+            accept = np.zeros(len(self.agents), dtype=bool)
+            errors = np.zeros_like(accept)
+            counter_offers = np.zeros_like(self.counts)
+            offer_rows = None if offers is None else offers.tolist()
+            for lane in np.flatnonzero(active).tolist():
+                length = self.lengths[lane]
+                offer = None if offer_rows is None else offer_rows[lane][:length]
+                try:
+                    response = self.agents[lane].offer(offer)
+                except Exception as e:
+                    print(f"Agent error: {e}")
+                    errors[lane] = True
+                    continue
+                if response is None:
+                    accept[lane] = True
+                    continue
+                counts = self.counts[lane, :length].tolist()
+                if _checked_complement(response, get_offer_bounds(counts)) is None:
+                    # Out of bounds, so that the engine sees an invalid offer
+                    print(f"Agent invalid offer: {response!r}")
+                    counter_offers[lane, 0] = -1
+                else:
+                    counter_offers[lane, :length] = response
+            return accept, counter_offers, errors
+
+    ScalarBatchAgent.__name__ = ScalarBatchAgent.__qualname__ = f"ScalarBatchAgent[{AgentClass.__name__}]"
+    return ScalarBatchAgent
+
+
+def load_batch_agent_class(display_name: str):
+    """
+    The BatchAgent class of a model's solution file, else the NumPy port of the
+    solution in misc.reference_agents, else its Agent class wrapped by
+    scalar_batch_agent_class.
+    Returns None if not found/invalid.
+    """
+    try:
+        path = get_solution_path(display_name)
+        BatchAgent = load_solution_class(path, "BatchAgent") or get_reference_batch_agent(display_name)
+        if BatchAgent is not None:
+            return BatchAgent
+        AgentClass = load_solution_class(path)
+        return None if AgentClass is None else scalar_batch_agent_class(AgentClass)
+    except Exception as e:
+        print(f"Failed to load batch agent for {display_name}: {e}")
+        return None
@@ -1,29 +1,87 @@
+import heapq
+import itertools
+import math
 import os
-import random
 import multiprocessing
-
-from misc.io import get_current_code
+import random
+import threading
+import tracemalloc
+from collections.abc import Sequence
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import lru_cache
+from operator import getitem, sub
+from pathlib import Path
+
+import numpy as np
+
+from misc.io import get_solution_path
+from misc.pair_cache import (
+    get_pair_cache_key,
+    load_pair_result,
+    pair_cache_enabled,
+    prune_pair_cache,
+    save_pair_result,
+)
+from misc.pareto import attach_outcome_spaces, deal_efficiency, get_outcome_space
+from misc.profiling import AgentUsage, profiling_enabled, start_memory_tracing
+from misc.sandbox import SandboxedAgentClass, sandbox_enabled
+from misc.scenario_generator import (
+    agent_seed,
+    generate_seeded_scenario_arrays,
+    new_seed,
+    scenario_arrays_to_dicts,
+)
+from misc.scenario_table import ScenarioTable, attach_scenario_table
+from misc.solution_cache import load_solution_class, prune_solution_cache
+
+# Fields of the outcome rows kept for every negotiation, model_0 moving first.
+# cpu_time_0/1 and wall_time_0/1 are the seconds spent in each agent's constructor and
+# offer() calls, peak_memory_0/1 the highest allocation of a call in bytes. These usage
+# columns are only measured with PROFILE_AGENTS=true, None otherwise.
+NEGOTIATION_RESULT_COLUMNS = (
+    "scenario_id",
+    "model_0",
+    "model_1",
+    "outcome",
+    "profit_0",
+    "profit_1",
+    "turns",
+    "cpu_time_0",
+    "cpu_time_1",
+    "wall_time_0",
+    "wall_time_1",
+    "peak_memory_0",
+    "peak_memory_1",
+)
 
 
 def load_agent_class(display_name: str):
     """
     Load the Agent class from a model's solution file.
+    Compiled code and the class itself are cached per content hash, so each worker
+    process executes a solution once no matter how many battle units it plays.
     Returns the Agent class or None if not found/invalid.
     """
-    code = get_current_code(display_name)
-    if code is None:
-        return None
-
     try:
-        namespace = {}
-        exec(code, namespace)
+        return load_solution_class(get_solution_path(display_name))
+    except Exception as e:
+        print(f"Failed to load agent for {display_name}: {e}")
+        return None
 
-        if "Agent" not in namespace:
-            return None
 
-        return namespace["Agent"]
+def _load_model_agent_class(model: dict):
+    """
+    Agent class of a model: from its 'solution_path' when the model dict has one
+    (models that aren't in the solutions folder, e.g. in the benchmarks), else by
+    display name. Units carry the model dicts, so this works in any worker process.
+    """
+    solution_path = model.get("solution_path")
+    if solution_path is None:
+        return load_agent_class(model["display_name"])
+    try:
+        return load_solution_class(Path(solution_path))
     except Exception as e:
-        print(f"Failed to load agent for {display_name}: {e}")
+        print(f"Failed to load agent for {model['display_name']}: {e}")
         return None
 
 
@@ -68,7 +126,7 @@ def validate_code(code: str) -> tuple[bool, str | None]:
         return False, str(e)
 
 
-def generate_negotiation_data():
+def generate_negotiation_data(seed: int | None = None):
     """
     Generate negotiation data with player_0, player_1, and rounds.
 
@@ -77,6 +135,14 @@ def generate_negotiation_data():
     - The total worth (sum of counts[i] * values[i]) is the same for both players
     - Total worth can be 32, 64, or 128
 
+    Scenarios are generated in bulk by misc.scenario_generator, exactly
+    MAX_SCENARIO_DATA of them. They are the first scenarios of the stream of seed,
+    so the same seed always gives the same scenarios. A random seed is used when
+    none is given.
+
+    Each scenario also gets its 'outcome_space' (misc.pareto): the Pareto envelope,
+    Nash point and maximum joint surplus, computed once here for all the pairs.
+
     Returns:
         A tuple of (negotiation_data, total_target_worth) where:
         - negotiation_data: list of scenarios
@@ -89,167 +155,155 @@ def generate_negotiation_data():
     except ValueError:
         max_scenario_data = 20
 
-    def generate_player_values(counts, target_worth):
-        """Generate values list that sums to target_worth when multiplied with counts."""
-        length = len(counts)
-        max_attempts = 1000
-
-        def random_value():
-            """Generate random value with reduced probability of 0."""
-            # 5% chance of 0, 95% chance of 1-10
-            if random.random() < 0.05:
-                return 0
-            return random.randint(1, 10)
-
-        for _ in range(max_attempts):
-            # Generate random values, leaving last 2 to adjust
-            values = [random_value() for _ in range(length - 2)]
-
-            # Calculate current worth without last 2 values
-            current_worth = sum(c * v for c, v in zip(counts[:-2], values))
-
-            # Calculate what remains for the last 2 positions
-            remaining = target_worth - current_worth
-
-            # Get the last two counts
-            c1, c2 = counts[-2], counts[-1]
-
-            # Try to find valid v1, v2 such that c1*v1 + c2*v2 = remaining
-            # Strategy: use parity to guide the search
-            found = False
-
-            # If c2 is even, we have more flexibility; if odd, remaining - c1*v1 must be divisible by c2
-            for v1 in range(11):
-                leftover = remaining - c1 * v1
-                if leftover >= 0 and leftover % c2 == 0:
-                    v2 = leftover // c2
-                    if 0 <= v2 <= 10:
-                        values.append(v1)
-                        values.append(v2)
-                        found = True
-                        break
-
-            if found:
-                # Only return if less than half of the values are zeros
-                zero_count = sum(1 for v in values if v == 0)
-                if zero_count < len(values) / 2:
-                    return values
+    if seed is None:
+        seed = new_seed()
+    arrays = generate_seeded_scenario_arrays(seed, 0, max(0, max_scenario_data))
+    data = attach_outcome_spaces(scenario_arrays_to_dicts(arrays))
+    total_target_worth = int(arrays["worths"].sum())
 
-        return None
+    return data, total_target_worth
 
-    data = []
-    total_target_worth = 0
-    target_worths = [32, 64, 128]
-
-    for _ in range(max_scenario_data):
-        # Random length between 2 and 10
-        length = random.randint(2, 10)
-
-        # Generate random counts (1-5 for each item) - shared by both players
-        counts = [random.randint(1, 5) for _ in range(length)]
-
-        # Random target worth
-        target_worth = random.choice(target_worths)
-
-        # Generate values for both players with same counts and target worth
-        player_0 = generate_player_values(counts, target_worth)
-        if not player_0:
-            continue
-        player_1 = generate_player_values(counts, target_worth)
-        if not player_1:
-            continue
-
-        # Set rounds based on target_worth
-        rounds = target_worth // 4
-
-        data.append(
-            {
-                "counts": counts,
-                "player_0": player_0,
-                "player_1": player_1,
-                "rounds": rounds,
-            }
-        )
 
-        # Add to total_target_worth (same worth for each player in each scenario)
-        total_target_worth += target_worth
+@lru_cache(maxsize=1024)
+def _offer_bounds(counts: tuple) -> tuple:
+    return tuple(tuple(range(count, -1, -1)) + (None,) * (count + 1) for count in counts)
 
-    return data, total_target_worth
+
+def get_offer_bounds(counts) -> tuple:
+    """
+    Per-scenario bounds of the offers: for each item type, a tuple whose item at each
+    quantity an agent may ask for (0 to counts[i]) is what that leaves to the other
+    agent, padded with None so that negative quantities don't wrap around. The bounds
+    of the most recent distinct counts are kept, so they are built once and shared by
+    all the negotiations of a scenario.
+    """
+    return _offer_bounds(tuple(counts))
 
 
-def run_negotiation(agent_0, agent_1, counts, max_rounds, name_0: str, name_1: str):
+def _checked_complement(offer, bounds: tuple) -> list | None:
     """
-    Run a negotiation session between two agents.
+    What a counter-offer leaves to the other agent, or None if the offer is invalid:
+    not a sequence (list, tuple, NumPy array...) of len(counts) integers with
+    0 <= offer[i] <= counts[i]. Integers are anything an index can be: ints, bools
+    and NumPy integers, not floats.
 
-    Returns a tuple (agent_0_items, agent_1_items, outcome, turn_history) where:
-    - agent_0_items: list of items agent_0 gets (or None if no deal)
-    - agent_1_items: list of items agent_1 gets (or None if no deal)
-    - outcome: 'deal', 'no_deal', or 'error'
-    - turn_history: list of dicts with 'round', '{name_0} offer', '{name_1} offer' for each round
+    The bounds lookups compute the complement, as plain ints, and check the
+    quantities in the same C-level pass.
+    """
+    try:
+        if type(offer) is not list:
+            if isinstance(offer, (str, bytes)) or not isinstance(offer, (Sequence, np.ndarray)):
+                return None
+            offer = list(offer)
+        if len(offer) == len(bounds):
+            complement = list(map(getitem, bounds, offer))
+            if None not in complement:
+                return complement
+    except (IndexError, TypeError):
+        # Too big, or not an integer
+        pass
+    return None
+
+
+def _read_offer(response, complement: list | None, counts) -> list:
+    """A counter-offer as the engine read it (a list of ints), the agent's own value if invalid."""
+    if complement is None:
+        return response
+    return list(map(sub, counts, complement))
+
+
+def _negotiate(agent_0, agent_1, counts, max_rounds, offers: list | None = None):
+    """
+    The turn loop of run_negotiation, without building any history.
+
+    When offers is given (a list of 2 * max_rounds None), the counter-offers are
+    recorded in place: offers[2 * r] by agent_0 and offers[2 * r + 1] by agent_1 in
+    round r, None for acceptances and turns that weren't played.
+
+    An invalid counter-offer (see _checked_complement) is a walk-away, like an
+    exception: the outcome is an error of that agent and nobody gets anything.
+
+    Returns a tuple (agent_0_items, agent_1_items, outcome, turns) where turns is the
+    number of rounds recorded in the history (see run_negotiation).
     """
     offer = None  # First offer starts as None
-    turn_history = []
-    offer_key_0 = f"{name_0} offer"
-    offer_key_1 = f"{name_1} offer"
+    bounds = get_offer_bounds(counts)
 
     for round_num in range(max_rounds):
-        round_record = {
-            "round": round_num + 1,
-            offer_key_0: None,
-            offer_key_1: None,
-        }
-
         # Agent 0's turn
         try:
             response_0 = agent_0.offer(offer)
         except Exception as e:
             print(f"Agent 0 error: {e}")
-            return None, None, "error_agent_0", turn_history
+            return None, None, "error_agent_0", round_num
 
         if response_0 is None:
             if offer is not None:
-                # Agent 0 accepts agent 1's offer
-                # offer contains what agent_0 gets
-                agent_0_items = offer
-                agent_1_items = [counts[i] - offer[i] for i in range(len(counts))]
-                round_record[offer_key_0] = None  # Accepted
-                turn_history.append(round_record)
-                return agent_0_items, agent_1_items, "deal", turn_history
-            else:
-                # Agent 0 returned None on the first round (invalid - must make an offer)
-                turn_history.append(round_record)
-                return None, None, "error_agent_0", turn_history
-
-        # Agent 0 made a counter-offer (what agent_0 wants for itself)
-        round_record[offer_key_0] = response_0
-        # Convert to what agent_1 would get
-        offer_for_agent_1 = [counts[i] - response_0[i] for i in range(len(counts))]
-
-        # Agent 1's turn
+                # Agent 0 accepts agent 1's offer, which contains what agent_0 gets
+                return offer, list(map(sub, counts, offer)), "deal", round_num + 1
+            # Agent 0 returned None on the first round (invalid - must make an offer)
+            return None, None, "error_agent_0", round_num + 1
+
+        # Agent 0 made a counter-offer (what agent_0 wants for itself), read as a list
+        # of ints: the complement of its complement
+        offer_for_agent_1 = _checked_complement(response_0, bounds)
+        if offers is not None:
+            offers[2 * round_num] = _read_offer(response_0, offer_for_agent_1, counts)
+        if offer_for_agent_1 is None:
+            print(f"Agent 0 invalid offer: {response_0!r}")
+            return None, None, "error_agent_0", round_num + 1
+
+        # Agent 1's turn, offered what agent_0 leaves
         try:
             response_1 = agent_1.offer(offer_for_agent_1)
         except Exception as e:
             print(f"Agent 1 error: {e}")
-            turn_history.append(round_record)
-            return None, None, "error_agent_1", turn_history
+            return None, None, "error_agent_1", round_num + 1
 
         if response_1 is None:
             # Agent 1 accepts agent 0's offer
-            agent_0_items = response_0
-            agent_1_items = [counts[i] - response_0[i] for i in range(len(counts))]
-            round_record[offer_key_1] = None  # Accepted
-            turn_history.append(round_record)
-            return agent_0_items, agent_1_items, "deal", turn_history
+            return list(map(sub, counts, offer_for_agent_1)), offer_for_agent_1, "deal", round_num + 1
 
         # Agent 1 made a counter-offer (what agent_1 wants for itself)
-        round_record[offer_key_1] = response_1
-        turn_history.append(round_record)
-
-        # Convert to what agent_0 would get for next round
-        offer = [counts[i] - response_1[i] for i in range(len(counts))]
+        offer = _checked_complement(response_1, bounds)
+        if offers is not None:
+            offers[2 * round_num + 1] = _read_offer(response_1, offer, counts)
+        if offer is None:
+            print(f"Agent 1 invalid offer: {response_1!r}")
+            return None, None, "error_agent_1", round_num + 1
 
     # No deal reached within max_rounds
-    return None, None, "no_deal", turn_history
+    return None, None, "no_deal", max_rounds
+
+
+def run_negotiation(agent_0, agent_1, counts, max_rounds, name_0: str, name_1: str):
+    """
+    Run a negotiation session between two agents.
+
+    Returns a tuple (agent_0_items, agent_1_items, outcome, turn_history) where:
+    - agent_0_items: list of items agent_0 gets (or None if no deal)
+    - agent_1_items: list of items agent_1 gets (or None if no deal)
+    - outcome: 'deal', 'no_deal', or 'error'
+    - turn_history: list of dicts with 'round', '{name_0} offer', '{name_1} offer' for each round
+
+    The offers are recorded in a flat preallocated list and the history is built
+    once at the end; use _negotiate directly when it isn't needed.
+    """
+    offers = [None] * (2 * max_rounds)
+    agent_0_items, agent_1_items, outcome, turns = _negotiate(
+        agent_0, agent_1, counts, max_rounds, offers
+    )
+    offer_key_0 = f"{name_0} offer"
+    offer_key_1 = f"{name_1} offer"
+    turn_history = [
+        {
+            "round": round_num + 1,
+            offer_key_0: offers[2 * round_num],
+            offer_key_1: offers[2 * round_num + 1],
+        }
+        for round_num in range(turns)
+    ]
+    return agent_0_items, agent_1_items, outcome, turn_history
 
 
 def calculate_profit(items, values):
@@ -259,121 +313,665 @@ def calculate_profit(items, values):
     return sum(items[i] * values[i] for i in range(len(items)))
 
 
-def _run_model_pair_task(args):
-    model_0, model_1, negotiation_data_local, num_samples_local = args
-    display_name_0 = model_0["display_name"]
-    display_name_1 = model_1["display_name"]
-    Agent0Class = load_agent_class(display_name_0)
-    if Agent0Class is None:
-        print(f"Skipping {display_name_0}: no valid agent found")
-        return {}, {}
-    Agent1Class = load_agent_class(display_name_1)
-    if Agent1Class is None:
-        print(f"Skipping opponent {display_name_1}: no valid agent found")
-        return {}, {}
-
-    pair_results = {
-        display_name_0: {"total_profit": 0},
-        display_name_1: {"total_profit": 0},
-    }
-    pair_battle_scenarios = {}
-    pair_scenario_counts = {}
+class _TimedAgent:
+    """Agent whose constructor and offer() calls are measured by its _TimedAgentClass."""
 
-    canonical_key = tuple(sorted([display_name_0, display_name_1]))
-    pair_battle_scenarios[canonical_key] = []
-    pair_scenario_counts[canonical_key] = {
-        "as_agent_0": 0,
-        "as_agent_1": 0,
-    }
-
-    ref_model = canonical_key[0]
-    max_as_agent_0 = (num_samples_local + 1) // 2
-    max_as_agent_1 = num_samples_local // 2
-
-    orders = [
-        (display_name_0, display_name_1, Agent0Class, Agent1Class),
-        (display_name_1, display_name_0, Agent1Class, Agent0Class),
-    ]
+    def __init__(self, agent, usage: AgentUsage):
+        self._agent = agent
+        self._usage = usage
+
+    def offer(self, o):
+        return self._usage.call(self._agent.offer, o)
+
+
+class _TimedAgentClass:
+    """
+    Agent class wrapper accumulating in usage what its instances' constructor and
+    offer() calls use, like SandboxedAgentClass does in its worker.
+    """
+
+    def __init__(self, AgentClass, trace_memory: bool = False):
+        self.AgentClass = AgentClass
+        self.usage = AgentUsage(trace_memory)
+
+    def __call__(self, me, counts, values, max_rounds) -> _TimedAgent:
+        agent = self.usage.call(self.AgentClass, me, counts, values, max_rounds)
+        return _TimedAgent(agent, self.usage)
 
-    for name_0, name_1, AgentClass0, AgentClass1 in orders:
-        print(f"\nBattle: {name_0} vs {name_1}")
 
-        for scenario in negotiation_data_local:
+def _sample_quota(name_0: str, ref_model: str, num_samples: int) -> int:
+    """Number of samples kept for an order, split between the two positions of a pair."""
+    if name_0 == ref_model:
+        return (num_samples + 1) // 2
+    return num_samples // 2
+
+
+def _play_scenarios(
+    name_0: str,
+    name_1: str,
+    AgentClass0,
+    AgentClass1,
+    scenarios: list[dict],
+    max_samples: int,
+    first_index: int = 0,
+):
+    """
+    Play every scenario in order with name_0 moving first.
+
+    Returns a tuple (profits, samples, outcomes) where profits maps both names to the
+    profit accumulated over the scenarios, samples holds up to max_samples sampled
+    scenarios, in scenario order, and outcomes has a row per scenario (see
+    NEGOTIATION_RESULT_COLUMNS), scenarios being numbered from first_index.
+
+    With SANDBOX_AGENTS=true each agent runs in its own worker process, reused for
+    all the scenarios, and every call is subject to the turn timeout.
+
+    The agents' calls are only measured with PROFILE_AGENTS=true, the usage columns
+    of the outcomes are None otherwise.
+    """
+    profile = profiling_enabled()
+    if sandbox_enabled():
+        with SandboxedAgentClass(
+            AgentClass0, name_0, trace_memory=profile
+        ) as Sandboxed0, SandboxedAgentClass(
+            AgentClass1, name_1, trace_memory=profile
+        ) as Sandboxed1:
+            return _play_scenarios_in_process(
+                name_0,
+                name_1,
+                Sandboxed0,
+                Sandboxed1,
+                scenarios,
+                max_samples,
+                first_index,
+                profile,
+            )
+    if not profile:
+        return _play_scenarios_in_process(
+            name_0, name_1, AgentClass0, AgentClass1, scenarios, max_samples, first_index
+        )
+    # Memory is only traced while the scenarios are played: pool workers outlive them
+    started_tracing = not tracemalloc.is_tracing()
+    start_memory_tracing()
+    try:
+        return _play_scenarios_in_process(
+            name_0,
+            name_1,
+            _TimedAgentClass(AgentClass0, trace_memory=True),
+            _TimedAgentClass(AgentClass1, trace_memory=True),
+            scenarios,
+            max_samples,
+            first_index,
+            profile,
+        )
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+
+def _usage_columns(usages, starts) -> tuple:
+    """
+    (cpu_time_0, cpu_time_1, wall_time_0, wall_time_1, peak_memory_0, peak_memory_1)
+    of an outcome row: what both agents used since starts, None when not measured.
+    """
+    if usages is None:
+        return (None,) * 6
+    (usage_0, usage_1), (start_0, start_1) = usages, starts
+    return (
+        usage_0.cpu_time - start_0[0],
+        usage_1.cpu_time - start_1[0],
+        usage_0.wall_time - start_0[1],
+        usage_1.wall_time - start_1[1],
+        usage_0.peak_memory,
+        usage_1.peak_memory,
+    )
+
+
+def _play_scenarios_in_process(
+    name_0: str,
+    name_1: str,
+    AgentClass0,
+    AgentClass1,
+    scenarios: list[dict],
+    max_samples: int,
+    first_index: int,
+    profile: bool = False,
+):
+    profits = {name_0: 0, name_1: 0}
+    samples = []
+    outcomes = []
+
+    # The agents reseed the random module, leave it as it was for the caller
+    random_state = random.getstate()
+    try:
+        for scenario_id, scenario in enumerate(scenarios, first_index):
             counts = scenario["counts"]
             values_0 = scenario["player_0"]
             values_1 = scenario["player_1"]
             max_rounds = scenario["rounds"]
+            usages = starts = None
+            if profile:
+                usages = (AgentClass0.usage, AgentClass1.usage)
+                for usage in usages:
+                    usage.reset_peak()
+                starts = [(usage.cpu_time, usage.wall_time) for usage in usages]
 
             try:
+                # Agents that use the random module replay the same way for the same
+                # scenario within one engine config (see agent_seed)
+                random.seed(agent_seed(0, counts, values_0, max_rounds))
                 agent_0 = AgentClass0(0, counts, values_0, max_rounds)
+                random.seed(agent_seed(1, counts, values_1, max_rounds))
                 agent_1 = AgentClass1(1, counts, values_1, max_rounds)
 
-                items_0, items_1, outcome, turn_history = run_negotiation(
-                    agent_0,
-                    agent_1,
-                    counts,
-                    max_rounds,
-                    name_0,
-                    name_1,
-                )
+                # The history is only built for the scenarios that are kept as samples
+                sampled = len(samples) < max_samples
+                if sampled:
+                    items_0, items_1, outcome, turn_history = run_negotiation(
+                        agent_0,
+                        agent_1,
+                        counts,
+                        max_rounds,
+                        name_0,
+                        name_1,
+                    )
+                    turns = len(turn_history)
+                else:
+                    items_0, items_1, outcome, turns = _negotiate(
+                        agent_0, agent_1, counts, max_rounds
+                    )
 
                 profit_0 = calculate_profit(items_0, values_0)
                 profit_1 = calculate_profit(items_1, values_1)
 
-                pair_results[name_0]["total_profit"] += profit_0
-                pair_results[name_1]["total_profit"] += profit_1
+                profits[name_0] += profit_0
+                profits[name_1] += profit_1
 
                 print(
-                    f"  Scenario result: {outcome}, profits: {name_0}={profit_0}, {name_1}={profit_1}"
+                    f"  Scenario result: {outcome}, "
+                    f"profits: {name_0}={profit_0}, {name_1}={profit_1}"
+                )
+                outcomes.append(
+                    (
+                        scenario_id,
+                        name_0,
+                        name_1,
+                        outcome,
+                        profit_0,
+                        profit_1,
+                        turns,
+                        *_usage_columns(usages, starts),
+                    )
                 )
 
-                if name_0 == ref_model:
-                    position_key = "as_agent_0"
-                    max_for_position = max_as_agent_0
-                else:
-                    position_key = "as_agent_1"
-                    max_for_position = max_as_agent_1
-
-                if (
-                    num_samples_local > 0
-                    and pair_scenario_counts[canonical_key][position_key]
-                    < max_for_position
-                ):
+                if sampled:
                     scenario_with_names = {
                         "counts": scenario["counts"],
                         "rounds": scenario["rounds"],
                         f"{name_0} values": scenario["player_0"],
                         f"{name_1} values": scenario["player_1"],
                     }
-                    pair_battle_scenarios[canonical_key].append(
+                    efficiency = None
+                    if outcome == "deal":
+                        efficiency = deal_efficiency(
+                            get_outcome_space(scenario), profit_0, profit_1
+                        )
+                    samples.append(
                         {
                             "scenario": scenario_with_names,
                             "outcome": outcome,
                             f"{name_0} profit": profit_0,
                             f"{name_1} profit": profit_1,
+                            "efficiency": efficiency,
                             "turn_history": turn_history,
                         }
                     )
-                    pair_scenario_counts[canonical_key][position_key] += 1
 
             except Exception as e:
                 print(f"  Error in scenario: {e}")
+                outcomes.append(
+                    (
+                        scenario_id,
+                        name_0,
+                        name_1,
+                        "error",
+                        0,
+                        0,
+                        0,
+                        *_usage_columns(usages, starts),
+                    )
+                )
+    finally:
+        random.setstate(random_state)
+
+    return profits, samples, outcomes
+
+
+def _run_battle_unit(args):
+    """
+    Play one unit of work: a single order of a model pair over a contiguous chunk
+    of scenarios.
+
+    Returns (pair_results, canonical_key, name_0, order, start, samples, outcomes),
+    where name_0 is the model moving first. Results are empty when an agent cannot
+    be loaded.
+    """
+    model_0, model_1, order, start, stop, table_name, num_samples_local = args
+    display_name_0 = model_0["display_name"]
+    display_name_1 = model_1["display_name"]
+    canonical_key = tuple(sorted([display_name_0, display_name_1]))
+    first, second = (model_0, model_1) if order == 0 else (model_1, model_0)
+    name_0, name_1 = first["display_name"], second["display_name"]
+
+    AgentClass0 = _load_model_agent_class(first)
+    if AgentClass0 is None:
+        print(f"Skipping {name_0}: no valid agent found")
+        return {}, canonical_key, name_0, order, start, [], []
+    AgentClass1 = _load_model_agent_class(second)
+    if AgentClass1 is None:
+        print(f"Skipping opponent {name_1}: no valid agent found")
+        return {}, canonical_key, name_0, order, start, [], []
+
+    scenarios = attach_scenario_table(table_name).scenarios(start, stop)
+    print(f"\nBattle: {name_0} vs {name_1} (scenarios {start}-{stop - 1})")
+
+    profits, samples, outcomes = _play_scenarios(
+        name_0,
+        name_1,
+        AgentClass0,
+        AgentClass1,
+        scenarios,
+        _sample_quota(name_0, canonical_key[0], num_samples_local),
+        start,
+    )
+    pair_results = {name: {"total_profit": profit} for name, profit in profits.items()}
+    return pair_results, canonical_key, name_0, order, start, samples, outcomes
+
+
+def _estimate_unit_cost(scenarios: list[dict]) -> int:
+    """
+    Rough cost of a unit: the maximum number of offer() calls it can make, weighted
+    by the number of item types (agents that enumerate splits scale with it).
+    """
+    return sum(s["rounds"] * 2 * len(s["counts"]) for s in scenarios)
+
+
+def _model_pairs(models: list[dict]) -> list[tuple[dict, dict]]:
+    """Every pair of models, in list order."""
+    return [
+        (model_0, models[j]) for i, model_0 in enumerate(models) for j in range(i + 1, len(models))
+    ]
+
+
+def _battle_unit_cost(
+    unit: tuple, negotiation_data: list[dict], agent_costs: dict[str, float] | None = None
+) -> float:
+    """
+    Estimated cost of a unit: the cost of its scenarios (see _estimate_unit_cost) times
+    the summed agent_costs of both models, e.g. their CPU seconds per negotiation in a
+    previous session. Models without a cost get the mean of the known ones, so without
+    agent_costs units are compared by their scenarios only.
+    """
+    model_0, model_1, _, start, stop = unit[:5]
+    agent_costs = agent_costs or {}
+    default_cost = sum(agent_costs.values()) / len(agent_costs) if agent_costs else 1.0
+    pair_cost = sum(
+        agent_costs.get(model["display_name"], default_cost) for model in (model_0, model_1)
+    )
+    return _estimate_unit_cost(negotiation_data[start:stop]) * pair_cost
+
+
+def _build_battle_units(
+    pairs: list[tuple[dict, dict]],
+    negotiation_data: list[dict],
+    num_samples: int,
+    chunk_size: int,
+    table_name: str,
+    agent_costs: dict[str, float] | None = None,
+) -> list[tuple]:
+    """
+    Split the battles of some model pairs into (pair, order, scenario-chunk) units,
+    most expensive first (see _battle_unit_cost) so that the long units start early
+    and the small ones fill the tail. Units only reference their scenarios by range
+    in the shared scenario table.
+    """
+    units = []
+    for model_0, model_1 in pairs:
+        for order in (0, 1):
+            for start in range(0, len(negotiation_data), chunk_size):
+                stop = min(start + chunk_size, len(negotiation_data))
+                units.append((model_0, model_1, order, start, stop, table_name, num_samples))
 
-    return pair_results, pair_battle_scenarios
+    units.sort(
+        key=lambda unit: _battle_unit_cost(unit, negotiation_data, agent_costs), reverse=True
+    )
+    return units
+
+
+def _get_chunk_size(num_scenarios: int, num_pair_orders: int, processes: int) -> int:
+    """
+    Scenarios per unit. Defaults to enough units for roughly 4 per process, which
+    keeps every worker busy until the end without paying agent loading per scenario.
+    Can be set via SCENARIO_CHUNK_SIZE env var.
+    """
+    try:
+        chunk_size = int(os.getenv("SCENARIO_CHUNK_SIZE", "0"))
+    except ValueError:
+        chunk_size = 0
+    if chunk_size > 0:
+        return chunk_size
+
+    target_units = processes * 4
+    total_scenarios = num_scenarios * num_pair_orders
+    return max(1, min(num_scenarios, math.ceil(total_scenarios / max(1, target_units))))
+
+
+def _merge_battle_unit(results, unit_samples, pair_totals, pair_outcomes, unit_result):
+    """
+    Merge the result of a battle unit into the tournament accumulators. pair_totals
+    keeps the results of each pair on its own, None for pairs with a failed unit,
+    and pair_outcomes the per-scenario outcome rows of each pair.
+    """
+    pair_results, canonical_key, name_0, order, start, samples, outcomes = unit_result
+    for name, data in pair_results.items():
+        if name in results:
+            results[name]["total_profit"] += data["total_profit"]
+        else:
+            results[name] = {"total_profit": data["total_profit"]}
+    unit_samples.setdefault(canonical_key, []).append((order, start, name_0, samples))
+    pair_outcomes.setdefault(canonical_key, []).extend(outcomes)
+
+    if not pair_results:
+        pair_totals[canonical_key] = None
+    elif pair_totals.setdefault(canonical_key, {}) is not None:
+        for name, data in pair_results.items():
+            totals = pair_totals[canonical_key].setdefault(name, {"total_profit": 0})
+            totals["total_profit"] += data["total_profit"]
+
+
+def _collect_battle_scenarios(unit_samples, num_samples: int) -> dict:
+    """
+    Rebuild per-pair samples from the chunks, keeping the same scenarios a serial
+    run would: the first ones of each order, up to the quota of that position.
+    """
+    battle_scenarios = {}
+    for canonical_key, chunks in unit_samples.items():
+        chunks.sort(key=lambda chunk: (chunk[0], chunk[1]))
+        per_order = {}
+        for order, _, name_0, samples in chunks:
+            per_order.setdefault(order, (name_0, []))[1].extend(samples)
+
+        battle_scenarios[canonical_key] = []
+        for order in sorted(per_order):
+            name_0, samples = per_order[order]
+            quota = _sample_quota(name_0, canonical_key[0], num_samples)
+            battle_scenarios[canonical_key].extend(samples[:quota])
+    return battle_scenarios
+
+
+class BattleScheduler:
+    """
+    Incremental tournament: models are added one at a time and the battles of each
+    new model against every model already added are dispatched right away.
+
+    This lets job.py start battling the models that are ready (the unchanged top
+    model, the human, the first LLMs to answer) while slower LLMs are still
+    generating. results() waits for every battle and assembles the tournament.
+
+    The work is split into (pair, order, scenario-chunk) units that are handed out
+    one at a time to idle workers, so a single slow pair doesn't leave the other
+    processes idle at the end of the tournament. With a single process, units run
+    in results() instead, so add_model() never blocks. Pending units, whichever model
+    they came with, are handed out by decreasing estimated cost, weighted by
+    agent_costs when given (see _battle_unit_cost).
+
+    When the seed the negotiation data was generated from is given, the results of
+    each pair are cached by the content of both solutions, the scenario set and the
+    engine config, and only the pairs where a side changed are played again (disable
+    with PAIR_CACHE=false). Only give it for a seed that comes back, e.g. a fixed
+    TOURNAMENT_SEED: results of one-off scenario sets would never be reused.
+
+    Args:
+        negotiation_data: List of negotiation scenarios with 'counts', 'player_0', 'player_1', 'rounds'
+        num_samples: Maximum number of samples to store per model pair (default 5, can be set via NUM_SAMPLES env var)
+        seed: Seed negotiation_data was generated from, enables the pair results cache
+        num_models: Expected number of models, used to size the units
+        agent_costs: Relative cost of each model's agent by display name, e.g. its CPU
+            seconds per negotiation in a previous session, used to order the units
+    """
+
+    def __init__(
+        self,
+        negotiation_data: list[dict],
+        num_samples: int = 5,
+        seed: int | None = None,
+        num_models: int = 2,
+        agent_costs: dict[str, float] | None = None,
+    ):
+        try:
+            num_samples = int(os.getenv("NUM_SAMPLES", str(num_samples)))
+        except ValueError:
+            pass
+
+        max_processes = os.getenv("NUM_PROCESSES")
+        try:
+            max_processes = int(max_processes) if max_processes is not None else None
+        except ValueError:
+            max_processes = None
+
+        cpu_count = multiprocessing.cpu_count()
+        if max_processes is None:
+            processes = cpu_count
+        else:
+            processes = max(1, min(max_processes, cpu_count))
+
+        self.negotiation_data = negotiation_data
+        self.num_samples = num_samples
+        self.seed = seed
+        self.agent_costs = agent_costs or {}
+        self.processes = processes
+        self.chunk_size = _get_chunk_size(
+            len(negotiation_data), num_models * (num_models - 1), processes
+        )
+        self.models = []
+        self._results = {}
+        self._unit_samples = {}
+        self._pair_totals = {}
+        self._pair_outcomes = {}
+        self._cached_pairs = {}
+        self._pair_keys = {}
+        # Units not handed out yet, a heap of (-cost, order added, unit)
+        self._pending_units = []
+        self._unit_order = itertools.count()
+        self._futures = []
+        self._running = set()
+        # Workers are fed from the executor's thread as they become free
+        self._lock = threading.RLock()
+        # Scenarios are packed once in shared memory instead of being pickled into every
+        # unit. Created before the workers, so that nothing is left running if it fails.
+        self._table = ScenarioTable.create(negotiation_data)
+        # Not a multiprocessing.Pool: its workers are daemonic and can't start the
+        # sandboxed agent processes. Only one unit per worker is submitted at a time,
+        # so that a costly unit added later still overtakes the cheap ones.
+        try:
+            self._executor = ProcessPoolExecutor(max_workers=processes) if processes > 1 else None
+        except Exception:
+            self._table.close()
+            self._table.unlink()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add_model(self, model: dict) -> bool:
+        """
+        Add a model and dispatch its battles against every model added before.
+        Returns False, leaving the tournament as it was, if the model couldn't be added.
+        """
+        display_name = model.get("display_name")
+        try:
+            pairs = []
+            for ready_model in self.models:
+                canonical_key = tuple(sorted([ready_model["display_name"], display_name]))
+                if not self._load_cached_pair(canonical_key):
+                    pairs.append((ready_model, model))
+            units = _build_battle_units(
+                pairs,
+                self.negotiation_data,
+                self.num_samples,
+                self.chunk_size,
+                self._table.name,
+                self.agent_costs,
+            )
+        except Exception as e:
+            print(f"Failed to add {display_name} to the battles, skipping it: {e}")
+            for canonical_key in list(self._cached_pairs) + list(self._pair_keys):
+                if display_name in canonical_key:
+                    self._cached_pairs.pop(canonical_key, None)
+                    self._pair_keys.pop(canonical_key, None)
+            return False
+
+        self._results.setdefault(display_name, {"total_profit": 0})
+        self.models.append(model)
+        with self._lock:
+            for unit in units:
+                cost = _battle_unit_cost(unit, self.negotiation_data, self.agent_costs)
+                heapq.heappush(self._pending_units, (-cost, next(self._unit_order), unit))
+        self._submit_pending()
+        return True
+
+    def _submit_pending(self):
+        """Hand the most expensive pending units to the idle workers, if any."""
+        with self._lock:
+            while (
+                self._executor is not None
+                and self._pending_units
+                and len(self._running) < self.processes
+            ):
+                _, _, unit = heapq.heappop(self._pending_units)
+                future = self._executor.submit(_run_battle_unit, unit)
+                self._running.add(future)
+                self._futures.append(future)
+                future.add_done_callback(self._unit_done)
+
+    def _unit_done(self, future):
+        """Called from the executor's thread when a unit is done: start the next one."""
+        with self._lock:
+            self._running.discard(future)
+            if not future.cancelled():
+                self._submit_pending()
+
+    def _load_cached_pair(self, canonical_key: tuple[str, str]) -> bool:
+        """Look up the cached results of a pair, return whether it was found."""
+        if self.seed is None or not pair_cache_enabled():
+            return False
+
+        key = get_pair_cache_key(
+            canonical_key, self.seed, len(self.negotiation_data), self.num_samples
+        )
+        if key is None:
+            return False
+        pair_result = load_pair_result(key)
+        if pair_result is None:
+            self._pair_keys[canonical_key] = key
+            return False
+        print(f"Reusing cached results of {canonical_key[0]} vs {canonical_key[1]}")
+        self._cached_pairs[canonical_key] = pair_result
+        return True
+
+    def results(self) -> tuple[dict, dict]:
+        """
+        Wait for every battle and return the tournament, see run_battles.
+        Call it once, after the last model was added.
+        """
+        while self._executor is None and self._pending_units:
+            _, _, unit = heapq.heappop(self._pending_units)
+            _merge_battle_unit(
+                self._results,
+                self._unit_samples,
+                self._pair_totals,
+                self._pair_outcomes,
+                _run_battle_unit(unit),
+            )
+        while True:
+            with self._lock:
+                self._submit_pending()
+                running = set(self._running)
+            if not running:
+                break
+            wait(running, return_when=FIRST_COMPLETED)
+        for future in self._futures:
+            _merge_battle_unit(
+                self._results,
+                self._unit_samples,
+                self._pair_totals,
+                self._pair_outcomes,
+                future.result(),
+            )
+        self._futures = []
+
+        battle_scenarios = _collect_battle_scenarios(self._unit_samples, self.num_samples)
+        for canonical_key, key in self._pair_keys.items():
+            if self._pair_totals.get(canonical_key) is not None:
+                save_pair_result(
+                    key,
+                    self._pair_totals[canonical_key],
+                    battle_scenarios[canonical_key],
+                    self._pair_outcomes[canonical_key],
+                )
+        if self.seed is not None and pair_cache_enabled():
+            prune_pair_cache()
+        prune_solution_cache()
+
+        for canonical_key, (pair_results, samples, outcomes) in self._cached_pairs.items():
+            for name, data in pair_results.items():
+                self._results[name]["total_profit"] += data["total_profit"]
+            battle_scenarios[canonical_key] = samples
+            self._pair_outcomes[canonical_key] = [tuple(row) for row in outcomes]
+
+        return self._results, battle_scenarios
+
+    def negotiation_results(self) -> list[tuple]:
+        """
+        Outcome rows of every negotiation of the tournament, played or cached, with
+        the fields of NEGOTIATION_RESULT_COLUMNS. Available after results().
+        """
+        return [
+            row
+            for canonical_key in sorted(self._pair_outcomes)
+            for row in sorted(self._pair_outcomes[canonical_key], key=lambda row: (row[1], row[0]))
+        ]
+
+    def close(self):
+        """Stop the workers and free the shared scenario table."""
+        with self._lock:
+            self._pending_units = []
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        if self._table is not None:
+            self._table.close()
+            self._table.unlink()
+            self._table = None
 
 
 def run_battles(
     models: list[dict],
     negotiation_data: list[dict],
     num_samples: int = 5,
+    seed: int | None = None,
 ) -> tuple[dict, dict]:
     """
-    Run negotiation battles between all pairs of models.
+    Run negotiation battles between all pairs of models, see BattleScheduler.
 
     Args:
         models: List of model dicts with 'display_name' and optionally 'model_name' or 'is_human'
         negotiation_data: List of negotiation scenarios with 'counts', 'player_0', 'player_1', 'rounds'
         num_samples: Maximum number of samples to store per model pair (default 5, can be set via NUM_SAMPLES env var)
+        seed: Seed negotiation_data was generated from, enables the pair results cache
 
     Returns:
         A tuple of:
@@ -386,64 +984,11 @@ def run_battles(
             - 'outcome': 'deal', 'no_deal', or error type
             - '{model_x} profit': profit achieved by model_x
             - '{model_y} profit': profit achieved by model_y
+            - 'efficiency': for deals, how close they are to the Pareto frontier, the
+              maximum joint surplus and the Nash point (see misc.pareto.deal_efficiency)
             - 'turn_history': list of offers per round with '{model_name} offer' keys
     """
-    try:
-        num_samples = int(os.getenv("NUM_SAMPLES", str(num_samples)))
-    except ValueError:
-        pass
-
-    results = {}
-    battle_scenarios = {}
-    for model in models:
-        display_name = model["display_name"]
-        results[display_name] = {
-            "total_profit": 0,
-        }
-
-    tasks = []
-    for i, model_0 in enumerate(models):
-        for j in range(i + 1, len(models)):
-            model_1 = models[j]
-            tasks.append((model_0, model_1, negotiation_data, num_samples))
-
-    max_processes = os.getenv("NUM_PROCESSES")
-    try:
-        max_processes = int(max_processes) if max_processes is not None else None
-    except ValueError:
-        max_processes = None
-
-    cpu_count = multiprocessing.cpu_count()
-    if max_processes is None:
-        processes = min(8, cpu_count)
-    else:
-        processes = max(1, min(max_processes, cpu_count))
-
-    if processes == 1 or not tasks:
-        for task in tasks:
-            pair_results, pair_battle_scenarios = _run_model_pair_task(task)
-            for name, data in pair_results.items():
-                if name in results:
-                    results[name]["total_profit"] += data["total_profit"]
-                else:
-                    results[name] = {"total_profit": data["total_profit"]}
-            for key, scenarios in pair_battle_scenarios.items():
-                if key not in battle_scenarios:
-                    battle_scenarios[key] = []
-                battle_scenarios[key].extend(scenarios)
-    else:
-        with multiprocessing.Pool(processes=processes) as pool:
-            for pair_results, pair_battle_scenarios in pool.imap_unordered(
-                _run_model_pair_task, tasks
-            ):
-                for name, data in pair_results.items():
-                    if name in results:
-                        results[name]["total_profit"] += data["total_profit"]
-                    else:
-                        results[name] = {"total_profit": data["total_profit"]}
-                for key, scenarios in pair_battle_scenarios.items():
-                    if key not in battle_scenarios:
-                        battle_scenarios[key] = []
-                    battle_scenarios[key].extend(scenarios)
-
-    return results, battle_scenarios
+    with BattleScheduler(negotiation_data, num_samples, seed, num_models=len(models)) as scheduler:
+        for model in models:
+            scheduler.add_model(model)
+        return scheduler.results()
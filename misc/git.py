@@ -1,3 +1,4 @@
+from functools import lru_cache
 from pathlib import Path
 import os
 import git
@@ -68,18 +69,12 @@ def push():
     return commit_hash
 
 
-def get_code_link_at_commit(commit_hash: str, model_name: str) -> str:
+@lru_cache(maxsize=None)
+def get_origin_base_url() -> str:
     """
-    Generate a GitHub link to the model's solution file at a specific commit.
-
-    Args:
-        commit_hash: The git commit hash
-        model_name: The model's display name (used as the filename)
-
-    Returns:
-        A GitHub URL like: https://github.com/owner/repo/blob/{commit_hash}/solutions/{model_name}.py
+    HTTPS URL of the origin repository, e.g. https://github.com/owner/repo.
+    Resolved once per process.
     """
-    # Get the origin URL
     origin_url = _repo.remotes.origin.url
 
     # Convert SSH URL to HTTPS if needed: git@github.com:owner/repo.git -> https://github.com/owner/repo
@@ -89,44 +84,56 @@ def get_code_link_at_commit(commit_hash: str, model_name: str) -> str:
     # Remove .git suffix if present
     if origin_url.endswith(".git"):
         origin_url = origin_url[:-4]
+    return origin_url
 
-    sanitized_display_name = sanitize(model_name)
-    # Build the link
-    code_link = f"{origin_url}/blob/{commit_hash}/solutions/{sanitized_display_name}.py"
-    return code_link
 
-
-def get_solution_code_link(model_name: str) -> str:
-    origin_url = _repo.remotes.origin.url
-    if origin_url.startswith("git@github.com:"):
-        origin_url = origin_url.replace("git@github.com:", "https://github.com/")
-    if origin_url.endswith(".git"):
-        origin_url = origin_url[:-4]
+@lru_cache(maxsize=None)
+def get_branch_name() -> str:
+    """Name of the checked out branch ('main' on a detached HEAD). Resolved once per process."""
     try:
-        branch = _repo.active_branch.name
+        return _repo.active_branch.name
     except Exception:
-        branch = "main"
-    sanitized_display_name = sanitize(model_name)
-    return f"{origin_url}/blob/{branch}/solutions/{sanitized_display_name}.py"
+        return "main"
+
+
+def build_code_link(base_url: str, ref: str, model_name: str) -> str:
+    """
+    Link to a model's solution file at a git ref (commit hash or branch), like:
+    https://github.com/owner/repo/blob/{ref}/solutions/{model_name}.py
+    """
+    return f"{base_url}/blob/{ref}/solutions/{sanitize(model_name)}.py"
 
 
-# Get the newest commit for each file in the solutions folder and return the newest commit overall
-def get_newest_commit_in_solutions() -> str:
+def get_code_link_at_commit(commit_hash: str, model_name: str) -> str:
     """
-    Go through the latest commit for each file in the solutions folder and return the newest commit hash.
+    Generate a GitHub link to the model's solution file at a specific commit.
+
+    Args:
+        commit_hash: The git commit hash
+        model_name: The model's display name (used as the filename)
+
     Returns:
-        The newest commit hash (str) among all files in the solutions folder.
+        A GitHub URL like: https://github.com/owner/repo/blob/{commit_hash}/solutions/{model_name}.py
+    """
+    return build_code_link(get_origin_base_url(), commit_hash, model_name)
+
+
+def get_solution_code_link(model_name: str) -> str:
+    """GitHub link to the model's solution file on the current branch."""
+    return build_code_link(get_origin_base_url(), get_branch_name(), model_name)
+
+
+def get_newest_commit_in_solutions() -> str | None:
+    """
+    Return the hash of the newest commit that touched a file of the solutions folder.
+
+    A single history walk (git rev-list) limited to the current solution files, which
+    stops at the first match: the cost doesn't grow with the number of solutions or
+    the length of the history.
     """
     solutions_path = _repo_path / "solutions"
-    newest_commit = None
-    newest_time = None
-    for file in solutions_path.glob("*.py"):
-        # Get the latest commit for this file
-        commits = list(_repo.iter_commits(paths=str(file), max_count=1))
-        if commits:
-            commit = commits[0]
-            commit_time = commit.committed_datetime
-            if newest_time is None or commit_time > newest_time:
-                newest_time = commit_time
-                newest_commit = commit.hexsha
-    return newest_commit
+    paths = [str(file.relative_to(_repo_path)) for file in sorted(solutions_path.glob("*.py"))]
+    if not paths:
+        return None
+    newest_commit = _repo.git.rev_list("HEAD", "--max-count=1", "--", *paths)
+    return newest_commit or None
@@ -20,12 +20,15 @@ def load_prompts():
     return prompts
 
 
+def get_solution_path(display_name: str) -> Path:
+    """Get the path of a model's solution file (which may not exist yet)."""
+    sanitized_display_name = sanitize(display_name)
+    return Path(__file__).parent.parent / "solutions" / f"{sanitized_display_name}.py"
+
+
 def get_current_code(display_name: str) -> str | None:
     """Get the current code for a model from the solutions folder."""
-    sanitized_display_name = sanitize(display_name)
-    solutions_path = (
-        Path(__file__).parent.parent / "solutions" / f"{sanitized_display_name}.py"
-    )
+    solutions_path = get_solution_path(display_name)
     if solutions_path.exists():
         with open(solutions_path, "r") as f:
             return f.read()
@@ -42,10 +45,7 @@ def get_code_example() -> str:
 def save_solution(display_name: str, code: str) -> None:
     """Save the validated code to the solutions folder."""
 
-    sanitized_display_name = sanitize(display_name)
-    solutions_path = (
-        Path(__file__).parent.parent / "solutions" / f"{sanitized_display_name}.py"
-    )
+    solutions_path = get_solution_path(display_name)
     with open(solutions_path, "w") as f:
         f.write(code)
     print(f"Saved solution to {solutions_path}")
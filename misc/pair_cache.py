@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from misc.io import get_solution_path
+from misc.profiling import profiling_enabled
+from misc.sandbox import get_turn_timeout, sandbox_enabled
+from misc.solution_cache import get_file_hash
+
+# Results of model pairs, one JSON file per pair named after its cache key
+_default_cache_dir = Path(__file__).parent.parent / ".cache" / "pairs"
+# Part of the keys, bump it when what is cached or the rules change (e.g. the outcome
+# row fields, offer validation, the scenarios generated from a seed, the engine config)
+_CACHE_FORMAT = 7
+
+
+def get_cache_dir() -> Path:
+    """Directory of the pair results cache, can be set via PAIR_CACHE_DIR env var."""
+    return Path(os.getenv("PAIR_CACHE_DIR", str(_default_cache_dir)))
+
+
+def pair_cache_enabled() -> bool:
+    """Whether pair results are cached (PAIR_CACHE env var, on by default)."""
+    return os.getenv("PAIR_CACHE", "true").lower() == "true"
+
+
+def get_max_age_days() -> float:
+    """Days a cached pair is kept without being used, can be set via PAIR_CACHE_MAX_AGE_DAYS env var."""
+    try:
+        return float(os.getenv("PAIR_CACHE_MAX_AGE_DAYS", "30"))
+    except ValueError:
+        return 30.0
+
+
+def get_max_entries() -> int:
+    """Maximum number of cached pairs, can be set via PAIR_CACHE_MAX_ENTRIES env var."""
+    try:
+        return int(os.getenv("PAIR_CACHE_MAX_ENTRIES", "2000"))
+    except ValueError:
+        return 2000
+
+
+def _engine_config() -> str:
+    """
+    The engine settings that change how a pair plays (timeouts and crashes are errors)
+    or what its outcome rows hold (the agents' usage is None unless profiled).
+    """
+    if sandbox_enabled():
+        engine = f"sandbox:{get_turn_timeout()}"
+    else:
+        engine = "in_process"
+    return f"{engine}:profile:{profiling_enabled()}"
+
+
+def get_pair_cache_key(
+    canonical_key: tuple[str, str], seed: int, num_scenarios: int, num_samples: int
+) -> str | None:
+    """
+    Cache key of a pair's results: both models' names and solution content hashes,
+    the scenario set (seed and count) and the engine config. The pair is played the
+    same way as long as none of them changes. None when a solution file is missing.
+    """
+    parts = []
+    for display_name in canonical_key:
+        code_hash = get_file_hash(get_solution_path(display_name))
+        if code_hash is None:
+            return None
+        parts.append(f"{display_name}:{code_hash}")
+    parts.append(f"{seed}:{num_scenarios}:{num_samples}")
+    parts.append(f"engine:{_engine_config()}")
+    parts.append(f"format:{_CACHE_FORMAT}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def load_pair_result(key: str) -> tuple[dict, list, list] | None:
+    """The cached (pair_results, samples, outcomes) of a pair, or None if not cached."""
+    path = get_cache_dir() / f"{key}.json"
+    try:
+        with open(path, "r") as f:
+            cached = json.load(f)
+        # The modification time is the last use, see prune_pair_cache
+        os.utime(path)
+        return cached["results"], cached["samples"], cached["outcomes"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_pair_result(key: str, pair_results: dict, samples: list, outcomes: list):
+    """Cache the results, samples and per-scenario outcome rows of a pair."""
+    path = get_cache_dir() / f"{key}.json"
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename so that a concurrent run never reads a partial file
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"results": pair_results, "samples": samples, "outcomes": outcomes}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Failed to cache pair results {key}: {e}")
+
+
+def prune_pair_cache():
+    """
+    Delete the cached pairs that weren't used for PAIR_CACHE_MAX_AGE_DAYS, then the
+    least recently used ones beyond PAIR_CACHE_MAX_ENTRIES.
+    """
+    entries = []
+    for path in get_cache_dir().glob("*.json"):
+        try:
+            entries.append((path.stat().st_mtime, path))
+        except OSError:
+            pass
+    entries.sort(reverse=True)
+
+    oldest = time.time() - get_max_age_days() * 86400
+    stale = [path for i, (mtime, path) in enumerate(entries) if mtime < oldest or i >= get_max_entries()]
+    for path in stale:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+    if stale:
+        print(f"Pruned {len(stale)} cached pair results")
@@ -0,0 +1,117 @@
+from functools import lru_cache
+
+# Outcome spaces of scenarios that arrive without one, kept for the most recently
+# used scenarios only (generated scenarios carry theirs, see attach_outcome_spaces)
+_MAX_CACHED_OUTCOME_SPACES = 4096
+
+
+def compute_outcome_space(counts: list[int], values_0: list[int], values_1: list[int]) -> dict:
+    """
+    The outcome space of a scenario: every split of the items and what it is worth
+    to each player.
+
+    A DP over item types keeps, for each value player 0 can get, the most player 1
+    can get alongside it. Item values are small integers, so there are at most
+    total worth + 1 states whatever the number of splits.
+
+    Returns a dict with:
+    - 'envelope': envelope[a] is the most player 1 can get in a split where player 0
+      gets at least a, for a in 0..player 0's total worth (non increasing)
+    - 'nash_point': [a, b] maximizing a * b (no deal is worth 0 to both)
+    - 'max_joint_surplus': the largest a + b of any split
+    """
+    total_0 = sum(c * v for c, v in zip(counts, values_0))
+    # best_1[a] is the most player 1 gets when player 0 gets exactly a, -1 if unreachable
+    best_1 = [-1] * (total_0 + 1)
+    best_1[0] = 0
+    reachable = 0
+    for count, value_0, value_1 in zip(counts, values_0, values_1):
+        new_best_1 = [-1] * (total_0 + 1)
+        for a in range(reachable + 1):
+            if best_1[a] < 0:
+                continue
+            for taken in range(count + 1):
+                b = best_1[a] + (count - taken) * value_1
+                target = a + taken * value_0
+                if b > new_best_1[target]:
+                    new_best_1[target] = b
+        best_1 = new_best_1
+        reachable += count * value_0
+
+    envelope = [0] * (total_0 + 1)
+    best = -1
+    for a in range(total_0, -1, -1):
+        best = max(best, best_1[a])
+        envelope[a] = best
+
+    nash_point = max(
+        ([a, b] for a, b in enumerate(best_1) if b >= 0), key=lambda point: point[0] * point[1]
+    )
+    max_joint_surplus = max(a + b for a, b in enumerate(best_1) if b >= 0)
+    return {
+        "envelope": envelope,
+        "nash_point": nash_point,
+        "max_joint_surplus": max_joint_surplus,
+    }
+
+
+@lru_cache(maxsize=_MAX_CACHED_OUTCOME_SPACES)
+def _cached_outcome_space(counts: tuple, values_0: tuple, values_1: tuple) -> dict:
+    return compute_outcome_space(counts, values_0, values_1)
+
+
+def get_outcome_space(scenario: dict) -> dict:
+    """
+    The outcome space of a scenario dict: the one attached to it when there is one,
+    otherwise computed and kept in a bounded cache (the rounds don't change it).
+    """
+    outcome_space = scenario.get("outcome_space")
+    if outcome_space is not None:
+        return outcome_space
+    return _cached_outcome_space(
+        tuple(scenario["counts"]), tuple(scenario["player_0"]), tuple(scenario["player_1"])
+    )
+
+
+def attach_outcome_spaces(negotiation_data: list[dict]) -> list[dict]:
+    """Compute the outcome space of every scenario and attach it as 'outcome_space'."""
+    for scenario in negotiation_data:
+        if scenario.get("outcome_space") is None:
+            scenario["outcome_space"] = compute_outcome_space(
+                scenario["counts"], scenario["player_0"], scenario["player_1"]
+            )
+    return negotiation_data
+
+
+def pareto_frontier(outcome_space: dict) -> list[tuple[int, int]]:
+    """The Pareto optimal (value_0, value_1) splits, by increasing value_0."""
+    envelope = outcome_space["envelope"]
+    return [
+        (a, envelope[a])
+        for a in range(len(envelope))
+        if a == len(envelope) - 1 or envelope[a + 1] < envelope[a]
+    ]
+
+
+def deal_efficiency(outcome_space: dict, profit_0: int, profit_1: int) -> dict | None:
+    """
+    How good a deal is for the pair, in O(1) from the precomputed outcome space.
+    None when the deal isn't a split of the items (an agent offered more than exists).
+
+    - 'pareto_gap': how much more player 1 could have got without player 0 getting
+      less; 0 when the deal is on the Pareto frontier
+    - 'joint_efficiency': share of the maximum joint surplus the deal reached
+    - 'nash_efficiency': the deal's Nash product relative to the Nash point's
+    """
+    envelope = outcome_space["envelope"]
+    if not 0 <= profit_0 < len(envelope) or profit_1 < 0:
+        return None
+
+    nash_0, nash_1 = outcome_space["nash_point"]
+    nash_product = nash_0 * nash_1
+    max_joint_surplus = outcome_space["max_joint_surplus"]
+    return {
+        "pareto_gap": envelope[profit_0] - profit_1,
+        "joint_efficiency": (profit_0 + profit_1) / max_joint_surplus if max_joint_surplus else 1.0,
+        "nash_efficiency": profit_0 * profit_1 / nash_product if nash_product else 1.0,
+    }
@@ -0,0 +1,95 @@
+import os
+import time
+import tracemalloc
+
+
+def profiling_enabled() -> bool:
+    """
+    Whether agents' calls are measured (PROFILE_AGENTS env var, off by default): CPU
+    and wall time, and peak memory with tracemalloc, which slows every allocation down.
+    """
+    return os.getenv("PROFILE_AGENTS", "false").lower() == "true"
+
+
+def start_memory_tracing():
+    """Start tracemalloc in this process if it isn't already."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+class AgentUsage:
+    """
+    Resources used by the calls of an agent: CPU and wall seconds, summed, and the
+    peak memory allocated during a call in bytes (None when memory isn't traced).
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.cpu_time = 0.0
+        self.wall_time = 0.0
+        self.peak_memory = 0 if trace_memory else None
+
+    def call(self, fn, *args):
+        """Call fn(*args) and add what it used."""
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            memory_start = tracemalloc.get_traced_memory()[0]
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            peak_memory = None
+            if self.trace_memory:
+                peak_memory = tracemalloc.get_traced_memory()[1] - memory_start
+            self.add(time.process_time() - cpu_start, time.perf_counter() - wall_start, peak_memory)
+
+    def add(self, cpu_time: float, wall_time: float, peak_memory: int | None):
+        """Add the usage of a call measured elsewhere (e.g. in a sandbox worker)."""
+        self.cpu_time += cpu_time
+        self.wall_time += wall_time
+        if self.trace_memory and peak_memory is not None:
+            self.peak_memory = max(self.peak_memory, peak_memory)
+
+    def reset_peak(self):
+        """Start measuring the peak memory again, e.g. for a new scenario."""
+        if self.trace_memory:
+            self.peak_memory = 0
+
+
+def summarize_agent_usage(rows: list[tuple]) -> dict:
+    """
+    Aggregate negotiation outcome rows (see NEGOTIATION_RESULT_COLUMNS) per model.
+
+    Returns a dict mapping model names to dicts with:
+        - 'negotiations': number of negotiations played
+        - 'cpu_time', 'wall_time': seconds spent in the agent's calls, summed
+        - 'max_wall_time': wall seconds of its slowest negotiation
+        - 'peak_memory': highest peak allocation of a call in bytes (None if not traced)
+    Rows without usage (PROFILE_AGENTS off) are skipped.
+    """
+    summary = {}
+    for row in rows:
+        for name, cpu_time, wall_time, peak_memory in (
+            (row[1], row[7], row[9], row[11]),
+            (row[2], row[8], row[10], row[12]),
+        ):
+            if cpu_time is None:
+                continue
+            stats = summary.setdefault(
+                name,
+                {
+                    "negotiations": 0,
+                    "cpu_time": 0.0,
+                    "wall_time": 0.0,
+                    "max_wall_time": 0.0,
+                    "peak_memory": None,
+                },
+            )
+            stats["negotiations"] += 1
+            stats["cpu_time"] += cpu_time
+            stats["wall_time"] += wall_time
+            stats["max_wall_time"] = max(stats["max_wall_time"], wall_time)
+            if peak_memory is not None:
+                stats["peak_memory"] = max(stats["peak_memory"] or 0, peak_memory)
+    return summary
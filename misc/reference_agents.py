@@ -0,0 +1,261 @@
+import numpy as np
+
+from misc.io import get_solution_path
+from misc.solution_cache import get_file_hash
+
+# NumPy ports, as BatchAgents (see misc.batch_engine), of the anchor solutions that are
+# played every session. They make the same moves as the Agent of the solution file:
+# the same decisions on the same floats, in the same order.
+EST_ERROR_MULTIPLIER = 0.6
+
+
+def _make_offer_of_undesirables(counts, values, no_value_offer_count):
+    """
+    make_offer_of_undesirables of the human solution on every lane: request everything
+    but no_value_offer_count (K,) of the items worth nothing, given away in item order.
+    """
+    worthless = np.where(values == 0, counts, 0)
+    given_before = np.cumsum(worthless, axis=1) - worthless
+    offered = np.minimum(np.maximum(no_value_offer_count[:, None] - given_before, 0), worthless)
+    return counts - offered
+
+
+class ExampleBatchAgent:
+    """solutions/example.py: ask for every valued item, accept half of the total worth."""
+
+    def __init__(self, me, counts, values, max_rounds, lengths):
+        self.values = values
+        self.total = (counts * values).sum(axis=1)
+        self.request = np.where(values == 0, 0, counts)
+
+    def offer(self, offers, active):
+        if offers is None:
+            return np.zeros(len(self.values), dtype=bool), self.request
+        return 2 * (offers * self.values).sum(axis=1) >= self.total, self.request
+
+
+class RobertSpeedBatchAgent:
+    """solutions/Top_Human___Robert_Speed.py, with its branches as lane masks."""
+
+    def __init__(self, me, counts, values, max_rounds, lengths):
+        num_lanes, num_items = counts.shape
+        self.is_first = 0 if me else 1
+        self.counts = counts
+        self.values = values
+        self.rounds = max_rounds
+        self.rounds_left = max_rounds.copy()
+        self.rounds_till_fold = (max_rounds * 0.2).astype(np.int64) + self.is_first
+        self.rounds_till_panic = (max_rounds * 0.4).astype(np.int64) + self.is_first
+        real_items = np.arange(num_items) < lengths[:, None]
+        # Items the solution would divide by, the lanes fail when it does
+        self.zero_counts = (real_items & (counts == 0)).any(axis=1)
+
+        self.total_value = (counts * values).sum(axis=1)
+        self.total_count = counts.sum(axis=1)
+        self.total_no_value_count = np.where(values == 0, counts, 0).sum(axis=1)
+        self.no_value_offer_count = np.zeros(num_lanes, dtype=np.int64)
+        self.prev_request_counts = counts.copy()
+        self.prev_offered_counts = np.zeros_like(counts)
+        self.has_prev_offered = np.zeros(num_lanes, dtype=bool)
+        self.is_stubborn = np.ones(num_lanes, dtype=bool)
+        self.has_folded = np.zeros(num_lanes, dtype=bool)
+        self.sub_total_req_counts = np.zeros_like(counts)
+        self.stubborn_acceptable_offer_value = self.total_value / 2
+        self.lowest_req_value = self.total_value * 0.7
+        # The initial importance scores divide by the total count
+        self.failed = self.total_count == 0
+
+    def _undesirables(self, lanes, no_value_offer_count, request_counts):
+        """make_offer_of_undesirables on some lanes, into request_counts."""
+        self.no_value_offer_count = np.where(lanes, no_value_offer_count, self.no_value_offer_count)
+        offer = _make_offer_of_undesirables(self.counts, self.values, no_value_offer_count)
+        request_counts[lanes] = offer[lanes]
+
+    def _offer_counts(self, lanes, order, important, est_op_value, stubborn):
+        """
+        How many of each item the lanes give away, walking the important items by
+        decreasing tradability: until the opponent's estimated value reaches half
+        the total (stubborn) or while the kept value stays above the lane's required
+        value (not stubborn).
+        """
+        rows = np.arange(len(lanes))
+        offer_counts = np.zeros_like(self.counts)
+        estimated_opposition_total_value = np.zeros(len(lanes))
+        req_total_value = self.total_value.copy()
+        done = ~lanes
+        if not stubborn:
+            low_req_value_delta = self.total_value - self.lowest_req_value
+            divisor = np.maximum(self.rounds - 1, 1)
+            req_value = self.lowest_req_value + ((self.rounds_left / divisor) * low_req_value_delta)
+
+        for position in range(order.shape[1]):
+            index = order[:, position]
+            playing = ~done & important[rows, index]
+            if not playing.any():
+                break
+            count = self.counts[rows, index]
+            value = self.values[rows, index]
+            op_value = est_op_value[rows, index]
+            est_offer_op_value = estimated_opposition_total_value.copy()
+            offer_count = np.zeros(len(lanes), dtype=np.int64)
+            possible_req_total_value = req_total_value.copy()
+            while True:
+                if stubborn:
+                    more = (
+                        playing
+                        & (est_offer_op_value < self.stubborn_acceptable_offer_value)
+                        & (offer_count < count)
+                        & (possible_req_total_value - value > 0)
+                    )
+                else:
+                    more = playing & (offer_count < count) & (possible_req_total_value - value > req_value)
+                if not more.any():
+                    break
+                offer_count += more
+                est_offer_op_value = np.where(more, est_offer_op_value + op_value, est_offer_op_value)
+                possible_req_total_value -= np.where(more, value, 0)
+            offer_counts[rows[playing], index[playing]] = offer_count[playing]
+            estimated_opposition_total_value = np.where(
+                playing, est_offer_op_value, estimated_opposition_total_value
+            )
+            req_total_value = np.where(playing, possible_req_total_value, req_total_value)
+            if stubborn:
+                done |= playing & (est_offer_op_value >= self.stubborn_acceptable_offer_value)
+        return np.where(self.values == 0, 0, self.counts - offer_counts)
+
+    def offer(self, offers, active):
+        num_lanes = len(active)
+        self.rounds_left = self.rounds_left - active
+        accept = np.zeros(num_lanes, dtype=bool)
+        errors = np.zeros(num_lanes, dtype=bool)
+        if offers is None:
+            # hold_request_counts
+            return accept, self.counts
+
+        counts, values = self.counts, self.values
+        rounds_left = self.rounds_left
+        round_num = self.rounds - rounds_left
+        turns_left = rounds_left * 2 + self.is_first
+        lanes = active.copy()
+
+        def accept_if(condition):
+            nonlocal lanes
+            accepted = lanes & condition
+            accept[accepted] = True
+            lanes &= ~accepted
+
+        accept_if((self.prev_request_counts == offers).all(axis=1))
+        offer_value = (values * offers).sum(axis=1)
+        accept_if((turns_left == 0) & (offer_value != 0))
+        accept_if((round_num >= self.rounds_till_fold) & (offer_value == self.total_value))
+
+        op_requested_counts = counts - offers
+        self.is_stubborn &= ~(
+            lanes & self.has_prev_offered & (offers != self.prev_offered_counts).any(axis=1)
+        )
+        self.prev_offered_counts[lanes] = offers[lanes]
+        self.has_prev_offered |= lanes
+
+        request_counts = np.zeros_like(counts)
+        has_request = np.zeros(num_lanes, dtype=bool)
+        held = lanes & (offers == 0).all(axis=1)
+        self.has_folded |= lanes & ~held
+        undesirables = (
+            held
+            & ~self.has_folded
+            & (self.total_no_value_count > 0)
+            & (self.no_value_offer_count < self.total_no_value_count)
+        )
+        first_undesirable = undesirables & (round_num < self.rounds_till_fold)
+        self._undesirables(first_undesirable, self.no_value_offer_count + 1, request_counts)
+        panic = undesirables & ~first_undesirable & (round_num < self.rounds_till_panic)
+        self._undesirables(panic, self.total_no_value_count, request_counts)
+        has_request |= first_undesirable | panic
+
+        self.sub_total_req_counts = np.where(
+            lanes[:, None], self.sub_total_req_counts + op_requested_counts, self.sub_total_req_counts
+        )
+        errors |= lanes & self.zero_counts
+        lanes &= ~errors
+
+        compute = lanes & ~has_request
+        if compute.any():
+            sub_total_req_counts = self.sub_total_req_counts
+            important = sub_total_req_counts != 0
+            importance = np.divide(
+                sub_total_req_counts, counts, out=np.zeros(counts.shape), where=important
+            )
+            est_op_value = np.divide(
+                importance * self.total_value[:, None] * EST_ERROR_MULTIPLIER,
+                counts,
+                out=np.zeros(counts.shape),
+                where=important,
+            )
+            tradability = np.divide(est_op_value, values, out=np.zeros(counts.shape), where=values != 0)
+            no_value_important_count = np.where(
+                important & (values == 0) & (importance > 0.3 * self.rounds[:, None]), counts, 0
+            ).sum(axis=1)
+            self.rounds_till_fold = np.where(
+                compute
+                & (round_num < self.rounds_till_fold)
+                & (self.no_value_offer_count >= no_value_important_count),
+                round_num,
+                self.rounds_till_fold,
+            )
+            # Important items by decreasing tradability, stable like list.sort
+            order = np.argsort(np.where(important, -tradability, np.inf), axis=1, kind="stable")
+
+            last = compute & (rounds_left == 0)
+            stubborn = last & self.is_stubborn
+            if stubborn.any():
+                offer = self._offer_counts(stubborn, order, important, est_op_value, stubborn=True)
+                request_counts[stubborn] = offer[stubborn]
+            give_undesirables = last & ~self.is_stubborn & (no_value_important_count > 0)
+            self._undesirables(give_undesirables, self.total_no_value_count, request_counts)
+            trade = last & ~self.is_stubborn & (no_value_important_count == 0)
+            # The solution offers one of its most tradable item, it fails without any
+            errors |= trade & ~important.any(axis=1)
+            trade &= important.any(axis=1)
+            item_to_offer = np.arange(counts.shape[1]) == order[:, :1]
+            offer = np.where(values == 0, 0, counts - item_to_offer)
+            request_counts[trade] = offer[trade]
+
+            early = compute & ~last & (round_num < self.rounds_till_fold)
+            self._undesirables(early, self.no_value_offer_count + 1, request_counts)
+            concede = compute & ~last & ~early
+            if concede.any():
+                offer = self._offer_counts(concede, order, important, est_op_value, stubborn=False)
+                request_counts[concede] = offer[concede]
+            lanes &= ~errors
+
+        request_value = (values * request_counts).sum(axis=1)
+        accept_if((offer_value > request_value) & (rounds_left == 0))
+        self.prev_request_counts[lanes] = request_counts[lanes]
+        return accept, request_counts, errors
+
+
+# Display name -> (hash of the solution source the port reproduces, BatchAgent)
+REFERENCE_BATCH_AGENTS = {
+    "example": (
+        "eb2db48b6e4a524dc20a48591b74c48124fda45eb85e7449cf2d00911dbc3213",
+        ExampleBatchAgent,
+    ),
+    "Top Human - Robert Speed": (
+        "cc70c8c2663e4834f8d606ec027076d1a12de6e4508e3188f1437f00371ec44c",
+        RobertSpeedBatchAgent,
+    ),
+}
+
+
+def get_reference_batch_agent(display_name: str):
+    """
+    The NumPy port of a model's solution, or None if there is none or the solution
+    file changed since the port was written.
+    """
+    reference = REFERENCE_BATCH_AGENTS.get(display_name)
+    if reference is None:
+        return None
+    code_hash, BatchAgent = reference
+    if get_file_hash(get_solution_path(display_name)) != code_hash:
+        return None
+    return BatchAgent
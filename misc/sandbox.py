@@ -0,0 +1,164 @@
+import multiprocessing
+import os
+import random
+
+from misc.profiling import AgentUsage, start_memory_tracing
+from misc.scenario_generator import agent_seed
+
+# Agent classes are built with exec() and can't be pickled, so the worker is forked
+# with the class already in memory instead of being spawned.
+_mp_context = multiprocessing.get_context("fork")
+
+
+class AgentTimeoutError(Exception):
+    """Raised when a sandboxed agent doesn't answer before the turn deadline."""
+
+
+class AgentCrashError(Exception):
+    """Raised when a sandboxed agent raises or its process dies."""
+
+
+def sandbox_enabled() -> bool:
+    """Whether agents should run in sandboxed worker processes (SANDBOX_AGENTS env var)."""
+    return os.getenv("SANDBOX_AGENTS", "false").lower() == "true"
+
+
+def get_turn_timeout() -> float:
+    """Seconds an agent has to answer a call, can be set via TURN_TIMEOUT_SECONDS env var."""
+    try:
+        return float(os.getenv("TURN_TIMEOUT_SECONDS", "5"))
+    except ValueError:
+        return 5.0
+
+
+def _agent_worker(conn, AgentClass, trace_memory: bool):
+    """Child process loop: hold one Agent instance at a time and answer calls on it."""
+    agent = None
+    if trace_memory:
+        start_memory_tracing()
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+
+        command = message[0]
+        if command == "close":
+            return
+
+        # Usage is measured here, the parent would only see the time spent waiting
+        usage = AgentUsage(trace_memory)
+        try:
+            if command == "new":
+                # Same seed as in process, see agent_seed
+                random.seed(agent_seed(*message[1:]))
+                agent = usage.call(AgentClass, *message[1:])
+                result = None
+            elif command == "offer":
+                result = usage.call(agent.offer, message[1])
+            status = "ok"
+        except Exception as e:
+            status, result = "error", f"{type(e).__name__}: {e}"
+        conn.send((status, result, usage.cpu_time, usage.wall_time, usage.peak_memory))
+
+
+class SandboxedAgent:
+    """Handle to the Agent instance living in a SandboxedAgentClass worker."""
+
+    def __init__(self, agent_class: "SandboxedAgentClass", incarnation: int):
+        self._agent_class = agent_class
+        self._incarnation = incarnation
+
+    def offer(self, o):
+        if self._incarnation != self._agent_class.incarnation:
+            raise AgentCrashError(f"{self._agent_class.name} worker was restarted")
+        return self._agent_class.call(("offer", o))
+
+
+class SandboxedAgentClass:
+    """
+    Drop-in replacement for an Agent class that runs its instances in a long-lived
+    child process.
+
+    Calling it creates a new Agent in the worker (replacing the previous one) and
+    returns a SandboxedAgent whose offer() is forwarded over a pipe. Every call has
+    a deadline; when it's missed the worker is killed and AgentTimeoutError is raised,
+    and a fresh worker is started lazily for the next negotiation.
+
+    usage accumulates what the agent's calls used in the worker (see AgentUsage),
+    with memory traced when trace_memory is set.
+    """
+
+    def __init__(
+        self, AgentClass, name: str, timeout: float | None = None, trace_memory: bool = False
+    ):
+        self.AgentClass = AgentClass
+        self.name = name
+        self.timeout = get_turn_timeout() if timeout is None else timeout
+        self.incarnation = 0
+        self.usage = AgentUsage(trace_memory)
+        self._process = None
+        self._conn = None
+
+    def __call__(self, me, counts, values, max_rounds) -> SandboxedAgent:
+        self.call(("new", me, counts, values, max_rounds))
+        return SandboxedAgent(self, self.incarnation)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _start(self):
+        parent_conn, child_conn = _mp_context.Pipe()
+        self._process = _mp_context.Process(
+            target=_agent_worker,
+            args=(child_conn, self.AgentClass, self.usage.trace_memory),
+            daemon=True,
+        )
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        self.incarnation += 1
+
+    def _kill(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.join()
+            self._conn.close()
+        self._process = None
+        self._conn = None
+
+    def call(self, message):
+        """Send a message to the worker and return its answer, enforcing the deadline."""
+        if self._process is None:
+            self._start()
+
+        try:
+            self._conn.send(message)
+            if not self._conn.poll(self.timeout):
+                self._kill()
+                raise AgentTimeoutError(
+                    f"{self.name} did not answer within {self.timeout:g} seconds"
+                )
+            status, value, *usage = self._conn.recv()
+        except (EOFError, OSError) as e:
+            self._kill()
+            raise AgentCrashError(f"{self.name} worker died: {e}")
+
+        self.usage.add(*usage)
+        if status == "error":
+            raise AgentCrashError(value)
+        return value
+
+    def close(self):
+        """Stop the worker process."""
+        if self._process is None:
+            return
+        try:
+            self._conn.send(("close",))
+        except (EOFError, OSError):
+            pass
+        self._process.join(timeout=1)
+        self._kill()
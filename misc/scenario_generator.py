@@ -0,0 +1,301 @@
+import os
+import secrets
+
+import numpy as np
+
+MIN_ITEMS = 2
+MAX_ITEMS = 10
+MAX_COUNT = 5
+MAX_VALUE = 10
+TARGET_WORTHS = np.array([32, 64, 128])
+# Attempts at a player's values before the scenario is dropped and redrawn
+MAX_ATTEMPTS = 1000
+# Opt-in max_attempts for callers that only need many valid scenarios fast (benchmarks,
+# calibration runs). Rarely solved scenarios get redrawn more often, so the mix of
+# scenarios shifts (fewer items, higher worths): not comparable with tournaments.
+QUICK_MAX_ATTEMPTS = 32
+
+# Seeded streams are generated in blocks of this many scenarios, each block from its
+# own position of a counter-based RNG, so that any block can be regenerated alone.
+SCENARIOS_PER_BLOCK = 1024
+# Seeds are stored in a Postgres BIGINT
+_SEED_BITS = 63
+
+# A random value is 0 with a 5% chance, otherwise 1-10. Drawn as a single integer in
+# 0-199 mapped through this table: 10 of the 200 draws are 0, 19 each for 1-10.
+_VALUE_DRAWS = 200
+_VALUE_TABLE = np.concatenate(
+    [np.zeros(10, dtype=np.int16), np.repeat(np.arange(1, MAX_VALUE + 1, dtype=np.int16), 19)]
+)
+
+
+def _build_last_two_tables():
+    """
+    For every remaining worth and pair of counts (c1, c2), the first (v1, v2) in
+    0-10, by increasing v1, with c1 * v1 + c2 * v2 == remaining, or -1 if none.
+    """
+    max_remaining = int(TARGET_WORTHS.max())
+    first_v1 = np.full((max_remaining + 1, MAX_COUNT + 1, MAX_COUNT + 1), -1, dtype=np.int16)
+    first_v2 = np.full_like(first_v1, -1)
+    for remaining in range(max_remaining + 1):
+        for c1 in range(1, MAX_COUNT + 1):
+            for c2 in range(1, MAX_COUNT + 1):
+                for v1 in range(MAX_VALUE + 1):
+                    leftover = remaining - c1 * v1
+                    if leftover >= 0 and leftover % c2 == 0 and leftover // c2 <= MAX_VALUE:
+                        first_v1[remaining, c1, c2] = v1
+                        first_v2[remaining, c1, c2] = leftover // c2
+                        break
+    return first_v1, first_v2
+
+
+_FIRST_V1, _FIRST_V2 = _build_last_two_tables()
+
+
+def _draw_player_values(rng, counts, lengths, targets, attempts: int):
+    """
+    Several attempts at player values for every scenario of the batch at once.
+
+    The first length - 2 values are random. The last two are the first (v1, v2) in
+    0-10, by increasing v1, such that the total worth hits the target. An attempt is
+    valid if such a pair exists and less than half of the values are zeros.
+
+    Returns (values, valid) of shapes (scenarios, attempts, MAX_ITEMS) and
+    (scenarios, attempts), values padded with zeros.
+    """
+    num_scenarios = len(lengths)
+    columns = np.arange(MAX_ITEMS)
+    free = columns < (lengths - 2)[:, None]
+
+    draws = rng.integers(0, _VALUE_DRAWS, size=(num_scenarios, attempts, MAX_ITEMS), dtype=np.int16)
+    values = _VALUE_TABLE[draws]
+    values *= free[:, None, :]
+
+    remaining = targets[:, None] - (counts[:, None, :] * values).sum(axis=2)
+    in_range = remaining >= 0
+    remaining[~in_range] = 0
+
+    rows = np.arange(num_scenarios)
+    c1 = counts[rows, lengths - 2][:, None]
+    c2 = counts[rows, lengths - 1][:, None]
+    v1 = _FIRST_V1[remaining, c1, c2]
+    v2 = _FIRST_V2[remaining, c1, c2]
+
+    zero_count = ((values == 0) & free[:, None, :]).sum(axis=2) + (v1 == 0) + (v2 == 0)
+    valid = in_range & (v1 >= 0) & (zero_count * 2 < lengths[:, None])
+
+    last = lengths - 2
+    values[rows, :, last] = v1
+    values[rows, :, last + 1] = v2
+    return values, valid
+
+
+def _unsolvable(counts, lengths, targets):
+    """
+    Scenarios no player values can fit: worth less than the target with every value
+    at the maximum, or more than the target with the fewest non-zero values allowed
+    all at 1 (on the items with the smallest counts).
+    """
+    max_zeros = (lengths - 1) // 2
+    padded = np.where(counts > 0, counts, MAX_COUNT * MAX_ITEMS)
+    smallest = np.sort(padded, axis=1).cumsum(axis=1)
+    min_worth = smallest[np.arange(len(lengths)), lengths - max_zeros - 1]
+    return (counts.sum(axis=1) * MAX_VALUE < targets) | (min_worth > targets)
+
+
+def _solve_player_values(rng, counts, lengths, targets, max_attempts=MAX_ATTEMPTS):
+    """
+    Player values for every scenario: the first valid attempt out of max_attempts,
+    like trying them one after another.
+
+    Attempts are drawn in blocks for all the unsolved scenarios at once. Blocks get
+    bigger as only the hard scenarios are left. Only scenarios that provably have no
+    valid attempt are dropped early, so the values are drawn exactly like trying all
+    the attempts: those _unsolvable finds before any attempt, and those with two items
+    after a single attempt (they have no random values, all their attempts are the
+    same).
+
+    Returns (values, solved) where solved marks the scenarios that got values.
+    """
+    values = np.zeros_like(counts)
+    solved = np.zeros(len(lengths), dtype=bool)
+    pending = np.flatnonzero(~_unsolvable(counts, lengths, targets))
+
+    attempts = 0
+    block = 4
+    while attempts < max_attempts and len(pending):
+        block = min(block, max_attempts - attempts)
+        attempt_values, valid = _draw_player_values(
+            rng, counts[pending], lengths[pending], targets[pending], block
+        )
+        found = valid.any(axis=1)
+        first = valid[found].argmax(axis=1)
+        values[pending[found]] = attempt_values[found, first]
+        solved[pending[found]] = True
+        pending = pending[~found]
+        pending = pending[lengths[pending] > MIN_ITEMS]
+
+        attempts += block
+        block *= 2
+
+    return values, solved
+
+
+def generate_scenario_arrays(num_scenarios: int, rng=None, *, max_attempts: int = MAX_ATTEMPTS) -> dict:
+    """
+    Generate exactly num_scenarios valid scenarios as arrays.
+
+    Scenarios are drawn in bulk: a random number of item types (2-10), counts (1-5)
+    and a target worth (32, 64 or 128). Both players' values are then solved for in
+    bulk, and the scenarios where a player has no valid values after max_attempts
+    attempts are replaced by new draws.
+
+    Returns a dict of arrays:
+    - 'counts', 'player_0', 'player_1': (num_scenarios, MAX_ITEMS), zero padded
+    - 'lengths': number of item types of each scenario
+    - 'rounds': target_worth // 4
+    - 'worths': the target worth of each scenario
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    batches = []
+    missing = num_scenarios
+    # Always at least one (possibly empty) batch so that the arrays have the right shapes
+    while True:
+        # About 1 in 3 scenarios isn't solved for both players, draw more than needed
+        batch_size = missing + missing // 2 + 1
+
+        lengths = rng.integers(MIN_ITEMS, MAX_ITEMS + 1, size=batch_size)
+        counts = rng.integers(1, MAX_COUNT + 1, size=(batch_size, MAX_ITEMS), dtype=np.int16)
+        counts[np.arange(MAX_ITEMS) >= lengths[:, None]] = 0
+        worths = rng.choice(TARGET_WORTHS, size=batch_size)
+
+        player_0, solved_0 = _solve_player_values(rng, counts, lengths, worths, max_attempts)
+        player_1, solved_1 = _solve_player_values(rng, counts, lengths, worths, max_attempts)
+
+        keep = np.flatnonzero(solved_0 & solved_1)[:missing]
+        batches.append(
+            {
+                "counts": counts[keep],
+                "player_0": player_0[keep],
+                "player_1": player_1[keep],
+                "lengths": lengths[keep],
+                "worths": worths[keep],
+            }
+        )
+        missing -= len(keep)
+        if missing <= 0:
+            break
+
+    arrays = {key: np.concatenate([batch[key] for batch in batches]) for key in batches[0]}
+    arrays["rounds"] = arrays["worths"] // 4
+    return arrays
+
+
+def scenario_arrays_to_dicts(arrays: dict) -> list[dict]:
+    """Convert generate_scenario_arrays output to the list of scenario dicts used by battles."""
+    counts = arrays["counts"].tolist()
+    player_0 = arrays["player_0"].tolist()
+    player_1 = arrays["player_1"].tolist()
+    return [
+        {
+            "counts": counts[i][:length],
+            "player_0": player_0[i][:length],
+            "player_1": player_1[i][:length],
+            "rounds": rounds,
+        }
+        for i, (length, rounds) in enumerate(
+            zip(arrays["lengths"].tolist(), arrays["rounds"].tolist())
+        )
+    ]
+
+
+def agent_seed(me: int, counts: list[int], values: list[int], max_rounds: int) -> str:
+    """
+    Seed of the random module when an agent is created for a scenario, so that
+    agents using it replay the same moves within one engine config.
+
+    Randomness used in the constructor is the same in process and sandboxed. In
+    offer() it isn't: in process both agents draw from the one module stream in turn,
+    sandboxed each worker has its own.
+    """
+    return repr((me, counts, values, max_rounds))
+
+
+def new_seed() -> int:
+    """A fresh random tournament seed."""
+    return secrets.randbits(_SEED_BITS)
+
+
+def get_tournament_seed() -> int:
+    """
+    Seed of this session's scenarios: TOURNAMENT_SEED env var when set (to replay a
+    previous tournament), otherwise a fresh random one.
+    """
+    try:
+        return int(os.environ["TOURNAMENT_SEED"])
+    except (KeyError, ValueError):
+        return new_seed()
+
+
+def tournament_seed_is_fixed() -> bool:
+    """Whether TOURNAMENT_SEED fixes the seed, so that every session plays the same scenarios."""
+    try:
+        int(os.environ["TOURNAMENT_SEED"])
+        return True
+    except (KeyError, ValueError):
+        return False
+
+
+def get_tournament_id(seed: int, num_scenarios: int) -> str:
+    """Identifier of a tournament: its seed and number of scenarios are all it takes to replay it."""
+    return f"{seed:016x}-{num_scenarios}"
+
+
+def _block_rng(seed: int, block: int):
+    """
+    Generator for a block of a seeded stream. Philox is counter based: the seed is
+    its key and the block number its starting counter (in the high word, far
+    beyond what a block consumes), so blocks are independent of each other.
+    """
+    return np.random.Generator(np.random.Philox(key=seed, counter=block << 192))
+
+
+def generate_seeded_scenario_arrays(
+    seed: int, start: int, stop: int, *, max_attempts: int = MAX_ATTEMPTS
+) -> dict:
+    """
+    Scenarios start..stop-1 of the stream of a seed, as generate_scenario_arrays
+    arrays. Only the blocks covering the slice are generated. A seed only replays the
+    same scenarios with the same max_attempts.
+    """
+    first_block = start // SCENARIOS_PER_BLOCK
+    last_block = max(first_block, (stop - 1) // SCENARIOS_PER_BLOCK)
+    blocks = [
+        generate_scenario_arrays(SCENARIOS_PER_BLOCK, _block_rng(seed, block), max_attempts=max_attempts)
+        for block in range(first_block, last_block + 1)
+    ]
+    offset = first_block * SCENARIOS_PER_BLOCK
+    return {
+        key: np.concatenate([block[key] for block in blocks])[start - offset : max(start, stop) - offset]
+        for key in blocks[0]
+    }
+
+
+def iter_scenarios(
+    seed: int, start: int = 0, stop: int | None = None, *, max_attempts: int = MAX_ATTEMPTS
+):
+    """
+    Lazily yield the scenario dicts start..stop-1 (endless when stop is None) of the
+    stream of a seed, one block at a time.
+    """
+    position = start
+    while stop is None or position < stop:
+        block_stop = (position // SCENARIOS_PER_BLOCK + 1) * SCENARIOS_PER_BLOCK
+        if stop is not None:
+            block_stop = min(block_stop, stop)
+        yield from scenario_arrays_to_dicts(
+            generate_seeded_scenario_arrays(seed, position, block_stop, max_attempts=max_attempts)
+        )
+        position = block_stop
@@ -0,0 +1,202 @@
+import array
+import atexit
+from multiprocessing import shared_memory
+
+from misc.pareto import get_outcome_space
+
+# Layout of the shared block, in this order:
+#   header           int32[3]          number of scenarios, total number of item
+#                                      types, total length of the envelopes
+#   offsets          int32[n + 1]      scenario i owns items offsets[i]:offsets[i + 1]
+#   rounds           int32[n]
+#   max_joint        int32[n]          outcome space of each scenario (misc.pareto)
+#   nash_points      int32[2 * n]
+#   envelope_offsets int32[n + 1]
+#   counts           int16[total]      ragged rows, one per scenario
+#   values_0         int16[total]
+#   values_1         int16[total]
+#   envelopes        int16[envelopes]  ragged rows, one per scenario
+_HEADER_LENGTH = 3
+_INT32 = "i"
+_INT16 = "h"
+_INT32_SIZE = 4
+_INT16_SIZE = 2
+
+# Tables attached by this process, by shared memory name
+_attached_tables = {}
+
+
+def _section_bounds(num_scenarios: int, total_items: int, total_envelopes: int) -> dict:
+    """Byte ranges of every section of the shared block."""
+    bounds = {}
+    position = 0
+    for section, length, size in (
+        ("header", _HEADER_LENGTH, _INT32_SIZE),
+        ("offsets", num_scenarios + 1, _INT32_SIZE),
+        ("rounds", num_scenarios, _INT32_SIZE),
+        ("max_joint", num_scenarios, _INT32_SIZE),
+        ("nash_points", 2 * num_scenarios, _INT32_SIZE),
+        ("envelope_offsets", num_scenarios + 1, _INT32_SIZE),
+        ("counts", total_items, _INT16_SIZE),
+        ("values_0", total_items, _INT16_SIZE),
+        ("values_1", total_items, _INT16_SIZE),
+        ("envelopes", total_envelopes, _INT16_SIZE),
+    ):
+        bounds[section] = (position, position + length * size)
+        position += length * size
+    bounds["size"] = position
+    return bounds
+
+
+class ScenarioTable:
+    """
+    Negotiation scenarios packed once into shared memory so that pool workers can
+    read them without each unit carrying its own pickled copy. Each scenario's
+    outcome space is packed with it, so workers never recompute it.
+
+    Create it in the parent with ScenarioTable.create(negotiation_data), pass
+    table.name to the workers and read with attach_scenario_table(name).scenarios().
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory):
+        self._shm = shm
+        buf = shm.buf
+        num_scenarios, total_items, total_envelopes = buf[0 : _HEADER_LENGTH * _INT32_SIZE].cast(
+            _INT32
+        )
+        bounds = _section_bounds(num_scenarios, total_items, total_envelopes)
+
+        self._num_scenarios = num_scenarios
+        self.offsets = self._view(bounds["offsets"], _INT32)
+        self.rounds = self._view(bounds["rounds"], _INT32)
+        self.max_joint = self._view(bounds["max_joint"], _INT32)
+        self.nash_points = self._view(bounds["nash_points"], _INT32)
+        self.envelope_offsets = self._view(bounds["envelope_offsets"], _INT32)
+        self.counts = self._view(bounds["counts"], _INT16)
+        self.values_0 = self._view(bounds["values_0"], _INT16)
+        self.values_1 = self._view(bounds["values_1"], _INT16)
+        self.envelopes = self._view(bounds["envelopes"], _INT16)
+
+    def _view(self, bounds: tuple[int, int], fmt: str) -> memoryview:
+        start, stop = bounds
+        return self._shm.buf[start:stop].cast(fmt)
+
+    @classmethod
+    def create(cls, negotiation_data: list[dict]) -> "ScenarioTable":
+        """
+        Pack scenarios with 'counts', 'player_0', 'player_1' and 'rounds' into a new
+        block, with their outcome spaces (computed here when not attached yet).
+        """
+        outcome_spaces = [get_outcome_space(scenario) for scenario in negotiation_data]
+        total_items = sum(len(scenario["counts"]) for scenario in negotiation_data)
+        total_envelopes = sum(len(space["envelope"]) for space in outcome_spaces)
+        bounds = _section_bounds(len(negotiation_data), total_items, total_envelopes)
+        # Zero-sized blocks are not allowed, the header is always there
+        shm = shared_memory.SharedMemory(create=True, size=bounds["size"])
+
+        header = shm.buf[slice(*bounds["header"])].cast(_INT32)
+        header[0] = len(negotiation_data)
+        header[1] = total_items
+        header[2] = total_envelopes
+        header.release()
+
+        table = cls(shm)
+        position = 0
+        envelope_position = 0
+        for i, (scenario, space) in enumerate(zip(negotiation_data, outcome_spaces)):
+            length = len(scenario["counts"])
+            table.offsets[i] = position
+            table.rounds[i] = scenario["rounds"]
+            table.counts[position : position + length] = _int16_row(scenario["counts"])
+            table.values_0[position : position + length] = _int16_row(scenario["player_0"])
+            table.values_1[position : position + length] = _int16_row(scenario["player_1"])
+            position += length
+
+            envelope_length = len(space["envelope"])
+            table.max_joint[i] = space["max_joint_surplus"]
+            table.nash_points[2 * i] = space["nash_point"][0]
+            table.nash_points[2 * i + 1] = space["nash_point"][1]
+            table.envelope_offsets[i] = envelope_position
+            table.envelopes[envelope_position : envelope_position + envelope_length] = _int16_row(
+                space["envelope"]
+            )
+            envelope_position += envelope_length
+        table.offsets[len(negotiation_data)] = position
+        table.envelope_offsets[len(negotiation_data)] = envelope_position
+        _attached_tables[table.name] = table
+        return table
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def __len__(self) -> int:
+        return self._num_scenarios
+
+    def scenario(self, i: int) -> dict:
+        """Scenario i as the dict used everywhere else in the battlefield."""
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        envelope_start, envelope_stop = self.envelope_offsets[i], self.envelope_offsets[i + 1]
+        return {
+            "counts": self.counts[start:stop].tolist(),
+            "player_0": self.values_0[start:stop].tolist(),
+            "player_1": self.values_1[start:stop].tolist(),
+            "rounds": self.rounds[i],
+            "outcome_space": {
+                "envelope": self.envelopes[envelope_start:envelope_stop].tolist(),
+                "nash_point": [self.nash_points[2 * i], self.nash_points[2 * i + 1]],
+                "max_joint_surplus": self.max_joint[i],
+            },
+        }
+
+    def scenarios(self, start: int = 0, stop: int | None = None) -> list[dict]:
+        """Scenarios start..stop-1 as dicts."""
+        if stop is None:
+            stop = self._num_scenarios
+        return [self.scenario(i) for i in range(start, min(stop, self._num_scenarios))]
+
+    def close(self):
+        """Detach from the shared block, releasing the views on it first."""
+        _attached_tables.pop(self.name, None)
+        for view in (
+            self.offsets,
+            self.rounds,
+            self.max_joint,
+            self.nash_points,
+            self.envelope_offsets,
+            self.counts,
+            self.values_0,
+            self.values_1,
+            self.envelopes,
+        ):
+            view.release()
+        self._shm.close()
+
+    def unlink(self):
+        """Free the shared block. Only the creator should call this, once."""
+        self._shm.unlink()
+
+
+def _int16_row(row: list[int]) -> memoryview:
+    return memoryview(array.array(_INT16, row))
+
+
+def attach_scenario_table(name: str) -> ScenarioTable:
+    """
+    Attach to a shared scenario table, once per process. Processes forked after the
+    table was created already hold it and don't need to attach again.
+    """
+    table = _attached_tables.get(name)
+    if table is None:
+        table = ScenarioTable(shared_memory.SharedMemory(name=name))
+        _attached_tables[name] = table
+    return table
+
+
+def _close_attached_tables():
+    # The views must be released before the blocks are garbage collected
+    for table in list(_attached_tables.values()):
+        table.close()
+
+
+atexit.register(_close_attached_tables)
@@ -0,0 +1,156 @@
+import hashlib
+import marshal
+import os
+import sys
+import time
+from pathlib import Path
+
+# Compiled solutions are stored as marshal blobs named after the hash of their
+# source. marshal output is tied to the interpreter version, hence the cache tag.
+_default_cache_dir = Path(__file__).parent.parent / ".cache" / "solutions"
+
+# Per-process caches: content hash -> code object, content hash -> namespace of the
+# executed solution, and (path, mtime, size) -> content hash so unchanged files
+# aren't read again. The process can live for many sessions (runner.py) and each
+# session brings new solutions: only the most recently used entries are kept, enough
+# for a few tournaments of models.
+_code_objects = {}
+_solution_namespaces = {}
+_file_hashes = {}
+_MAX_SOLUTIONS = 128
+_MAX_FILE_HASHES = 512
+
+
+def _cache_get(cache: dict, key):
+    """Value of key in an LRU cache (a dict ordered by last use), or None."""
+    value = cache.pop(key, None)
+    if value is not None:
+        cache[key] = value
+    return value
+
+
+def _cache_put(cache: dict, key, value, max_size: int):
+    """Store value as the most recently used entry, evicting the least recently used ones."""
+    cache[key] = value
+    while len(cache) > max_size:
+        del cache[next(iter(cache))]
+
+
+def get_cache_dir() -> Path:
+    """Directory of the on-disk cache, can be set via SOLUTION_CACHE_DIR env var."""
+    return Path(os.getenv("SOLUTION_CACHE_DIR", str(_default_cache_dir)))
+
+
+def get_max_age_days() -> float:
+    """Days a compiled solution is kept without being used, can be set via SOLUTION_CACHE_MAX_AGE_DAYS env var."""
+    try:
+        return float(os.getenv("SOLUTION_CACHE_MAX_AGE_DAYS", "30"))
+    except ValueError:
+        return 30.0
+
+
+def get_max_entries() -> int:
+    """Maximum number of compiled solutions on disk, can be set via SOLUTION_CACHE_MAX_ENTRIES env var."""
+    try:
+        return int(os.getenv("SOLUTION_CACHE_MAX_ENTRIES", "500"))
+    except ValueError:
+        return 500
+
+
+def get_code_hash(code: str) -> str:
+    """Content hash identifying a solution's source code."""
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def get_file_hash(path: Path) -> str | None:
+    """
+    Content hash of a solution file, or None if it doesn't exist.
+    The file is only read again when its mtime or size changes.
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    code_hash = _cache_get(_file_hashes, key)
+    if code_hash is None:
+        code_hash = get_code_hash(path.read_text())
+        _cache_put(_file_hashes, key, code_hash, _MAX_FILE_HASHES)
+    return code_hash
+
+
+def compile_solution(code: str, filename: str = "<solution>", code_hash: str | None = None):
+    """
+    Compile a solution's source, reusing the in-memory or on-disk compiled code
+    object when the same source has been compiled before.
+    """
+    if code_hash is None:
+        code_hash = get_code_hash(code)
+
+    code_object = _cache_get(_code_objects, code_hash)
+    if code_object is not None:
+        return code_object
+
+    blob_path = get_cache_dir() / f"{code_hash}.{sys.implementation.cache_tag}.marshal"
+    try:
+        code_object = marshal.loads(blob_path.read_bytes())
+        # The modification time is the last use, see prune_solution_cache
+        os.utime(blob_path)
+    except (OSError, EOFError, ValueError, TypeError):
+        code_object = compile(code, filename, "exec")
+        try:
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            # Write then rename so that concurrent workers never read a partial blob
+            tmp_path = blob_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_bytes(marshal.dumps(code_object))
+            os.replace(tmp_path, blob_path)
+        except OSError as e:
+            print(f"Failed to cache compiled solution {filename}: {e}")
+
+    _cache_put(_code_objects, code_hash, code_object, _MAX_SOLUTIONS)
+    return code_object
+
+
+def load_solution_class(path: Path, class_name: str = "Agent"):
+    """
+    Load a class defined in a solution file (its Agent by default, or e.g. its
+    BatchAgent), executing each distinct source at most once per process.
+    Returns the class or None if the file doesn't exist or doesn't define it.
+    """
+    code_hash = get_file_hash(path)
+    if code_hash is None:
+        return None
+
+    namespace = _cache_get(_solution_namespaces, code_hash)
+    if namespace is None:
+        code = path.read_text()
+        code_hash = get_code_hash(code)
+        namespace = {}
+        exec(compile_solution(code, str(path), code_hash), namespace)
+        _cache_put(_solution_namespaces, code_hash, namespace, _MAX_SOLUTIONS)
+    return namespace.get(class_name)
+
+
+def prune_solution_cache():
+    """
+    Delete the compiled solutions that weren't used for SOLUTION_CACHE_MAX_AGE_DAYS,
+    then the least recently used ones beyond SOLUTION_CACHE_MAX_ENTRIES.
+    """
+    entries = []
+    for path in get_cache_dir().glob("*.marshal"):
+        try:
+            entries.append((path.stat().st_mtime, path))
+        except OSError:
+            pass
+    entries.sort(reverse=True)
+
+    oldest = time.time() - get_max_age_days() * 86400
+    stale = [path for i, (mtime, path) in enumerate(entries) if mtime < oldest or i >= get_max_entries()]
+    for path in stale:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+    if stale:
+        print(f"Pruned {len(stale)} compiled solutions")
@@ -0,0 +1,156 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Add parent directory to path so we can import from misc
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from misc.batch_engine import (
+    DEAL,
+    ERROR,
+    ERROR_AGENT_0,
+    ERROR_AGENT_1,
+    OUTCOMES,
+    load_batch_agent_class,
+    run_batch_negotiations,
+    scalar_batch_agent_class,
+)
+from misc.battlefield import _negotiate, calculate_profit
+from misc.scenario_generator import generate_seeded_scenario_arrays, scenario_arrays_to_dicts
+from misc.solution_cache import load_solution_class
+
+SOLUTIONS_DIR = Path(__file__).parent / "solutions"
+
+
+class GreedyBatchAgent:
+    """tests/solutions/example.py on all the lanes at once."""
+
+    def __init__(self, me, counts, values, max_rounds, lengths):
+        self.values = values
+        self.total = (counts * values).sum(axis=1)
+        self.request = np.where(values > 0, counts, 0)
+
+    def offer(self, offers, active):
+        if offers is None:
+            accept = np.zeros(len(self.values), dtype=bool)
+        else:
+            accept = 2 * (offers * self.values).sum(axis=1) >= self.total
+        return accept, self.request
+
+
+class ScriptedBatchAgent:
+    """Returns the same answer every turn."""
+
+    answer = None
+
+    def __init__(self, me, counts, values, max_rounds, lengths):
+        self.counts = counts
+
+    def offer(self, offers, active):
+        return self.answer(self.counts)
+
+
+def play_scalar(AgentClass0, AgentClass1, scenarios):
+    """(outcome, turns, profit_0, profit_1) of every scenario with the scalar engine."""
+    results = []
+    for s in scenarios:
+        items_0, items_1, outcome, turns = _negotiate(
+            AgentClass0(0, s["counts"], s["player_0"], s["rounds"]),
+            AgentClass1(1, s["counts"], s["player_1"], s["rounds"]),
+            s["counts"],
+            s["rounds"],
+        )
+        results.append(
+            (outcome, turns, calculate_profit(items_0, s["player_0"]), calculate_profit(items_1, s["player_1"]))
+        )
+    return results
+
+
+def rows(results):
+    return [
+        (OUTCOMES[outcome], turns, profit_0, profit_1)
+        for outcome, turns, profit_0, profit_1 in zip(
+            results["outcome"].tolist(),
+            results["turns"].tolist(),
+            results["profit_0"].tolist(),
+            results["profit_1"].tolist(),
+        )
+    ]
+
+
+class TestBatchEngine:
+    """Tests for the lock-step batched negotiation engine."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.arrays = generate_seeded_scenario_arrays(7, 0, 200)
+        self.scenarios = scenario_arrays_to_dicts(self.arrays)
+        self.example = load_solution_class(SOLUTIONS_DIR / "example.py")
+        self.example2 = load_solution_class(SOLUTIONS_DIR / "example2.py")
+
+    def test_scalar_adapter_plays_like_run_negotiation(self):
+        for AgentClass0, AgentClass1 in ((self.example, self.example2), (self.example2, self.example)):
+            results = run_batch_negotiations(
+                scalar_batch_agent_class(AgentClass0), scalar_batch_agent_class(AgentClass1), self.arrays
+            )
+            assert rows(results) == play_scalar(AgentClass0, AgentClass1, self.scenarios)
+
+    def test_batch_agent_plays_like_its_scalar_version(self):
+        results = run_batch_negotiations(GreedyBatchAgent, scalar_batch_agent_class(self.example2), self.arrays)
+
+        assert rows(results) == play_scalar(self.example, self.example2, self.scenarios)
+        deals = results["outcome"] == DEAL
+        assert deals.any()
+        assert (results["items_0"][deals] + results["items_1"][deals] == self.arrays["counts"][deals]).all()
+        assert (results["items_0"][~deals] == 0).all()
+
+    def test_invalid_lanes_are_walk_aways(self):
+        def answer(counts):
+            # Lane 0 asks for more than there is, the others keep everything
+            offers = counts.copy()
+            offers[0, 0] += 1
+            return np.zeros(len(counts), dtype=bool), offers
+
+        ScriptedBatchAgent.answer = staticmethod(answer)
+        results = run_batch_negotiations(GreedyBatchAgent, ScriptedBatchAgent, self.arrays)
+
+        assert results["outcome"][0] == ERROR_AGENT_1
+        assert results["turns"][0] == 1
+        assert results["profit_0"][0] == results["profit_1"][0] == 0
+        assert (results["outcome"][1:] != ERROR_AGENT_1).all()
+
+    def test_malformed_answer_fails_every_lane(self):
+        ScriptedBatchAgent.answer = staticmethod(lambda counts: (True, counts[:, :1]))
+        results = run_batch_negotiations(ScriptedBatchAgent, GreedyBatchAgent, self.arrays)
+
+        assert (results["outcome"] == ERROR_AGENT_0).all()
+        assert (results["turns"] == 1).all()
+
+    def test_exception_fails_the_active_lanes(self):
+        class FailingBatchAgent(GreedyBatchAgent):
+            def offer(self, offers, active):
+                raise RuntimeError("boom")
+
+        results = run_batch_negotiations(FailingBatchAgent, GreedyBatchAgent, self.arrays)
+        assert (results["outcome"] == ERROR_AGENT_0).all()
+        assert (results["turns"] == 0).all()
+
+        class BrokenBatchAgent(GreedyBatchAgent):
+            def __init__(self, *args):
+                raise RuntimeError("boom")
+
+        results = run_batch_negotiations(GreedyBatchAgent, BrokenBatchAgent, self.arrays)
+        assert (results["outcome"] == ERROR).all()
+
+    def test_load_batch_agent_class(self):
+        BatchAgent = load_batch_agent_class("example")
+
+        assert BatchAgent is not None
+        assert hasattr(BatchAgent, "offer")
+        assert load_batch_agent_class("Not A Model") is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
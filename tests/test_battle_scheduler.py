@@ -0,0 +1,331 @@
+import sys
+import tracemalloc
+from concurrent.futures import Future
+from pathlib import Path
+
+import pytest
+
+# Add parent directory to path so we can import from misc
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from misc import battlefield
+from misc.battlefield import (
+    BattleScheduler,
+    _build_battle_units,
+    _model_pairs,
+    _play_scenarios,
+    _sample_quota,
+    generate_negotiation_data,
+    run_battles,
+)
+from misc.profiling import summarize_agent_usage
+
+ROOT_DIR = Path(__file__).parent.parent
+SOLUTION_FILES = {
+    "example": ROOT_DIR / "tests" / "solutions" / "example.py",
+    "example2": ROOT_DIR / "tests" / "solutions" / "example2.py",
+    "human": ROOT_DIR / "solutions" / "Top_Human___Robert_Speed.py",
+}
+
+
+def patched_load_agent(display_name: str):
+    solutions_path = SOLUTION_FILES.get(display_name)
+    if solutions_path is None:
+        return None
+    namespace = {}
+    exec(solutions_path.read_text(), namespace)
+    return namespace.get("Agent")
+
+
+def play_model_pair(model_0, model_1, negotiation_data, num_samples):
+    """Reference: both orders of a model pair over every scenario, in one go."""
+    display_name_0 = model_0["display_name"]
+    display_name_1 = model_1["display_name"]
+    Agent0Class = patched_load_agent(display_name_0)
+    Agent1Class = patched_load_agent(display_name_1)
+    pair_results = {display_name_0: {"total_profit": 0}, display_name_1: {"total_profit": 0}}
+    canonical_key = tuple(sorted([display_name_0, display_name_1]))
+    pair_scenarios = {canonical_key: []}
+
+    orders = [
+        (display_name_0, display_name_1, Agent0Class, Agent1Class),
+        (display_name_1, display_name_0, Agent1Class, Agent0Class),
+    ]
+    for name_0, name_1, AgentClass0, AgentClass1 in orders:
+        profits, samples, _ = _play_scenarios(
+            name_0,
+            name_1,
+            AgentClass0,
+            AgentClass1,
+            negotiation_data,
+            _sample_quota(name_0, canonical_key[0], num_samples),
+        )
+        for name, profit in profits.items():
+            pair_results[name]["total_profit"] += profit
+        pair_scenarios[canonical_key].extend(samples)
+    return pair_results, pair_scenarios
+
+
+class TestBattleScheduler:
+    """Tests for the (pair, order, scenario-chunk) battle scheduler."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        monkeypatch.setenv("MAX_SCENARIO_DATA", "9")
+        monkeypatch.setenv("NUM_SAMPLES", "5")
+        monkeypatch.setattr(battlefield, "load_agent_class", patched_load_agent)
+        self.models = [{"display_name": name} for name in SOLUTION_FILES]
+
+    def serial_reference(self, data, num_samples):
+        results = {m["display_name"]: {"total_profit": 0} for m in self.models}
+        scenarios = {}
+        for i, model_0 in enumerate(self.models):
+            for model_1 in self.models[i + 1 :]:
+                pair_results, pair_scenarios = play_model_pair(model_0, model_1, data, num_samples)
+                for name, stats in pair_results.items():
+                    results[name]["total_profit"] += stats["total_profit"]
+                scenarios.update(pair_scenarios)
+        return results, scenarios
+
+    def test_units_cover_every_pair_order_and_scenario(self):
+        data, _ = generate_negotiation_data()
+        units = _build_battle_units(_model_pairs(self.models), data, 5, 4, "table")
+
+        covered = {}
+        for model_0, model_1, order, start, stop, table_name, _ in units:
+            assert table_name == "table"
+            key = (model_0["display_name"], model_1["display_name"], order)
+            covered.setdefault(key, []).extend(range(start, stop))
+
+        assert len(covered) == 3 * 2
+        for indices in covered.values():
+            assert sorted(indices) == list(range(len(data)))
+
+    def test_units_sorted_by_estimated_cost(self):
+        data, _ = generate_negotiation_data()
+        units = _build_battle_units(_model_pairs(self.models), data, 5, 2, "table")
+
+        costs = [battlefield._estimate_unit_cost(data[unit[3] : unit[4]]) for unit in units]
+        assert costs == sorted(costs, reverse=True)
+
+    def test_units_weighted_by_agent_costs(self):
+        data, _ = generate_negotiation_data()
+        # example2 has no cost, it gets the mean of the others
+        agent_costs = {"example": 1.0, "human": 10.0}
+        units = _build_battle_units(
+            _model_pairs(self.models), data, 5, len(data), "table", agent_costs
+        )
+
+        pairs = [(unit[0]["display_name"], unit[1]["display_name"]) for unit in units]
+        assert pairs == [("example2", "human")] * 2 + [("example", "human")] * 2 + [
+            ("example", "example2")
+        ] * 2
+
+    @pytest.mark.parametrize("chunk_size", ["1", "4", "100"])
+    def test_chunked_serial_matches_pair_tasks(self, monkeypatch, chunk_size):
+        monkeypatch.setenv("NUM_PROCESSES", "1")
+        monkeypatch.setenv("SCENARIO_CHUNK_SIZE", chunk_size)
+        data, _ = generate_negotiation_data()
+
+        results, scenarios = run_battles(self.models, data)
+        expected_results, expected_scenarios = self.serial_reference(data, 5)
+
+        assert results == expected_results
+        assert scenarios == expected_scenarios
+
+    def test_pool_matches_pair_tasks(self, monkeypatch):
+        monkeypatch.setenv("NUM_PROCESSES", "2")
+        monkeypatch.setenv("SCENARIO_CHUNK_SIZE", "2")
+        data, _ = generate_negotiation_data()
+
+        results, scenarios = run_battles(self.models, data)
+        expected_results, expected_scenarios = self.serial_reference(data, 5)
+
+        assert results == expected_results
+        assert scenarios == expected_scenarios
+
+    @pytest.mark.parametrize("processes", ["1", "2"])
+    def test_incremental_scheduler_matches_pair_tasks(self, monkeypatch, processes):
+        monkeypatch.setenv("NUM_PROCESSES", processes)
+        data, _ = generate_negotiation_data()
+
+        with BattleScheduler(data, num_models=len(self.models)) as scheduler:
+            scheduler.add_model(self.models[0])
+            # A single model has nobody to battle yet
+            assert not scheduler._pending_units and not scheduler._futures
+            for model in self.models[1:]:
+                scheduler.add_model(model)
+            results, scenarios = scheduler.results()
+
+        expected_results, expected_scenarios = self.serial_reference(data, 5)
+        assert results == expected_results
+        assert scenarios == expected_scenarios
+
+    def test_battles_start_when_a_model_is_added(self, monkeypatch):
+        monkeypatch.setenv("NUM_PROCESSES", "2")
+        monkeypatch.setenv("SCENARIO_CHUNK_SIZE", "3")
+        data, _ = generate_negotiation_data()
+
+        with BattleScheduler(data, num_models=len(self.models)) as scheduler:
+            scheduler.add_model(self.models[0])
+            scheduler.add_model(self.models[1])
+            # One pair, two orders, three chunks of scenarios (handed out to the
+            # pool, or queued for results() when there's a single CPU)
+            with scheduler._lock:
+                assert len(scheduler._futures) + len(scheduler._pending_units) == 6
+            scheduler.add_model(self.models[2])
+            with scheduler._lock:
+                assert len(scheduler._futures) + len(scheduler._pending_units) == 18
+            scheduler.results()
+
+    def test_costly_units_of_a_later_model_run_first(self, monkeypatch):
+        monkeypatch.setenv("NUM_PROCESSES", "1")
+        monkeypatch.setenv("SCENARIO_CHUNK_SIZE", "100")
+        data, _ = generate_negotiation_data()
+        played = []
+        run_battle_unit = battlefield._run_battle_unit
+
+        def recording_run(unit):
+            played.append((unit[0]["display_name"], unit[1]["display_name"]))
+            return run_battle_unit(unit)
+
+        monkeypatch.setattr(battlefield, "_run_battle_unit", recording_run)
+        agent_costs = {"example": 1.0, "human": 10.0}
+        with BattleScheduler(data, num_models=len(self.models), agent_costs=agent_costs) as scheduler:
+            for model in self.models:
+                scheduler.add_model(model)
+            scheduler.results()
+
+        # The cheap pair was queued first, the pairs with the costly human overtake it
+        assert played == [("example2", "human")] * 2 + [("example", "human")] * 2 + [
+            ("example", "example2")
+        ] * 2
+
+    def test_idle_workers_take_the_costliest_pending_unit(self, monkeypatch):
+        monkeypatch.setenv("NUM_PROCESSES", "2")
+        monkeypatch.setenv("SCENARIO_CHUNK_SIZE", "3")
+        monkeypatch.setattr(battlefield.multiprocessing, "cpu_count", lambda: 2)
+        submitted = []
+
+        class RecordingExecutor:
+            def __init__(self, max_workers):
+                pass
+
+            def submit(self, fn, unit):
+                submitted.append((unit[0]["display_name"], unit[1]["display_name"], Future()))
+                return submitted[-1][2]
+
+            def shutdown(self, cancel_futures):
+                pass
+
+        monkeypatch.setattr(battlefield, "ProcessPoolExecutor", RecordingExecutor)
+        data, _ = generate_negotiation_data()
+        agent_costs = {"example": 1.0, "human": 10.0}
+
+        with BattleScheduler(data, num_models=len(self.models), agent_costs=agent_costs) as scheduler:
+            scheduler.add_model(self.models[0])
+            scheduler.add_model(self.models[1])
+            scheduler.add_model(self.models[2])
+            # One unit per worker, the rest waits in the queue
+            assert len(submitted) == 2
+            assert len(scheduler._pending_units) == 16
+            submitted[0][2].set_result(None)
+            assert len(submitted) == 3
+
+        assert submitted[2][1] == "human"
+
+    def test_model_that_fails_to_be_added_is_skipped(self, monkeypatch):
+        monkeypatch.setenv("NUM_PROCESSES", "1")
+        data, _ = generate_negotiation_data()
+        build_battle_units = battlefield._build_battle_units
+
+        def failing_build(pairs, *args):
+            if any(model_1["display_name"] == "human" for _, model_1 in pairs):
+                raise RuntimeError("boom")
+            return build_battle_units(pairs, *args)
+
+        monkeypatch.setattr(battlefield, "_build_battle_units", failing_build)
+        with BattleScheduler(data, num_models=len(self.models)) as scheduler:
+            added = [scheduler.add_model(model) for model in self.models]
+            results, _ = scheduler.results()
+
+        assert added == [True, True, False]
+        assert [model["display_name"] for model in scheduler.models] == ["example", "example2"]
+        self.models = self.models[:2]
+        expected_results, _ = self.serial_reference(data, 5)
+        assert results == expected_results
+
+    def test_no_workers_are_left_when_the_scenario_table_fails(self, monkeypatch):
+        monkeypatch.setenv("NUM_PROCESSES", "2")
+        executors = []
+        monkeypatch.setattr(battlefield, "ProcessPoolExecutor", lambda **kwargs: executors.append(kwargs))
+
+        def create(negotiation_data):
+            raise OSError("No space left on device")
+
+        monkeypatch.setattr(battlefield.ScenarioTable, "create", create)
+        data, _ = generate_negotiation_data()
+
+        with pytest.raises(OSError):
+            BattleScheduler(data, num_models=len(self.models))
+        assert executors == []
+
+    def test_every_negotiation_is_recorded(self, monkeypatch):
+        monkeypatch.setenv("NUM_PROCESSES", "1")
+        monkeypatch.setenv("SCENARIO_CHUNK_SIZE", "4")
+        data, _ = generate_negotiation_data()
+
+        with BattleScheduler(data, num_models=len(self.models)) as scheduler:
+            for model in self.models:
+                scheduler.add_model(model)
+            results, _ = scheduler.results()
+            rows = scheduler.negotiation_results()
+
+        # One row per pair, order and scenario
+        assert len(rows) == 3 * 2 * len(data)
+        played = {(row[1], row[2]) for row in rows}
+        assert len(played) == 6
+        for name_0, name_1 in played:
+            assert sorted(row[0] for row in rows if row[1:3] == (name_0, name_1)) == list(
+                range(len(data))
+            )
+
+        totals = {name: 0 for name in results}
+        for row in rows:
+            scenario_id, name_0, name_1, outcome, profit_0, profit_1, turns = row[:7]
+            totals[name_0] += profit_0
+            totals[name_1] += profit_1
+            assert 0 < turns <= data[scenario_id]["rounds"] or outcome == "error"
+            # Agents are only measured with PROFILE_AGENTS=true
+            assert row[7:] == (None,) * 6
+        assert totals == {name: stats["total_profit"] for name, stats in results.items()}
+
+    @pytest.mark.parametrize("processes", ["1", "2"])
+    def test_agent_usage_is_profiled(self, monkeypatch, processes):
+        monkeypatch.setenv("NUM_PROCESSES", processes)
+        monkeypatch.setenv("PROFILE_AGENTS", "true")
+        data, _ = generate_negotiation_data()
+
+        with BattleScheduler(data, num_models=len(self.models)) as scheduler:
+            for model in self.models:
+                scheduler.add_model(model)
+            scheduler.results()
+            rows = scheduler.negotiation_results()
+            # Memory is only traced while the units are played, in this process or the workers
+            assert not tracemalloc.is_tracing()
+            if scheduler._executor is not None:
+                workers = [scheduler._executor.submit(tracemalloc.is_tracing) for _ in range(4)]
+                assert not any(worker.result() for worker in workers)
+
+        assert all(seconds >= 0 for row in rows for seconds in row[7:11])
+        assert all(row[11] > 0 and row[12] > 0 for row in rows)
+        summary = summarize_agent_usage(rows)
+        assert set(summary) == {model["display_name"] for model in self.models}
+        for stats in summary.values():
+            assert stats["negotiations"] == 2 * 2 * len(data)
+            assert stats["wall_time"] >= stats["max_wall_time"] > 0
+            assert stats["peak_memory"] > 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -1,14 +1,16 @@
 import json
 import sys
+from collections import UserList
 from pathlib import Path
 
+import numpy as np
 import pytest
 import yaml
 
 # Add parent directory to path so we can import from misc
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from misc.battlefield import generate_negotiation_data, run_battles
+from misc.battlefield import generate_negotiation_data, run_battles, run_negotiation
 
 
 class TestBattles:
@@ -213,5 +215,76 @@ class TestBattles:
         assert isinstance(parsed, dict)
 
 
+class ScriptedAgent:
+    """Agent making a fixed list of offers, then accepting."""
+
+    def __init__(self, offers):
+        self.offers = list(offers)
+
+    def offer(self, o):
+        return self.offers.pop(0) if self.offers else None
+
+
+class TestOfferValidation:
+    """Tests for the validation of the agents' counter-offers."""
+
+    counts = [2, 3, 1]
+
+    @pytest.mark.parametrize(
+        "bad_offer",
+        [
+            [1, 1],  # wrong length
+            [1, 1, 1, 1],
+            {1, 2, 0},  # not a sequence
+            "110",
+            [1.0, 1, 1],  # not ints
+            np.array([1.0, 1.0, 1.0]),
+            ["1", 1, 1],
+            [None, 1, 1],
+            [[1], 1, 1],  # unhashable
+            [-1, 1, 1],  # out of bounds
+            [3, 1, 1],
+            [1, 1, 2],
+        ],
+    )
+    def test_invalid_offer_is_a_walk_away(self, bad_offer):
+        items_0, items_1, outcome, history = run_negotiation(
+            ScriptedAgent([bad_offer]), ScriptedAgent([]), self.counts, 3, "a", "b"
+        )
+        assert (items_0, items_1, outcome) == (None, None, "error_agent_0")
+        assert history == [{"round": 1, "a offer": bad_offer, "b offer": None}]
+
+        items_0, items_1, outcome, history = run_negotiation(
+            ScriptedAgent([[2, 3, 1], [2, 3, 1]]), ScriptedAgent([bad_offer]), self.counts, 3, "a", "b"
+        )
+        assert (items_0, items_1, outcome) == (None, None, "error_agent_1")
+        assert len(history) == 1
+
+    def test_valid_offers_are_played(self):
+        # Agent 1 keeps everything, then agent 0 accepts
+        items_0, items_1, outcome, history = run_negotiation(
+            ScriptedAgent([[2, 3, 1]]), ScriptedAgent([[2, 3, 1]]), self.counts, 3, "a", "b"
+        )
+        assert (items_0, items_1, outcome) == ([0, 0, 0], [2, 3, 1], "deal")
+        assert len(history) == 2
+
+    @pytest.mark.parametrize(
+        "offer",
+        [(1, 3, 0), UserList([1, 3, 0]), type("Offer", (list,), {})([1, 3, 0]), np.array([1, 3, 0]), [np.int64(1), 3, 0]],
+    )
+    def test_integer_sequences_are_read_as_lists_of_ints(self, offer):
+        items_0, items_1, outcome, history = run_negotiation(
+            ScriptedAgent([offer]), ScriptedAgent([]), self.counts, 3, "a", "b"
+        )
+        assert (items_0, items_1, outcome) == ([1, 3, 0], [1, 0, 1], "deal")
+        assert all(type(quantity) is int for quantity in items_0 + items_1 + history[0]["a offer"])
+
+    def test_bools_are_ints(self):
+        items_0, items_1, outcome, _ = run_negotiation(
+            ScriptedAgent([[True, 0, False]]), ScriptedAgent([]), self.counts, 3, "a", "b"
+        )
+        assert (items_0, items_1, outcome) == ([True, 0, False], [1, 3, 1], "deal")
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,89 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add parent directory to path so we can import the benchmarks
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from benchmarks import engine
+from misc import battlefield
+
+
+class TestEngineBenchmarks:
+    """Tests for the engine benchmark suite (on a tiny workload)."""
+
+    def test_results_are_machine_readable(self, monkeypatch):
+        monkeypatch.setenv("MAX_SCENARIO_DATA", "10")
+        monkeypatch.delenv("NUM_PROCESSES", raising=False)
+        load_agent_class = battlefield.load_agent_class
+        solutions = {
+            name: path for name, path in engine.DEFAULT_SOLUTIONS.items() if name in ("example", "human")
+        }
+        results = engine.run_benchmarks(
+            solutions, num_scenarios=4, process_counts=[1], repeat=1, generated_scenarios=300
+        )
+
+        assert results["config"]["scenarios"] == 4
+        assert results["scenario_generation"]["scenarios"] == 300
+        assert results["scenario_generation"]["bulk"]["scenarios_per_second"] > 0
+        assert set(results["config"]["solutions"]) == {"example", "human"}
+        assert results["run_negotiation"]["negotiations"] == 2 * 4
+        assert set(results["run_negotiation"]["pairs"]) == {"example vs human", "human vs example"}
+        assert results["offer_validation"]["offers"] > 0
+        assert results["offer_validation"]["overhead_percent"] >= 0
+        assert results["battle_units"]["pairs"] == 1
+        assert [r["processes"] for r in results["run_battles"]] == [1]
+        assert results["run_battles"][0]["speedup"] == 1
+        assert set(results["reference_agents"]) >= {"ported", "scalar", "speedup"}
+
+        # The engine settings are restored
+        assert os.environ["MAX_SCENARIO_DATA"] == "10"
+        assert "NUM_PROCESSES" not in os.environ
+        assert battlefield.load_agent_class is load_agent_class
+
+    def test_skipped_negotiations_fail_the_benchmark(self, tmp_path):
+        scenarios = [
+            {"counts": [1, 2], "player_0": [3, 1], "player_1": [1, 2], "rounds": 3},
+            {"counts": [2, 1], "player_0": [1, 3], "player_1": [2, 1], "rounds": 2},
+        ]
+        models = [
+            {"display_name": "example", "solution_path": str(engine.DEFAULT_SOLUTIONS["example"])},
+            {"display_name": "missing", "solution_path": str(tmp_path / "missing.py")},
+        ]
+
+        with pytest.raises(RuntimeError, match="played 0 of 2 negotiations"):
+            engine.bench_battle_units(models, scenarios, repeat=1)
+
+    def test_regressions_beyond_tolerance(self):
+        baseline = {
+            "run_negotiation": {"negotiations_per_second": 1000},
+            "battle_units": {"negotiations_per_second": 1000},
+            "run_battles": [{"processes": 1, "negotiations_per_second": 1000}],
+        }
+        results = {
+            "run_negotiation": {"negotiations_per_second": 850},
+            "battle_units": {"negotiations_per_second": 700},
+            "run_battles": [
+                {"processes": 1, "negotiations_per_second": 1200},
+                {"processes": 2, "negotiations_per_second": 10},
+            ],
+        }
+
+        assert engine.find_regressions(results, baseline, 0.2) == ["battle_units: 1000 -> 700 negotiations/s"]
+
+        baseline["scenario_generation"] = {"scenarios_per_second": 50000}
+        results["scenario_generation"] = {"scenarios_per_second": 20000}
+        assert "scenario_generation: 50000 -> 20000 scenarios/s" in engine.find_regressions(
+            results, baseline, 0.2
+        )
+
+        results["offer_validation"] = {"overhead_percent": 6.5}
+        assert not any(r.startswith("offer_validation") for r in engine.find_regressions(results, baseline, 0.2))
+        results["offer_validation"] = {"overhead_percent": 9.5}
+        assert engine.find_regressions(results, baseline, 0.2)[0] == "offer_validation: 9.50% of turn time"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,146 @@
+import sys
+from pathlib import Path
+
+import psycopg2
+import pytest
+
+# Add parent directory to path so we can import from db
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from db import connection
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.queries.append(query)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.queries = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakePool:
+    instances = []
+
+    def __init__(self, min_size, max_size, dsn):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle = []
+        self.created = []
+        self.discarded = []
+        FakePool.instances.append(self)
+
+    def getconn(self):
+        if self.idle:
+            return self.idle.pop()
+        conn = FakeConnection()
+        self.created.append(conn)
+        return conn
+
+    def putconn(self, conn, close=False):
+        if close:
+            self.discarded.append(conn)
+        else:
+            self.idle.append(conn)
+
+    def closeall(self):
+        self.idle.clear()
+
+
+class TestConnectionPool:
+    """Tests for the pooled database session layer."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        FakePool.instances.clear()
+        monkeypatch.setattr(connection, "DATABASE_URL", "postgresql://test")
+        monkeypatch.setattr(connection.pool, "ThreadedConnectionPool", FakePool)
+        monkeypatch.setenv("DB_POOL_MIN_SIZE", "2")
+        monkeypatch.setenv("DB_POOL_MAX_SIZE", "7")
+        connection.close_pool()
+        yield
+        connection.close_pool()
+
+    def test_pool_is_shared_and_sized_from_env(self):
+        assert connection.get_pool() is connection.get_pool()
+        assert len(FakePool.instances) == 1
+        assert (FakePool.instances[0].min_size, FakePool.instances[0].max_size) == (2, 7)
+
+    def test_connections_are_reused(self):
+        with connection.db_session() as cursor:
+            cursor.execute("SELECT 1;")
+        with connection.db_session() as cursor:
+            cursor.execute("SELECT 2;")
+
+        created = FakePool.instances[0].created
+        assert len(created) == 1
+        assert created[0].commits == 2
+
+    def test_rollback_on_error(self):
+        with pytest.raises(RuntimeError):
+            with connection.db_session() as cursor:
+                cursor.execute("INSERT ...")
+                raise RuntimeError("boom")
+
+        conn = FakePool.instances[0].created[0]
+        assert conn.commits == 0
+        # One after the health check of the new connection, one for the error
+        assert conn.rollbacks == 2
+        # Still healthy, back in the pool
+        assert FakePool.instances[0].idle == [conn]
+
+    def test_idle_connections_are_health_checked(self, monkeypatch):
+        with connection.db_session() as cursor:
+            cursor.execute("SELECT 42;")
+        conn = FakePool.instances[0].created[0]
+        # Never used before: checked first
+        assert conn.queries == ["SELECT 1;", "SELECT 42;"]
+
+        # Used recently: no extra round trip
+        with connection.db_session() as cursor:
+            pass
+        assert conn.queries == ["SELECT 1;", "SELECT 42;"]
+
+        # Idle for too long and dropped by the server: replaced by a new connection
+        monkeypatch.setenv("DB_HEALTH_CHECK_SECONDS", "0")
+        conn.broken = True
+        with connection.db_session() as cursor:
+            cursor.execute("SELECT 3;")
+
+        pool = FakePool.instances[0]
+        assert pool.discarded == [conn]
+        assert pool.created[1].queries[-1] == "SELECT 3;"
+
+    def test_requires_database_url(self, monkeypatch):
+        monkeypatch.setattr(connection, "DATABASE_URL", None)
+        with pytest.raises(ValueError, match="DATABASE_URL"):
+            connection.get_pool()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -1,12 +1,59 @@
+import random
 import sys
 from pathlib import Path
 
+import numpy as np
 import pytest
 
 # Add parent directory to path so we can import from misc
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from misc.battlefield import generate_negotiation_data
+from misc import scenario_generator
+from misc.scenario_generator import (
+    MAX_ITEMS,
+    QUICK_MAX_ATTEMPTS,
+    SCENARIOS_PER_BLOCK,
+    generate_scenario_arrays,
+    generate_seeded_scenario_arrays,
+    get_tournament_id,
+    get_tournament_seed,
+    iter_scenarios,
+    scenario_arrays_to_dicts,
+    tournament_seed_is_fixed,
+)
+
+
+def _baseline_scenarios(num_scenarios: int, seed: int) -> list[tuple]:
+    """
+    (length, rounds, player_0, player_1) of scenarios from the original one at a time
+    generator: up to 1000 attempts at each player's values, redrawn if none is valid.
+    """
+    rng = random.Random(seed)
+
+    def player_values(counts, target_worth):
+        for _ in range(1000):
+            values = [0 if rng.random() < 0.05 else rng.randint(1, 10) for _ in counts[:-2]]
+            remaining = target_worth - sum(c * v for c, v in zip(counts, values))
+            c1, c2 = counts[-2:]
+            for v1 in range(11):
+                leftover = remaining - c1 * v1
+                if leftover >= 0 and leftover % c2 == 0 and leftover // c2 <= 10:
+                    values += [v1, leftover // c2]
+                    if values.count(0) * 2 < len(values):
+                        return values
+                    break
+        return None
+
+    scenarios = []
+    while len(scenarios) < num_scenarios:
+        counts = [rng.randint(1, 5) for _ in range(rng.randint(2, 10))]
+        target_worth = rng.choice([32, 64, 128])
+        player_0 = player_values(counts, target_worth)
+        player_1 = player_0 and player_values(counts, target_worth)
+        if player_1:
+            scenarios.append((len(counts), target_worth // 4, player_0, player_1))
+    return scenarios
 
 
 class TestGenerateNegotiationData:
@@ -251,6 +298,141 @@ class TestGenerateNegotiationData:
         if len(data) > 0:
             assert total_target_worth % 32 == 0
 
+    @pytest.mark.parametrize("max_scenario_data", ["1", "7", "20", "300"])
+    def test_generates_exactly_max_scenario_data(self, monkeypatch, max_scenario_data):
+        """Test that scenarios are never dropped: exactly MAX_SCENARIO_DATA are returned."""
+        monkeypatch.setenv("MAX_SCENARIO_DATA", max_scenario_data)
+
+        data, total_target_worth = generate_negotiation_data()
+
+        assert len(data) == int(max_scenario_data)
+
+
+class TestGenerateScenarioArrays:
+    """Tests for the batched scenario generator."""
+
+    def test_large_batch_is_valid(self):
+        """Test the generation rules on a large batch, directly on the arrays."""
+        arrays = generate_scenario_arrays(5000, np.random.default_rng(0))
+        lengths = arrays["lengths"]
+        item_mask = np.arange(MAX_ITEMS) < lengths[:, None]
+
+        assert arrays["counts"].shape == (5000, MAX_ITEMS)
+        assert ((lengths >= 2) & (lengths <= 10)).all()
+        assert ((arrays["counts"] >= 1) | ~item_mask).all()
+        assert (arrays["counts"] <= 5).all()
+        assert (arrays["counts"][~item_mask] == 0).all()
+        assert set(np.unique(arrays["worths"])) <= {32, 64, 128}
+        assert (arrays["rounds"] == arrays["worths"] // 4).all()
+
+        for player in ("player_0", "player_1"):
+            values = arrays[player]
+            assert ((values >= 0) & (values <= 10)).all()
+            assert (values[~item_mask] == 0).all()
+            worth = (arrays["counts"] * values).sum(axis=1)
+            assert (worth == arrays["worths"]).all()
+            zero_count = ((values == 0) & item_mask).sum(axis=1)
+            assert (zero_count * 2 < lengths).all()
+
+    def test_unsolvable_scenarios_are_never_solved(self):
+        rng = np.random.default_rng(5)
+        lengths = rng.integers(2, MAX_ITEMS + 1, size=3000)
+        counts = rng.integers(1, 6, size=(3000, MAX_ITEMS), dtype=np.int16)
+        counts[np.arange(MAX_ITEMS) >= lengths[:, None]] = 0
+        targets = rng.choice(scenario_generator.TARGET_WORTHS, size=3000)
+
+        unsolvable = scenario_generator._unsolvable(counts, lengths, targets)
+        _, valid = scenario_generator._draw_player_values(rng, counts, lengths, targets, 200)
+        assert unsolvable.any()
+        assert not (unsolvable & valid.any(axis=1)).any()
+
+    def test_same_mix_as_baseline_generator(self):
+        """Test that the item counts, rounds and zero values are as common as with the original generator."""
+        num_scenarios = 3000
+        baseline = _baseline_scenarios(num_scenarios, 0)
+        baseline_lengths = np.array([length for length, _, _, _ in baseline])
+        baseline_zeros = sum(p0.count(0) + p1.count(0) for _, _, p0, p1 in baseline)
+
+        arrays = generate_seeded_scenario_arrays(0, 0, num_scenarios)
+        lengths = arrays["lengths"]
+        item_mask = np.arange(MAX_ITEMS) < lengths[:, None]
+        zeros = sum(((arrays[player] == 0) & item_mask).sum() for player in ("player_0", "player_1"))
+
+        assert abs(lengths.mean() - baseline_lengths.mean()) < 0.15
+        assert abs((lengths == 10).mean() - (baseline_lengths == 10).mean()) < 0.02
+        for rounds in (8, 16, 32):
+            baseline_share = np.mean([r == rounds for _, r, _, _ in baseline])
+            assert abs((arrays["rounds"] == rounds).mean() - baseline_share) < 0.03
+        baseline_zero_share = baseline_zeros / (2 * baseline_lengths.sum())
+        assert abs(zeros / (2 * lengths.sum()) - baseline_zero_share) < 0.015
+
+    def test_quick_max_attempts(self):
+        """Test that the opt-in attempt cap still gives valid, replayable scenarios."""
+        arrays = generate_seeded_scenario_arrays(3, 0, 500, max_attempts=QUICK_MAX_ATTEMPTS)
+        again = generate_seeded_scenario_arrays(3, 0, 500, max_attempts=QUICK_MAX_ATTEMPTS)
+
+        assert len(arrays["lengths"]) == 500
+        for key in arrays:
+            assert (arrays[key] == again[key]).all()
+        for player in ("player_0", "player_1"):
+            assert ((arrays["counts"] * arrays[player]).sum(axis=1) == arrays["worths"]).all()
+
+    def test_arrays_to_dicts(self):
+        """Test that dicts are trimmed to the number of item types of each scenario."""
+        arrays = generate_scenario_arrays(50, np.random.default_rng(1))
+        data = scenario_arrays_to_dicts(arrays)
+
+        assert len(data) == 50
+        for i, scenario in enumerate(data):
+            assert len(scenario["counts"]) == arrays["lengths"][i]
+            assert scenario["rounds"] == arrays["rounds"][i]
+            assert all(isinstance(c, int) for c in scenario["counts"])
+
+    def test_empty(self):
+        """Test that zero scenarios give empty arrays."""
+        arrays = generate_scenario_arrays(0)
+
+        assert arrays["counts"].shape == (0, MAX_ITEMS)
+        assert len(arrays["lengths"]) == 0
+
+
+class TestSeededScenarioStreams:
+    """Tests for the replayable seeded scenario streams."""
+
+    def test_same_seed_same_data(self, monkeypatch):
+        """Test that a seed always regenerates the same tournament."""
+        monkeypatch.setenv("MAX_SCENARIO_DATA", "30")
+
+        assert generate_negotiation_data(1234) == generate_negotiation_data(1234)
+        assert generate_negotiation_data(1234) != generate_negotiation_data(1235)
+
+    def test_slices_match_full_stream(self):
+        """Test that any slice, across block boundaries, matches the full stream."""
+        full = scenario_arrays_to_dicts(generate_seeded_scenario_arrays(7, 0, 3 * SCENARIOS_PER_BLOCK))
+
+        for start, stop in [(0, 1), (10, 20), (SCENARIOS_PER_BLOCK - 3, SCENARIOS_PER_BLOCK + 5), (300, 700)]:
+            sliced = scenario_arrays_to_dicts(generate_seeded_scenario_arrays(7, start, stop))
+            assert sliced == full[start:stop]
+
+    def test_iter_scenarios(self):
+        """Test that the lazy iterator yields the same stream, endless without a stop."""
+        expected = scenario_arrays_to_dicts(generate_seeded_scenario_arrays(7, 250, 270))
+
+        assert list(iter_scenarios(7, 250, 270)) == expected
+        endless = iter_scenarios(7, 250)
+        assert [next(endless) for _ in range(20)] == expected
+
+    def test_tournament_seed_from_env(self, monkeypatch):
+        """Test that TOURNAMENT_SEED replays a tournament and is random otherwise."""
+        monkeypatch.setenv("TOURNAMENT_SEED", "42")
+        assert get_tournament_seed() == 42
+        assert tournament_seed_is_fixed()
+
+        monkeypatch.delenv("TOURNAMENT_SEED")
+        assert 0 <= get_tournament_seed() < 2**63
+        assert not tournament_seed_is_fixed()
+        assert get_tournament_id(255, 20) == "00000000000000ff-20"
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,60 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add parent directory to path so we can import from misc
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from misc import git
+
+
+class TestNewestCommitInSolutions:
+    """Tests for the single-walk lookup of the newest commit in solutions."""
+
+    def test_matches_per_file_lookup(self):
+        newest_commit = None
+        newest_time = None
+        for file in (git._repo_path / "solutions").glob("*.py"):
+            commits = list(git._repo.iter_commits(paths=str(file), max_count=1))
+            if commits and (newest_time is None or commits[0].committed_datetime > newest_time):
+                newest_time = commits[0].committed_datetime
+                newest_commit = commits[0].hexsha
+
+        assert git.get_newest_commit_in_solutions() == newest_commit
+
+    def test_no_solutions(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(git, "_repo_path", tmp_path)
+        (tmp_path / "solutions").mkdir()
+        assert git.get_newest_commit_in_solutions() is None
+
+
+class TestCodeLinks:
+    """Tests for the code links built from the cached origin URL and branch."""
+
+    def test_build_code_link_is_pure(self):
+        link = git.build_code_link("https://github.com/owner/repo", "abc123", "Model 1.5")
+        assert link == "https://github.com/owner/repo/blob/abc123/solutions/Model_1_5.py"
+
+    def test_origin_is_resolved_once(self, monkeypatch):
+        git.get_origin_base_url.cache_clear()
+        calls = []
+
+        class Remotes:
+            @property
+            def origin(self):
+                calls.append(1)
+                return type("Origin", (), {"url": "git@github.com:owner/repo.git"})()
+
+        monkeypatch.setattr(git, "_repo", type("Repo", (), {"remotes": Remotes()})())
+        try:
+            links = [git.get_code_link_at_commit("abc123", "model") for _ in range(3)]
+        finally:
+            git.get_origin_base_url.cache_clear()
+
+        assert links == ["https://github.com/owner/repo/blob/abc123/solutions/model.py"] * 3
+        assert len(calls) == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -1,5 +1,7 @@
 """Tests for job.py provider logic."""
+import asyncio
 import sys
+import time
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
@@ -86,5 +88,94 @@ class TestJobProviderLogic:
                 self.job.call_llm_api("test-model", "system", "user", provider="aihubmix")
 
 
+class TestConcurrentGeneration:
+    """Tests for the concurrent code generation stage of job.py."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        import job
+
+        self.job = job
+        self.in_flight = {"openrouter": 0, "aihubmix": 0}
+        self.max_in_flight = {"openrouter": 0, "aihubmix": 0}
+        self.saved = {}
+
+        def make_client(provider):
+            async def create(model, messages):
+                self.in_flight[provider] += 1
+                self.max_in_flight[provider] = max(
+                    self.max_in_flight[provider], self.in_flight[provider]
+                )
+                await asyncio.sleep(0.2)
+                self.in_flight[provider] -= 1
+                if model == "broken-model":
+                    raise Exception("Unreachable model")
+                content = f"```python\nclass Agent:  # {model}\n    pass\n```"
+                return MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
+
+            client = MagicMock()
+            client.chat.completions.create = create
+            return client
+
+        monkeypatch.setattr(job, "async_openrouter_client", make_client("openrouter"))
+        monkeypatch.setattr(job, "async_aihubmix_client", make_client("aihubmix"))
+        monkeypatch.setattr(job, "validate_code", lambda code: (True, None))
+        monkeypatch.setattr(job, "save_solution", lambda name, code: self.saved.update({name: code}))
+        monkeypatch.setenv("OPENROUTER_CONCURRENCY", "3")
+        monkeypatch.setenv("AIHUBMIX_CONCURRENCY", "1")
+
+    def request(self, name, provider, model_name=None):
+        return {
+            "model": {"display_name": name},
+            "display_name": name,
+            "model_name": model_name or f"{name}-model",
+            "provider": provider,
+            "current_code": None,
+            "samples": [],
+        }
+
+    def test_generates_concurrently_within_provider_limits(self):
+        requests = [self.request(f"or{i}", "openrouter") for i in range(3)]
+        requests += [self.request(f"ah{i}", "aihubmix") for i in range(2)]
+
+        start = time.perf_counter()
+        codes = asyncio.run(self.job.generate_algos(requests, []))
+        elapsed = time.perf_counter() - start
+
+        assert all(codes)
+        assert set(self.saved) == {r["display_name"] for r in requests}
+        assert self.max_in_flight == {"openrouter": 3, "aihubmix": 1}
+        # The two aihubmix calls are serialized, everything else overlaps with them
+        assert elapsed < 0.2 * 4
+
+    def test_failed_generation_returns_none_in_order(self):
+        requests = [
+            self.request("ok", "openrouter"),
+            self.request("broken", "openrouter", model_name="broken-model"),
+        ]
+
+        codes = asyncio.run(self.job.generate_algos(requests, []))
+
+        assert codes[0] is not None
+        assert codes[1] is None
+        assert set(self.saved) == {"ok"}
+
+    def test_on_generated_is_called_as_each_model_is_ready(self):
+        requests = [
+            self.request("ok", "openrouter"),
+            self.request("broken", "openrouter", model_name="broken-model"),
+        ]
+        ready = []
+
+        def on_generated(request):
+            # The solution is saved before its battles can start
+            assert request["display_name"] in self.saved
+            ready.append(request["display_name"])
+
+        asyncio.run(self.job.generate_algos(requests, [], on_generated=on_generated))
+
+        assert ready == ["ok"]
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
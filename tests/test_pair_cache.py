@@ -0,0 +1,146 @@
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add parent directory to path so we can import from misc
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from misc import battlefield, pair_cache
+from misc.battlefield import generate_negotiation_data, run_battles
+
+ROOT_DIR = Path(__file__).parent.parent
+SOLUTION_FILES = {
+    "example": ROOT_DIR / "tests" / "solutions" / "example.py",
+    "example2": ROOT_DIR / "tests" / "solutions" / "example2.py",
+    "human": ROOT_DIR / "solutions" / "Top_Human___Robert_Speed.py",
+}
+
+
+class TestPairCache:
+    """Tests for the incremental tournament: only pairs with a changed side are played."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch, tmp_path):
+        solutions_dir = tmp_path / "solutions"
+        solutions_dir.mkdir()
+        for name, path in SOLUTION_FILES.items():
+            shutil.copy(path, solutions_dir / f"{name}.py")
+        self.solutions_dir = solutions_dir
+
+        def load_agent(display_name):
+            namespace = {}
+            exec((solutions_dir / f"{display_name}.py").read_text(), namespace)
+            return namespace.get("Agent")
+
+        self.played = []
+        run_battle_unit = battlefield._run_battle_unit
+
+        def counting_run_battle_unit(unit):
+            self.played.append(tuple(sorted([unit[0]["display_name"], unit[1]["display_name"]])))
+            return run_battle_unit(unit)
+
+        monkeypatch.setenv("MAX_SCENARIO_DATA", "8")
+        monkeypatch.setenv("NUM_PROCESSES", "1")
+        monkeypatch.setenv("PAIR_CACHE_DIR", str(tmp_path / "pairs"))
+        monkeypatch.setattr(pair_cache, "get_solution_path", lambda name: solutions_dir / f"{name}.py")
+        monkeypatch.setattr(battlefield, "load_agent_class", load_agent)
+        monkeypatch.setattr(battlefield, "_run_battle_unit", counting_run_battle_unit)
+        self.models = [{"display_name": name} for name in SOLUTION_FILES]
+        self.data, _ = generate_negotiation_data(99)
+
+    def test_unchanged_pairs_are_reused(self):
+        results, scenarios = run_battles(self.models, self.data, seed=99)
+        assert len(set(self.played)) == 3
+
+        self.played.clear()
+        cached_results, cached_scenarios = run_battles(self.models, self.data, seed=99)
+
+        assert self.played == []
+        assert cached_results == results
+        assert cached_scenarios == scenarios
+
+    def test_cached_pairs_keep_their_negotiation_results(self):
+        def play():
+            with battlefield.BattleScheduler(self.data, seed=99, num_models=3) as scheduler:
+                for model in self.models:
+                    scheduler.add_model(model)
+                scheduler.results()
+                return scheduler.negotiation_results()
+
+        rows = play()
+        self.played.clear()
+        cached_rows = play()
+
+        assert self.played == []
+        assert len(cached_rows) == 3 * 2 * len(self.data)
+        assert cached_rows == rows
+
+    def test_only_changed_pairs_are_replayed(self):
+        results, scenarios = run_battles(self.models, self.data, seed=99)
+
+        with open(self.solutions_dir / "example2.py", "a") as f:
+            f.write("\n# changed\n")
+        self.played.clear()
+        new_results, new_scenarios = run_battles(self.models, self.data, seed=99)
+
+        assert set(self.played) == {("example", "example2"), ("example2", "human")}
+        assert new_results == results
+        assert new_scenarios == scenarios
+
+    def test_no_cache_without_seed_or_when_disabled(self, monkeypatch):
+        run_battles(self.models, self.data)
+        run_battles(self.models, self.data, seed=99)
+        self.played.clear()
+
+        monkeypatch.setenv("PAIR_CACHE", "false")
+        run_battles(self.models, self.data, seed=99)
+        assert len(set(self.played)) == 3
+
+        # Another scenario set doesn't hit the cache either
+        monkeypatch.setenv("PAIR_CACHE", "true")
+        self.played.clear()
+        data, _ = generate_negotiation_data(100)
+        run_battles(self.models, data, seed=100)
+        assert len(set(self.played)) == 3
+
+    def test_engine_config_is_part_of_the_key(self, monkeypatch):
+        run_battles(self.models, self.data, seed=99)
+        self.played.clear()
+
+        monkeypatch.setenv("SANDBOX_AGENTS", "true")
+        monkeypatch.setenv("TURN_TIMEOUT_SECONDS", "5")
+        key = pair_cache.get_pair_cache_key(("example", "human"), 99, len(self.data), 5)
+        monkeypatch.setenv("TURN_TIMEOUT_SECONDS", "1")
+        assert pair_cache.get_pair_cache_key(("example", "human"), 99, len(self.data), 5) != key
+
+        monkeypatch.setenv("SANDBOX_AGENTS", "false")
+        run_battles(self.models, self.data, seed=99)
+        assert self.played == []
+
+        # Profiled outcome rows hold the agents' usage, unprofiled ones None
+        monkeypatch.setenv("PROFILE_AGENTS", "true")
+        run_battles(self.models, self.data, seed=99)
+        assert len(set(self.played)) == 3
+
+    def test_stale_and_extra_entries_are_pruned(self, monkeypatch):
+        run_battles(self.models, self.data, seed=99)
+        paths = sorted(pair_cache.get_cache_dir().glob("*.json"))
+        assert len(paths) == 3
+
+        # Unused for 40 days
+        old = paths[0].stat().st_mtime - 40 * 86400
+        os.utime(paths[0], (old, old))
+        pair_cache.prune_pair_cache()
+        assert not paths[0].exists()
+
+        monkeypatch.setenv("PAIR_CACHE_MAX_ENTRIES", "1")
+        os.utime(paths[1], (old + 86400, old + 86400))
+        pair_cache.prune_pair_cache()
+        assert [path.exists() for path in paths] == [False, False, True]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,97 @@
+import itertools
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add parent directory to path so we can import from misc
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from misc import pareto
+from misc.battlefield import generate_negotiation_data
+from misc.pareto import (
+    attach_outcome_spaces,
+    compute_outcome_space,
+    deal_efficiency,
+    get_outcome_space,
+    pareto_frontier,
+)
+
+
+def brute_force_splits(counts, values_0, values_1):
+    """Every (value_0, value_1) of every split of the items."""
+    splits = set()
+    for taken in itertools.product(*(range(c + 1) for c in counts)):
+        value_0 = sum(t * v for t, v in zip(taken, values_0))
+        value_1 = sum((c - t) * v for c, t, v in zip(counts, taken, values_1))
+        splits.add((value_0, value_1))
+    return splits
+
+
+class TestOutcomeSpace:
+    """Tests for the per-scenario Pareto frontier and Nash point precomputation."""
+
+    @pytest.fixture
+    def scenarios(self, monkeypatch):
+        monkeypatch.setenv("MAX_SCENARIO_DATA", "30")
+        data, _ = generate_negotiation_data(2024)
+        # Keep the brute force small
+        return [s for s in data if len(s["counts"]) <= 5]
+
+    def test_matches_brute_force(self, scenarios):
+        assert scenarios
+        for scenario in scenarios:
+            splits = brute_force_splits(scenario["counts"], scenario["player_0"], scenario["player_1"])
+            space = compute_outcome_space(scenario["counts"], scenario["player_0"], scenario["player_1"])
+
+            frontier = {
+                (a, b)
+                for a, b in splits
+                if not any(x >= a and y >= b and (x, y) != (a, b) for x, y in splits)
+            }
+            assert set(pareto_frontier(space)) == frontier
+            assert space["max_joint_surplus"] == max(a + b for a, b in splits)
+            nash_0, nash_1 = space["nash_point"]
+            assert (nash_0, nash_1) in splits
+            assert nash_0 * nash_1 == max(a * b for a, b in splits)
+
+    def test_attached_to_scenarios(self, scenarios):
+        for scenario in scenarios:
+            assert scenario["outcome_space"] == compute_outcome_space(
+                scenario["counts"], scenario["player_0"], scenario["player_1"]
+            )
+
+    def test_cached_without_rounds(self):
+        scenario = {"counts": [1, 2], "player_0": [4, 2], "player_1": [2, 3], "rounds": 2}
+        space = get_outcome_space(scenario)
+
+        assert get_outcome_space(dict(scenario, rounds=5)) is space
+        assert pareto._cached_outcome_space.cache_info().maxsize == pareto._MAX_CACHED_OUTCOME_SPACES
+
+    def test_attached_without_caching(self):
+        pareto._cached_outcome_space.cache_clear()
+        data = [{"counts": [2, 1], "player_0": [1, 3], "player_1": [2, 1], "rounds": 2}]
+        attach_outcome_spaces(data)
+
+        assert get_outcome_space(data[0]) is data[0]["outcome_space"]
+        assert pareto._cached_outcome_space.cache_info().currsize == 0
+
+    def test_deal_efficiency(self):
+        space = compute_outcome_space([1, 2], [4, 2], [2, 3])
+        # Player 0 takes the first item, player 1 the two others: on the frontier
+        assert deal_efficiency(space, 4, 6) == {
+            "pareto_gap": 0,
+            "joint_efficiency": 1.0,
+            "nash_efficiency": 1.0,
+        }
+        # Player 0 takes one of the second item: both could have had more
+        efficiency = deal_efficiency(space, 2, 5)
+        assert efficiency["pareto_gap"] == 1
+        assert efficiency["joint_efficiency"] == pytest.approx(7 / 10)
+        assert efficiency["nash_efficiency"] == pytest.approx(10 / 24)
+        # Not a split of the items
+        assert deal_efficiency(space, 100, 0) is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,119 @@
+import contextlib
+import io
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Add parent directory to path so we can import from misc
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from misc import reference_agents
+from misc.batch_engine import load_batch_agent_class, run_batch_negotiations, scalar_batch_agent_class
+from misc.battlefield import _negotiate
+from misc.reference_agents import ExampleBatchAgent, RobertSpeedBatchAgent, get_reference_batch_agent
+from misc.scenario_generator import generate_seeded_scenario_arrays, scenario_arrays_to_dicts
+from misc.solution_cache import load_solution_class
+
+ROOT_DIR = Path(__file__).parent.parent
+EXAMPLE = ROOT_DIR / "solutions" / "example.py"
+HUMAN = ROOT_DIR / "solutions" / "Top_Human___Robert_Speed.py"
+OPPONENTS = [EXAMPLE, HUMAN, ROOT_DIR / "tests" / "solutions" / "example2.py", ROOT_DIR / "solutions" / "Kimi_K2_5.py"]
+
+
+class RecordingAgent:
+    """Records the offers an agent receives and its answers."""
+
+    def __init__(self, agent, moves):
+        self.agent = agent
+        self.moves = moves
+
+    def offer(self, o):
+        response = self.agent.offer(o)
+        self.moves.append((o, response))
+        return response
+
+
+def record_moves(AgentClass, me, OpponentClass, scenarios):
+    """The moves of AgentClass seated as me against OpponentClass, per scenario."""
+    games = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for s in scenarios:
+            moves = []
+            agent = RecordingAgent(AgentClass(me, s["counts"], s[f"player_{me}"], s["rounds"]), moves)
+            opponent = OpponentClass(1 - me, s["counts"], s[f"player_{1 - me}"], s["rounds"])
+            agents = (agent, opponent) if me == 0 else (opponent, agent)
+            _negotiate(*agents, s["counts"], s["rounds"])
+            games.append(moves)
+    return games
+
+
+class TestReferenceAgents:
+    """The NumPy ports must make the same moves as the solutions they port."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.arrays = generate_seeded_scenario_arrays(11, 0, 150)
+        self.scenarios = scenario_arrays_to_dicts(self.arrays)
+        self.counts = self.arrays["counts"].astype(np.int64)
+
+    @pytest.mark.parametrize("solution, BatchAgent", [(EXAMPLE, ExampleBatchAgent), (HUMAN, RobertSpeedBatchAgent)])
+    @pytest.mark.parametrize("opponent", OPPONENTS, ids=lambda path: path.stem)
+    @pytest.mark.parametrize("me", [0, 1])
+    def test_move_for_move(self, solution, BatchAgent, opponent, me):
+        games = record_moves(load_solution_class(solution), me, load_solution_class(opponent), self.scenarios)
+        agent = BatchAgent(
+            me,
+            self.counts.copy(),
+            self.arrays[f"player_{me}"].astype(np.int64),
+            self.arrays["rounds"].astype(np.int64),
+            self.arrays["lengths"].astype(np.int64),
+        )
+
+        for turn in range(max(map(len, games))):
+            active = np.array([len(moves) > turn for moves in games])
+            offers = None
+            if turn > 0 or me == 1:
+                offers = np.zeros_like(self.counts)
+                for lane, moves in enumerate(games):
+                    if active[lane]:
+                        offers[lane, : len(moves[turn][0])] = moves[turn][0]
+            accept, counter_offers, *_ = agent.offer(offers, active)
+
+            for lane in np.flatnonzero(active):
+                length = len(self.scenarios[lane]["counts"])
+                expected = games[lane][turn][1]
+                played = None if accept[lane] else counter_offers[lane, :length].tolist()
+                assert played == expected, f"scenario {lane}, turn {turn}"
+
+    def test_anchor_battle_matches_scalar_agents(self):
+        Example = load_solution_class(EXAMPLE)
+        Human = load_solution_class(HUMAN)
+        for (Port0, Port1), (Agent0, Agent1) in (
+            ((RobertSpeedBatchAgent, ExampleBatchAgent), (Human, Example)),
+            ((ExampleBatchAgent, RobertSpeedBatchAgent), (Example, Human)),
+            ((RobertSpeedBatchAgent, RobertSpeedBatchAgent), (Human, Human)),
+        ):
+            ported = run_batch_negotiations(Port0, Port1, self.arrays)
+            scalar = run_batch_negotiations(
+                scalar_batch_agent_class(Agent0), scalar_batch_agent_class(Agent1), self.arrays
+            )
+            for key in ported:
+                assert (ported[key] == scalar[key]).all(), key
+
+    def test_ports_are_used_for_unchanged_solutions(self, monkeypatch):
+        assert get_reference_batch_agent("example") is ExampleBatchAgent
+        assert load_batch_agent_class("Top Human - Robert Speed") is RobertSpeedBatchAgent
+
+        # A changed solution must be played as it is, not by a stale port
+        monkeypatch.setitem(
+            reference_agents.REFERENCE_BATCH_AGENTS, "example", ("0" * 64, ExampleBatchAgent)
+        )
+        assert get_reference_batch_agent("example") is None
+        assert load_batch_agent_class("example") is not ExampleBatchAgent
+        assert get_reference_batch_agent("Not A Model") is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
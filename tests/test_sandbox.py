@@ -0,0 +1,197 @@
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Add parent directory to path so we can import from misc
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from misc import battlefield
+from misc.battlefield import generate_negotiation_data, run_battles, run_negotiation
+from misc.sandbox import AgentCrashError, AgentTimeoutError, SandboxedAgentClass
+
+
+class EchoAgent:
+    def __init__(self, me, counts, values, max_rounds):
+        self.counts = counts
+
+    def offer(self, o):
+        return self.counts.copy()
+
+
+class PidAgent:
+    def __init__(self, me, counts, values, max_rounds):
+        self.pid = os.getpid()
+
+    def offer(self, o):
+        return self.pid
+
+
+class SlowAgent:
+    def __init__(self, me, counts, values, max_rounds):
+        self.calls = 0
+
+    def offer(self, o):
+        self.calls += 1
+        if self.calls > 1:
+            time.sleep(10)
+        return [0, 0]
+
+
+class BusyAgent:
+    def __init__(self, me, counts, values, max_rounds):
+        pass
+
+    def offer(self, o):
+        start = time.process_time()
+        while time.process_time() - start < 0.05:
+            pass
+        return [0]
+
+
+class FailingAgent:
+    def __init__(self, me, counts, values, max_rounds):
+        pass
+
+    def offer(self, o):
+        raise ValueError("boom")
+
+
+class RandomAgent:
+    """Asks for a random share of the items and settles for a random number of them."""
+
+    def __init__(self, me, counts, values, max_rounds):
+        self.request = [random.randint(0, count) for count in counts]
+        self.enough = random.randint(0, sum(counts))
+
+    def offer(self, o):
+        if o is not None and sum(o) >= self.enough:
+            return None
+        return list(self.request)
+
+
+class RandomOfferAgent:
+    """Asks for a random share of the items at every turn, accepts a random half of the offers."""
+
+    def __init__(self, me, counts, values, max_rounds):
+        self.counts = counts
+
+    def offer(self, o):
+        if o is not None and random.random() < 0.5:
+            return None
+        return [random.randint(0, count) for count in self.counts]
+
+
+class TestSandbox:
+    """Tests for agents running in a persistent child process."""
+
+    def test_offer_is_forwarded(self):
+        with SandboxedAgentClass(EchoAgent, "echo", timeout=5) as Sandboxed:
+            agent = Sandboxed(0, [1, 2], [3, 4], 8)
+            assert agent.offer(None) == [1, 2]
+
+    def test_process_is_reused_across_negotiations(self):
+        with SandboxedAgentClass(PidAgent, "pid", timeout=5) as Sandboxed:
+            pids = {Sandboxed(0, [1], [1], 8).offer(None) for _ in range(5)}
+        assert len(pids) == 1
+        assert os.getpid() not in pids
+
+    def test_cpu_time_is_measured_in_the_worker(self):
+        with SandboxedAgentClass(BusyAgent, "busy", timeout=5) as Sandboxed:
+            agent = Sandboxed(0, [1], [1], 8)
+            parent_start = time.process_time()
+            agent.offer(None)
+            agent.offer(None)
+            parent_cpu_time = time.process_time() - parent_start
+            assert Sandboxed.usage.cpu_time >= 0.1
+        # The parent only waited
+        assert parent_cpu_time < 0.1
+
+    def test_timeout_kills_worker_and_restarts(self):
+        with SandboxedAgentClass(SlowAgent, "slow", timeout=0.2) as Sandboxed:
+            agent = Sandboxed(0, [1, 1], [1, 1], 8)
+            assert agent.offer(None) == [0, 0]
+
+            start = time.monotonic()
+            with pytest.raises(AgentTimeoutError):
+                agent.offer([1, 1])
+            assert time.monotonic() - start < 5
+
+            with pytest.raises(AgentCrashError):
+                agent.offer([1, 1])
+
+            new_agent = Sandboxed(0, [1, 1], [1, 1], 8)
+            assert new_agent.offer(None) == [0, 0]
+
+    def test_exception_is_raised_in_parent(self):
+        with SandboxedAgentClass(FailingAgent, "failing", timeout=5) as Sandboxed:
+            agent = Sandboxed(0, [1], [1], 8)
+            with pytest.raises(AgentCrashError, match="boom"):
+                agent.offer(None)
+
+    def test_timeout_is_a_walk_away(self):
+        with SandboxedAgentClass(EchoAgent, "echo", timeout=5) as Sandboxed0, SandboxedAgentClass(
+            SlowAgent, "slow", timeout=0.2
+        ) as Sandboxed1:
+            agent_0 = Sandboxed0(0, [1, 1], [1, 1], 8)
+            agent_1 = Sandboxed1(1, [1, 1], [1, 1], 8)
+
+            items_0, items_1, outcome, _ = run_negotiation(
+                agent_0, agent_1, [1, 1], 8, "echo", "slow"
+            )
+
+        assert items_0 is None
+        assert items_1 is None
+        assert outcome == "error_agent_1"
+
+    def test_sandboxed_battles_match_in_process(self, monkeypatch):
+        def patched_load_agent(display_name: str):
+            namespace = {}
+            code = (Path(__file__).parent / "solutions" / f"{display_name}.py").read_text()
+            exec(code, namespace)
+            return namespace["Agent"]
+
+        monkeypatch.setattr(battlefield, "load_agent_class", patched_load_agent)
+        monkeypatch.setenv("MAX_SCENARIO_DATA", "6")
+        monkeypatch.setenv("NUM_PROCESSES", "2")
+        models = [{"display_name": "example"}, {"display_name": "example2"}]
+        data, _ = generate_negotiation_data()
+
+        expected = run_battles(models, data)
+        monkeypatch.setenv("SANDBOX_AGENTS", "true")
+        assert run_battles(models, data) == expected
+
+    def test_random_agents_replay_the_same_sandboxed(self, monkeypatch):
+        monkeypatch.setattr(battlefield, "load_agent_class", lambda display_name: RandomAgent)
+        monkeypatch.setenv("MAX_SCENARIO_DATA", "6")
+        monkeypatch.setenv("NUM_PROCESSES", "1")
+        models = [{"display_name": "random_0"}, {"display_name": "random_1"}]
+        data, _ = generate_negotiation_data()
+
+        random.seed(1)
+        state = random.getstate()
+        expected = run_battles(models, data)
+        # In process battles leave the caller's random state alone
+        assert random.getstate() == state
+        monkeypatch.setenv("SANDBOX_AGENTS", "true")
+        assert run_battles(models, data) == expected
+
+    @pytest.mark.parametrize("sandboxed", ["false", "true"])
+    def test_random_offers_replay_the_same_within_an_engine_config(self, monkeypatch, sandboxed):
+        monkeypatch.setattr(battlefield, "load_agent_class", lambda display_name: RandomOfferAgent)
+        monkeypatch.setenv("MAX_SCENARIO_DATA", "6")
+        monkeypatch.setenv("NUM_PROCESSES", "1")
+        monkeypatch.setenv("SANDBOX_AGENTS", sandboxed)
+        models = [{"display_name": "random_0"}, {"display_name": "random_1"}]
+        data, _ = generate_negotiation_data()
+
+        expected = run_battles(models, data)
+        random.seed(2)
+        assert run_battles(models, data) == expected
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,71 @@
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pytest
+
+# Add parent directory to path so we can import from misc
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from misc import scenario_table
+from misc.battlefield import generate_negotiation_data
+from misc.scenario_table import ScenarioTable, attach_scenario_table
+
+
+def read_scenarios(args):
+    name, start, stop = args
+    return attach_scenario_table(name).scenarios(start, stop)
+
+
+class TestScenarioTable:
+    """Tests for the shared-memory scenario table."""
+
+    @pytest.fixture
+    def table(self, monkeypatch):
+        monkeypatch.setenv("MAX_SCENARIO_DATA", "25")
+        self.data, _ = generate_negotiation_data()
+        table = ScenarioTable.create(self.data)
+        yield table
+        table.close()
+        table.unlink()
+
+    def test_round_trip(self, table):
+        assert len(table) == len(self.data)
+        assert table.scenarios() == self.data
+
+    def test_slices(self, table):
+        assert table.scenarios(3, 7) == self.data[3:7]
+        assert table.scenarios(20, 100) == self.data[20:]
+        assert table.scenario(0) == self.data[0]
+
+    def test_ragged_offsets(self, table):
+        lengths = [
+            table.offsets[i + 1] - table.offsets[i] for i in range(len(self.data))
+        ]
+        assert lengths == [len(s["counts"]) for s in self.data]
+
+    def test_attach_is_cached_per_process(self, table):
+        assert attach_scenario_table(table.name) is table
+
+    def test_spawned_workers_attach_by_name(self, table):
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=2, mp_context=context) as executor:
+            chunks = list(
+                executor.map(read_scenarios, [(table.name, i, i + 5) for i in range(0, 25, 5)])
+            )
+
+        assert [s for chunk in chunks for s in chunk] == self.data
+
+    def test_close_detaches(self, monkeypatch):
+        table = ScenarioTable.create([])
+        name = table.name
+
+        assert len(table) == 0
+        table.close()
+        table.unlink()
+        assert name not in scenario_table._attached_tables
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
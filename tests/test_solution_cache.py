@@ -0,0 +1,127 @@
+import builtins
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Add parent directory to path so we can import from misc
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from misc import solution_cache
+from misc.battlefield import load_agent_class
+from misc.solution_cache import (
+    compile_solution,
+    get_code_hash,
+    load_solution_class,
+    prune_solution_cache,
+)
+
+AGENT_CODE = """
+class Agent:
+    version = {version}
+
+    def __init__(self, me, counts, values, max_rounds):
+        pass
+
+    def offer(self, o):
+        return None
+"""
+
+
+class TestSolutionCache:
+    """Tests for the compiled-solution cache."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch, tmp_path):
+        self.cache_dir = tmp_path / "cache"
+        monkeypatch.setenv("SOLUTION_CACHE_DIR", str(self.cache_dir))
+        monkeypatch.setattr(solution_cache, "_code_objects", {})
+        monkeypatch.setattr(solution_cache, "_solution_namespaces", {})
+        monkeypatch.setattr(solution_cache, "_file_hashes", {})
+        self.solution_path = tmp_path / "solution.py"
+        self.solution_path.write_text(AGENT_CODE.format(version=1))
+
+    def test_class_loaded_once_per_process(self):
+        first = load_solution_class(self.solution_path)
+        second = load_solution_class(self.solution_path)
+
+        assert first is not None
+        assert first is second
+        assert first.version == 1
+
+    def test_compiled_code_stored_as_marshal_blob(self):
+        load_solution_class(self.solution_path)
+
+        code_hash = get_code_hash(self.solution_path.read_text())
+        blobs = list(self.cache_dir.glob(f"{code_hash}.*.marshal"))
+        assert len(blobs) == 1
+
+    def test_blob_reused_without_compiling(self, monkeypatch):
+        code = self.solution_path.read_text()
+        compile_solution(code)
+        solution_cache._code_objects.clear()
+
+        def fail_compile(*args, **kwargs):
+            raise AssertionError("compile should not be called")
+
+        monkeypatch.setattr(builtins, "compile", fail_compile)
+        namespace = {}
+        exec(compile_solution(code), namespace)
+        assert namespace["Agent"].version == 1
+
+    def test_changed_file_is_reloaded(self):
+        first = load_solution_class(self.solution_path)
+        self.solution_path.write_text(AGENT_CODE.format(version=22))
+        second = load_solution_class(self.solution_path)
+
+        assert first.version == 1
+        assert second.version == 22
+
+    def test_missing_file_returns_none(self, tmp_path):
+        assert load_solution_class(tmp_path / "missing.py") is None
+
+    def test_least_recently_used_solutions_are_evicted(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(solution_cache, "_MAX_SOLUTIONS", 2)
+        paths = []
+        for version in range(3):
+            path = tmp_path / f"solution_{version}.py"
+            path.write_text(AGENT_CODE.format(version=version))
+            paths.append(path)
+
+        first = load_solution_class(paths[0])
+        load_solution_class(paths[1])
+        # Using the first solution again makes the second one the least recently used
+        assert load_solution_class(paths[0]) is first
+        load_solution_class(paths[2])
+
+        hashes = [get_code_hash(path.read_text()) for path in paths]
+        assert list(solution_cache._solution_namespaces) == [hashes[0], hashes[2]]
+        assert len(solution_cache._code_objects) == 2
+
+    def test_stale_and_extra_blobs_are_pruned(self, monkeypatch):
+        monkeypatch.setenv("SOLUTION_CACHE_MAX_AGE_DAYS", "1")
+        monkeypatch.setenv("SOLUTION_CACHE_MAX_ENTRIES", "2")
+        self.cache_dir.mkdir()
+        now = time.time()
+        ages = {"fresh": 0, "recent": 3600, "old": 7200, "stale": 2 * 86400}
+        for name, age in ages.items():
+            blob = self.cache_dir / f"{name}.marshal"
+            blob.write_bytes(b"")
+            os.utime(blob, (now - age, now - age))
+
+        prune_solution_cache()
+
+        assert sorted(path.stem for path in self.cache_dir.glob("*.marshal")) == ["fresh", "recent"]
+
+    def test_load_agent_class_from_solutions(self):
+        Agent = load_agent_class("example")
+
+        assert Agent is not None
+        assert load_agent_class("example") is Agent
+        assert load_agent_class("Not A Model") is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+from starlette.testclient import TestClient
+
+# Add parent directory to path so we can import website
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+
+@pytest.fixture(scope="module")
+def website():
+    # website.py reads README.md relative to the working directory
+    cwd = os.getcwd()
+    os.chdir(ROOT_DIR)
+    try:
+        import website
+    finally:
+        os.chdir(cwd)
+    return website
+
+
+class TestLeaderboardRoute:
+    """Tests for the cached leaderboard fragment."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, website, monkeypatch):
+        self.session_id = 1
+        self.loads = 0
+
+        def latest(session_id):
+            self.loads += 1
+            return {
+                "rows": [
+                    {
+                        "rank": 1,
+                        "model_name": f"model-{session_id}",
+                        "profit_percentage": 50.0,
+                        "max_possible_profit": 100.0,
+                        "total_profit": 50.0,
+                        "code_link": "https://example.com",
+                    }
+                ],
+                "latest_timestamp": datetime(2025, 1, 1, tzinfo=timezone.utc),
+            }
+
+        monkeypatch.setattr(website, "get_latest_session_id", lambda: self.session_id)
+        monkeypatch.setattr(website, "get_negotiations_leaderboard_latest", latest)
+        monkeypatch.setattr(website, "get_negotiations_leaderboard_all", lambda session_id: [])
+        monkeypatch.setattr(website, "_leaderboard_fragment", None)
+        monkeypatch.setattr(website, "_refresh_task", None)
+        monkeypatch.setattr(website, "_session_check", None)
+        monkeypatch.setenv("SESSION_CHECK_SECONDS", "0")
+        # A single event loop for all the requests, as in the server
+        with TestClient(website.app) as client:
+            self.client = client
+            yield
+
+    def wait_for_refresh(self, website):
+        for _ in range(100):
+            if website._refresh_task.done():
+                return
+            time.sleep(0.01)
+
+    def test_fragment_is_rendered_once_per_session(self):
+        first = self.client.get("/leaderboard")
+        second = self.client.get("/leaderboard")
+
+        assert first.status_code == second.status_code == 200
+        assert "model-1" in first.text
+        assert first.text == second.text
+        assert self.loads == 1
+        assert first.headers["cache-control"] == "public, no-cache"
+
+    def test_not_modified_until_a_new_session(self, website):
+        etag = self.client.get("/leaderboard").headers["etag"]
+        assert etag.startswith('"') and etag.endswith('"')
+
+        cached = self.client.get("/leaderboard", headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.headers["etag"] == etag
+
+        self.session_id = 2
+        # Served stale while the new session is rendered in the background
+        stale = self.client.get("/leaderboard", headers={"If-None-Match": etag})
+        assert stale.status_code == 304
+        self.wait_for_refresh(website)
+
+        fresh = self.client.get("/leaderboard", headers={"If-None-Match": etag})
+        assert fresh.status_code == 200
+        assert "model-2" in fresh.text
+        assert fresh.headers["etag"] != etag
+        assert self.loads == 2
+
+    def test_concurrent_requests_share_one_refresh(self, website, monkeypatch):
+        lookups = []
+
+        def slow_session_id():
+            lookups.append(1)
+            time.sleep(0.1)
+            return self.session_id
+
+        monkeypatch.setattr(website, "get_latest_session_id", slow_session_id)
+
+        async def burst():
+            return await asyncio.gather(*(website.get_leaderboard_fragment() for _ in range(20)))
+
+        fragments = asyncio.run(burst())
+        assert len({fragment[2] for fragment in fragments}) == 1
+        assert len(lookups) == 1
+        assert self.loads == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
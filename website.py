@@ -1,6 +1,11 @@
 from fasthtml.common import *
+import asyncio
+import hashlib
+import os
+import time
 import markdown
 from db.service import (
+    get_latest_session_id,
     get_negotiations_leaderboard_all,
     get_negotiations_leaderboard_latest,
 )
@@ -131,10 +136,101 @@ def get():
     return Div(NotStr(parsed_md), cls="mt-4")
 
 
+# Rendered leaderboard fragment of the latest session: (session_id, html, etag).
+# Only rebuilt when a new session is saved.
+_leaderboard_fragment = None
+# In-flight rebuild of the fragment, shared by the requests that need it
+_refresh_task = None
+# (checked_at, task) of the latest session id lookup, shared the same way
+_session_check = None
+
+
+def get_session_check_seconds() -> float:
+    """
+    How long a latest session id lookup is reused before asking the database again,
+    can be set via SESSION_CHECK_SECONDS env var (default 5).
+    """
+    try:
+        return float(os.getenv("SESSION_CHECK_SECONDS", "5"))
+    except ValueError:
+        return 5.0
+
+
+def render_leaderboard_fragment(session_id) -> tuple:
+    """Render the leaderboard of a session with its strong ETag (blocking, run in a thread)."""
+    global _leaderboard_fragment
+    html = to_xml(build_leaderboard(session_id))
+    etag = '"' + hashlib.sha256(html.encode("utf-8")).hexdigest()[:32] + '"'
+    _leaderboard_fragment = (session_id, html, etag)
+    return _leaderboard_fragment
+
+
+def _log_refresh_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Failed to refresh the leaderboard: {task.exception()}")
+
+
+async def get_latest_session_id_async():
+    """
+    The latest session id, looked up in a thread so the event loop never blocks on
+    the database. Concurrent requests share one lookup, reused for a few seconds.
+    """
+    global _session_check
+    now = time.monotonic()
+    if _session_check is None or (
+        _session_check[1].done() and now - _session_check[0] >= get_session_check_seconds()
+    ):
+        _session_check = (now, asyncio.ensure_future(asyncio.to_thread(get_latest_session_id)))
+    # Shielded: a client going away must not cancel the lookup of the others
+    return await asyncio.shield(_session_check[1])
+
+
+async def get_leaderboard_fragment() -> tuple:
+    """
+    The (session_id, html, etag) leaderboard fragment of the latest session.
+
+    A single rebuild runs at a time, in a thread. While it runs the previous
+    fragment is served (stale-while-revalidate), so a new session never makes a
+    burst of requests wait on the database; only the very first one has to.
+    """
+    global _refresh_task
+    session_id = await get_latest_session_id_async()
+    fragment = _leaderboard_fragment
+    if fragment is not None and fragment[0] == session_id:
+        return fragment
+
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.ensure_future(
+            asyncio.to_thread(render_leaderboard_fragment, session_id)
+        )
+        _refresh_task.add_done_callback(_log_refresh_error)
+    if fragment is not None:
+        return fragment
+    return await asyncio.shield(_refresh_task)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an If-None-Match header matches etag."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
 @rt("/leaderboard")
-def get():
-    latest = get_negotiations_leaderboard_latest()
-    overall = get_negotiations_leaderboard_all()
+async def get(request: Request):
+    _, html, etag = await get_leaderboard_fragment()
+    # Cached by browsers and proxies, but always revalidated: the ETag changes with
+    # every new session, until then they get a 304
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(html, headers=headers)
+
+
+def build_leaderboard(session_id):
+    latest = get_negotiations_leaderboard_latest(session_id)
+    overall = get_negotiations_leaderboard_all(session_id)
 
     def build_table(title, rows, subtitle=None):
         subtitle_el = Small(f" ({subtitle})", cls="text-muted") if subtitle else ""